@@ -8,6 +8,14 @@ class ContentConfig(AppConfig):
     name = 'contentcuration'
 
     def ready(self):
+        # Register lookups that can use the pg_trgm indexes on text columns
+        from django.db.models import CharField
+        from django.db.models import TextField
+
+        from contentcuration.db.models.lookups import ILike
+
+        CharField.register_lookup(ILike)
+        TextField.register_lookup(ILike)
         # see note in the celery_signals.py file for why we import here.
         import contentcuration.utils.celery_signals
         if settings.AWS_AUTO_CREATE_BUCKET:
@@ -33,3 +33,15 @@ class ArrayRemove(Func):
     """
     function = "ARRAY_REMOVE"
     arity = 2
+
+
+class ArrayAppend(Func):
+    """
+    Appends an element value to the end of an array
+
+    Example:
+        ArrayAppend(Array(1, 2), 3)
+        => Array[1, 2, 3]
+    """
+    function = "ARRAY_APPEND"
+    arity = 2
@@ -0,0 +1,19 @@
+from django.db.models.lookups import IContains
+
+
+class ILike(IContains):
+    """
+    Case-insensitive containment, as with icontains, but compared with ILIKE rather
+    than UPPER(...) LIKE UPPER(...), so that pg_trgm indexes on the column can be used
+
+    Example:
+        .filter(author__ilike="jane")
+        => WHERE author ILIKE '%jane%'
+    """
+    lookup_name = "ilike"
+
+    def as_sql(self, compiler, connection):
+        lhs_sql, params = self.process_lhs(compiler, connection)
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        params.extend(rhs_params)
+        return "{} ILIKE {}".format(lhs_sql, rhs_sql), params
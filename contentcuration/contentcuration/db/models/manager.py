@@ -1,26 +1,52 @@
 import contextlib
 import logging as logger
+import random
 import time
 import uuid
+from collections import defaultdict
+from collections import OrderedDict
 
+from django.conf import settings
+from django.db import connection
 from django.db import transaction
+from django.db.models import Case
+from django.db.models import F
+from django.db.models import IntegerField
 from django.db.models import Manager
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import OuterRef
 from django.db.models import Q
+from django.db.models import Subquery
+from django.db.models import Sum
+from django.db.models import Value
+from django.db.models import When
 from django.db.utils import OperationalError
+from django.utils import timezone
+from django_bulk_update.helper import bulk_update
 from django_cte import CTEQuerySet
 from le_utils.constants import content_kinds
+from le_utils.constants import roles
+from mptt.exceptions import InvalidMove
 from mptt.managers import TreeManager
 from mptt.signals import node_moved
 
 from contentcuration.db.models.query import CustomTreeQuerySet
+from contentcuration.utils.cache import bump_channel_generations
+from contentcuration.utils.cache import bump_tree_revisions
+from contentcuration.utils.metrics import COPY_BATCH_SIZE
+from contentcuration.utils.metrics import COPY_ROWS_PER_SECOND
+from contentcuration.utils.metrics import MPTT_LOCK_DEADLOCK_RETRIES
+from contentcuration.utils.metrics import MPTT_LOCK_HOLD_SECONDS
+from contentcuration.utils.metrics import MPTT_LOCK_WAIT_SECONDS
 from contentcuration.utils.tasks import increment_progress
 from contentcuration.utils.tasks import set_total
 
 
 logging = logger.getLogger(__name__)
 
-# A default batch size of lft/rght values to process
-# at once for copy operations
+# The batch size of lft/rght values to process at once
+# for copy operations, before any copy rate has been measured
 # Local testing has so far indicated that a batch size of 100
 # gives much better overall copy performance than smaller batch sizes
 # but does not hold locks on the affected MPTT tree for too long (~0.03s)
@@ -30,9 +56,69 @@ logging = logger.getLogger(__name__)
 # in contentcuration/contentcuration/tests/test_contentnodes.py
 # for more details.
 # The exact optimum batch size is probably highly dependent on tree
-# topology also, so these rudimentary tests are likely insufficient
+# topology also, so these rudimentary tests are likely insufficient,
+# hence the batch size is adapted during copies, see CopyBatchSizer
 BATCH_SIZE = 100
 
+# The backends that lock_mptt can use to serialize mptt operations on a tree,
+# selected by settings.MPTT_LOCK_BACKEND.
+# Row locks take a SELECT ... FOR UPDATE lock on every node in the tree.
+ROW_LOCK_BACKEND = "rows"
+# Advisory locks take a single transaction level advisory lock for the tree_id.
+ADVISORY_LOCK_BACKEND = "advisory"
+
+# An arbitrary key used alongside the tree_id for advisory locks,
+# so that they cannot clash with any other uses of advisory locks
+ADVISORY_LOCK_NAMESPACE = 6722
+
+# Limits for adaptive batch sizes
+MIN_BATCH_SIZE = 10
+MAX_BATCH_SIZE = 10000
+
+# The ContentNode attributes that are copied when a node is copied
+# and also when a copy is synced with its source
+SOURCE_ATTRIBUTES = (
+    "content_id",
+    "kind_id",
+    "title",
+    "description",
+    "language_id",
+    "license_id",
+    "license_description",
+    "thumbnail_encoding",
+    "extra_fields",
+    "copyright_holder",
+    "author",
+    "provider",
+    "role_visibility",
+)
+
+# Generates a new random id in the hex format of our UUIDFields. random() and clock_timestamp()
+# are evaluated for every row, and only need built in functions, unlike gen_random_uuid
+# from the pgcrypto extension, which needs a superuser to install. random() is not a
+# cryptographically secure generator, so these ids are unique but may be guessable, and must
+# only be used where uuid4 is used for uniqueness, never where an id has to be kept secret.
+RANDOM_UUID_SQL = "md5(random()::text || clock_timestamp()::text)"
+
+# The denormalized descendant counts stored on ContentNodeAggregate
+AGGREGATE_FIELDS = (
+    "resource_count",
+    "coach_count",
+    "error_count",
+    "updated_count",
+    "new_count",
+)
+
+# The ContentNode fields that determine how a node contributes
+# to the descendant counts of its ancestors
+AGGREGATE_SOURCE_FIELDS = (
+    "kind_id",
+    "role_visibility",
+    "complete",
+    "changed",
+    "published",
+)
+
 
 class CustomManager(Manager.from_queryset(CTEQuerySet)):
     """
@@ -46,6 +132,123 @@ def log_lock_time_spent(timespent):
     logging.debug("Spent {} seconds inside an mptt lock".format(timespent))
 
 
+def log_lock(lock):
+    """
+    Records the wait and hold times for a released lock as metrics, along
+    with a structured log entry so that they can be traced to specific trees.
+    """
+    MPTT_LOCK_WAIT_SECONDS.labels(lock.operation).observe(lock.wait_time)
+    MPTT_LOCK_HOLD_SECONDS.labels(lock.operation).observe(lock.hold_time)
+    logging.debug(
+        "Waited {} seconds for and held an mptt lock for {} seconds".format(
+            lock.wait_time, lock.hold_time
+        ),
+        extra={
+            "tree_ids": lock.tree_ids,
+            "operation": lock.operation,
+            "wait_time": lock.wait_time,
+            "hold_time": lock.hold_time,
+            "deadlock_retries": lock.deadlock_retries,
+        },
+    )
+
+
+class MPTTLock(object):
+    """
+    A lock on some ContentNode trees for an mptt operation. Once the lock has
+    been released, wait_time is the seconds spent acquiring it, and hold_time
+    the seconds spent inside it after it was acquired.
+    """
+
+    def __init__(self, tree_ids, operation=None):
+        self.tree_ids = tree_ids
+        self.operation = operation or "other"
+        self.deadlock_retries = 0
+        self.wait_time = None
+        self.hold_time = None
+
+    @property
+    def time_spent(self):
+        if self.wait_time is None or self.hold_time is None:
+            return None
+        return self.wait_time + self.hold_time
+
+
+class CopyBatchSizer(object):
+    """
+    Chooses the size of the subtrees that are copied while holding a lock on the
+    target tree, as the difference between the lft and rght of their roots.
+    Unless a fixed batch size is given, this is adapted to the rate at which nodes
+    have been copied so far, to hold the lock for around settings.COPY_TARGET_LOCK_TIME.
+    """
+
+    # Weight given to the latest measured copy rate
+    smoothing = 0.5
+
+    def __init__(self, batch_size=None, target_lock_time=None):
+        self.adaptive = batch_size is None
+        self.batch_size = batch_size or BATCH_SIZE
+        self.target_lock_time = target_lock_time or settings.COPY_TARGET_LOCK_TIME
+        self.rows_per_second = None
+
+    def record(self, rows, lock_time):
+        if not rows or not lock_time:
+            return
+        rows_per_second = rows / float(lock_time)
+        COPY_ROWS_PER_SECOND.observe(rows_per_second)
+        if self.rows_per_second is None:
+            self.rows_per_second = rows_per_second
+        else:
+            self.rows_per_second += self.smoothing * (
+                rows_per_second - self.rows_per_second
+            )
+        if self.adaptive:
+            # Each node takes up two lft/rght values
+            batch_size = int(2 * self.rows_per_second * self.target_lock_time)
+            self.batch_size = max(MIN_BATCH_SIZE, min(MAX_BATCH_SIZE, batch_size))
+        COPY_BATCH_SIZE.observe(self.batch_size)
+
+
+def node_aggregate_contribution(values):
+    """
+    Returns the amount that a single node adds to each of the
+    descendant counts of all of its ancestors, given a mapping
+    of the node's AGGREGATE_SOURCE_FIELDS to their values.
+    """
+    is_resource = values["kind_id"] != content_kinds.TOPIC
+    changed = bool(values["changed"])
+    published = bool(values["published"])
+    return {
+        "resource_count": int(is_resource),
+        "coach_count": int(is_resource and values["role_visibility"] == roles.COACH),
+        "error_count": int(values["complete"] is False),
+        "updated_count": int(is_resource and changed and published),
+        "new_count": int(is_resource and changed and not published),
+    }
+
+
+def sum_aggregates(*aggregates):
+    return {
+        field: sum(aggregate[field] for aggregate in aggregates)
+        for field in AGGREGATE_FIELDS
+    }
+
+
+def negate_aggregates(aggregates):
+    return {field: -aggregates[field] for field in AGGREGATE_FIELDS}
+
+
+def aggregate_delta(old_values, new_values):
+    """
+    Returns the change to the descendant counts of a node's ancestors
+    when the node's AGGREGATE_SOURCE_FIELDS change from old_values to new_values.
+    """
+    return sum_aggregates(
+        node_aggregate_contribution(new_values),
+        negate_aggregates(node_aggregate_contribution(old_values)),
+    )
+
+
 def execute_queryset_without_results(queryset):
     query = queryset.query
     compiler = query.get_compiler(queryset.db)
@@ -80,30 +283,66 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
         new_id = MPTTTreeIDManager.objects.create().id
         return new_id
 
-    @contextlib.contextmanager
-    def _attempt_lock(self, tree_ids, values):
-        """
-        Internal method to allow the lock_mptt method to do retries in case of deadlocks
-        """
-        start = time.time()
-        with transaction.atomic():
-            # Issue a separate lock on each tree_id
-            # in a predictable order.
-            # This will mean that every process acquires locks in the same order
-            # and should help to minimize deadlocks
-            for tree_id in tree_ids:
+    def _acquire_lock(self, lock, values):
+        # Issue a separate lock on each tree_id
+        # in a predictable order.
+        # This will mean that every process acquires locks in the same order
+        # and should help to minimize deadlocks
+        if settings.MPTT_LOCK_BACKEND == ADVISORY_LOCK_BACKEND:
+            with connection.cursor() as cursor:
+                for tree_id in lock.tree_ids:
+                    cursor.execute(
+                        "SELECT pg_advisory_xact_lock(%s, %s)",
+                        (ADVISORY_LOCK_NAMESPACE, tree_id),
+                    )
+        else:
+            for tree_id in lock.tree_ids:
                 execute_queryset_without_results(
                     self.select_for_update()
                     .order_by()
                     .filter(tree_id=tree_id)
                     .values(*values)
                 )
-            yield
-            log_lock_time_spent(time.time() - start)
+
+    def _acquire_lock_with_retries(self, lock, values):
+        """
+        Acquires the lock, retrying with jittered exponential backoff if there is
+        a deadlock, up to settings.MPTT_LOCK_DEADLOCK_RETRIES times.
+        Each attempt is made inside a savepoint, so that a failed attempt releases
+        any locks it acquired before the next attempt.
+        """
+        while True:
+            try:
+                with transaction.atomic():
+                    self._acquire_lock(lock, values)
+                return
+            except OperationalError as e:
+                if (
+                    "deadlock detected" not in e.args[0]
+                    or lock.deadlock_retries >= settings.MPTT_LOCK_DEADLOCK_RETRIES
+                ):
+                    raise
+                delay = random.uniform(
+                    0, settings.MPTT_LOCK_RETRY_DELAY * 2 ** lock.deadlock_retries
+                )
+                lock.deadlock_retries += 1
+                MPTT_LOCK_DEADLOCK_RETRIES.labels(lock.operation).inc()
+                logging.warning(
+                    "Deadlock detected while trying to lock ContentNode trees for mptt operations, "
+                    "retrying in {} seconds".format(delay),
+                    extra={"tree_ids": lock.tree_ids, "operation": lock.operation},
+                )
+                time.sleep(delay)
 
     @contextlib.contextmanager
-    def lock_mptt(self, *tree_ids):
+    def lock_mptt(self, *tree_ids, operation=None):
+        """
+        Locks the trees with the tree_ids given for mptt operations until the end of the transaction.
+        :param operation: The kind of operation the lock is for, such as move, copy, save or delete,
+            used to label the lock metrics.
+        """
         tree_ids = sorted((t for t in set(tree_ids) if t is not None))
+        lock = MPTTLock(tree_ids, operation)
         # If this is not inside the context of a delay context manager
         # or updates are not disabled set a lock on the tree_ids.
         if (
@@ -121,26 +360,89 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
                 mptt_opts.level_attr,
                 mptt_opts.parent_attr,
             )
-            try:
-                with self._attempt_lock(tree_ids, values):
-                    yield
-            except OperationalError as e:
-                if "deadlock detected" in e.args[0]:
-                    logging.error(
-                        "Deadlock detected while trying to lock ContentNode trees for mptt operations, retrying"
-                    )
-                    with self._attempt_lock(tree_ids, values):
-                        yield
-                else:
-                    raise
+            start = time.time()
+            with transaction.atomic():
+                self._acquire_lock_with_retries(lock, values)
+                acquired = time.time()
+                lock.wait_time = acquired - start
+                yield lock
+                lock.hold_time = time.time() - acquired
+                log_lock_time_spent(lock.time_spent)
+                log_lock(lock)
         else:
             # Otherwise just let it carry on!
-            yield
+            yield lock
+        # Anything cached from the trees may have been changed while they were locked
+        self._record_tree_changes(tree_ids)
+
+    def _record_tree_changes(self, tree_ids):
+        from contentcuration.models import ChannelTree
+        from contentcuration.models import TreeResourceSizeChange
+
+        if tree_ids:
+            bump_tree_revisions(*tree_ids)
+            bump_channel_generations(
+                *ChannelTree.objects.filter(tree_id__in=tree_ids).values_list("channel_id", flat=True)
+            )
+            TreeResourceSizeChange.record(tree_ids)
 
     def partial_rebuild(self, tree_id):
-        with self.lock_mptt(tree_id):
+        with self.lock_mptt(tree_id, operation="rebuild"):
             return super(CustomContentNodeTreeManager, self).partial_rebuild(tree_id)
 
+    def insert_node(
+        self,
+        node,
+        target,
+        position="last-child",
+        save=False,
+        allow_existing_pk=False,
+        refresh_target=True,
+    ):
+        """
+        When settings.MPTT_SPARSE_GAP is set, new nodes are placed in the free space
+        between their siblings where there is room, see _make_sparse_space,
+        otherwise this defers to mptt, which shifts the rest of the tree to make space.
+        """
+        if (
+            not settings.MPTT_SPARSE_GAP
+            or target is None
+            or self.model._mptt_is_tracking
+            or (target.is_root_node() and position in ("left", "right"))
+        ):
+            return super(CustomContentNodeTreeManager, self).insert_node(
+                node,
+                target,
+                position=position,
+                save=save,
+                allow_existing_pk=allow_existing_pk,
+                refresh_target=refresh_target,
+            )
+
+        if node.pk and not allow_existing_pk and self.filter(pk=node.pk).exists():
+            raise ValueError("Cannot insert a node which has already been saved.")
+
+        if refresh_target:
+            self._mptt_refresh(target)
+
+        opts = self.model._mptt_meta
+        tree_id, left, level = self._make_space(target, position, 2)
+        if position in ("first-child", "last-child"):
+            parent = target
+        else:
+            parent = target.parent
+        # Making space may have moved the target and its parent
+        self._mptt_refresh(target, parent)
+        setattr(node, opts.tree_id_attr, tree_id)
+        setattr(node, opts.left_attr, left)
+        setattr(node, opts.right_attr, left + 1)
+        setattr(node, opts.level_attr, level)
+        setattr(node, opts.parent_attr, parent)
+
+        if save:
+            node.save()
+        return node
+
     def _move_child_to_new_tree(self, node, target, position):
         from contentcuration.models import PrerequisiteContentRelationship
 
@@ -185,6 +487,243 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
                 for k, v in values.items():
                     setattr(node, k, v)
 
+    def _ancestors_of(self, node_id):
+        """
+        Returns a queryset of the ancestors of a node, using the mptt values
+        from the database rather than from any in memory instance, so that
+        it reflects the position of the node at the time it is evaluated.
+        """
+        node = self.filter(pk=node_id).order_by()
+        return self.filter(
+            tree_id=node.values_list("tree_id", flat=True)[:1],
+            lft__lt=node.values_list("lft", flat=True)[:1],
+            rght__gt=node.values_list("rght", flat=True)[:1],
+        ).order_by()
+
+    def get_child_path(self, parent_id):
+        """
+        Returns the path, the ids of all its ancestors, for a child of the node with parent_id
+        """
+        if parent_id is None:
+            return []
+        path = self.filter(pk=parent_id).values_list("path", flat=True).first()
+        return (path or []) + [parent_id]
+
+    def update_descendant_paths(self, node, previous_path):
+        """
+        Updates the paths of the descendants of a node that has been moved, replacing its
+        previous ancestors with those in its new path.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE {node_table}
+                SET path = %(prefix)s::varchar(32)[] || path[%(start)s:]
+                WHERE path @> ARRAY[%(node_id)s]::varchar(32)[]
+                """.format(node_table=self.model._meta.db_table),
+                {
+                    "prefix": list(node.path) + [node.pk],
+                    # The position in the previous paths just after the node itself
+                    "start": len(previous_path) + 2,
+                    "node_id": node.pk,
+                },
+            )
+
+    def update_ancestor_aggregates(self, node_id, deltas):
+        """
+        Adds the deltas to the stored descendant counts of all the ancestors
+        of a node. If the node is being moved, this must be called while holding
+        the mptt lock for its tree, so that its ancestors cannot change meanwhile.
+        """
+        from contentcuration.models import ContentNodeAggregate
+
+        updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if not updates:
+            return
+        ContentNodeAggregate.objects.filter(
+            contentnode__in=self._ancestors_of(node_id).values_list("id", flat=True)
+        ).update(**updates)
+
+    def add_aggregate_deltas(self, deltas_by_node_id):
+        """
+        Adds deltas to the stored descendant counts of many nodes, with
+        one update for each distinct set of deltas.
+        """
+        from contentcuration.models import ContentNodeAggregate
+
+        node_ids_by_deltas = defaultdict(list)
+        for node_id, deltas in deltas_by_node_id.items():
+            deltas = tuple(sorted((field, delta) for field, delta in deltas.items() if delta))
+            if deltas:
+                node_ids_by_deltas[deltas].append(node_id)
+        for deltas, node_ids in node_ids_by_deltas.items():
+            ContentNodeAggregate.objects.filter(contentnode__in=node_ids).update(
+                **{field: F(field) + delta for field, delta in deltas}
+            )
+
+    def _calculate_aggregates(self, queryset):
+        """
+        Calculate the sum of the contributions of all nodes in the queryset
+        in the database, used when no stored counts are available.
+        """
+        is_resource = ~Q(kind_id=content_kinds.TOPIC)
+        conditions = {
+            "resource_count": is_resource,
+            "coach_count": is_resource & Q(role_visibility=roles.COACH),
+            "error_count": Q(complete=False),
+            "updated_count": is_resource & Q(changed=True, published=True),
+            "new_count": is_resource & Q(changed=True, published=False),
+        }
+        totals = queryset.order_by().aggregate(
+            **{
+                field: Sum(
+                    Case(
+                        When(condition, then=Value(1)),
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    )
+                )
+                for field, condition in conditions.items()
+            }
+        )
+        return {field: totals[field] or 0 for field in AGGREGATE_FIELDS}
+
+    def get_subtree_aggregates(self, node_id):
+        """
+        Returns the amount that a node and all its descendants add to the
+        descendant counts of the node's ancestors.
+        """
+        from contentcuration.models import ContentNodeAggregate
+
+        node = self.filter(pk=node_id).values(
+            "tree_id", "lft", "rght", *AGGREGATE_SOURCE_FIELDS
+        ).get()
+        try:
+            descendant_aggregates = ContentNodeAggregate.objects.values(
+                *AGGREGATE_FIELDS
+            ).get(contentnode_id=node_id)
+        except ContentNodeAggregate.DoesNotExist:
+            descendant_aggregates = self._calculate_aggregates(
+                self.filter(
+                    tree_id=node["tree_id"],
+                    lft__gt=node["lft"],
+                    rght__lt=node["rght"],
+                )
+            )
+        return sum_aggregates(
+            descendant_aggregates,
+            node_aggregate_contribution(node),
+        )
+
+    def _accumulate_aggregates(self, nodes):
+        """
+        Takes an iterable of (id, parent_id, contribution) tuples that make up
+        whole subtrees in tree order, and returns an ordered dict of the descendant
+        counts for every node, keyed by id.
+        """
+        aggregates = OrderedDict()
+        parents = {}
+        for node_id, parent_id, contribution in nodes:
+            aggregates[node_id] = dict.fromkeys(AGGREGATE_FIELDS, 0)
+            parents[node_id] = parent_id
+            ancestor_id = parent_id
+            while ancestor_id in aggregates:
+                for field in AGGREGATE_FIELDS:
+                    aggregates[ancestor_id][field] += contribution[field]
+                ancestor_id = parents[ancestor_id]
+        return aggregates
+
+    def create_aggregates(self, nodes):
+        """
+        Stores the descendant counts for newly inserted nodes, and adds the totals
+        for them to the counts of the ancestors of the first node.
+        The nodes must make up a single subtree, in tree order, with its root first.
+        This should be called while holding the mptt lock for the tree.
+        """
+        from contentcuration.models import ContentNodeAggregate
+
+        if not nodes:
+            return
+        contributions = [
+            (
+                node.id,
+                node.parent_id,
+                node_aggregate_contribution(
+                    {f: getattr(node, f) for f in AGGREGATE_SOURCE_FIELDS}
+                ),
+            )
+            for node in nodes
+        ]
+        aggregates = self._accumulate_aggregates(contributions)
+        ContentNodeAggregate.objects.bulk_create(
+            [
+                ContentNodeAggregate(contentnode_id=node_id, **values)
+                for node_id, values in aggregates.items()
+            ]
+        )
+        root_id, _, root_contribution = contributions[0]
+        self.update_ancestor_aggregates(
+            root_id, sum_aggregates(aggregates[root_id], root_contribution)
+        )
+
+    def rebuild_aggregates(self, tree_id, batch_size=1000):
+        """
+        Recalculates the stored descendant counts for every node in a tree
+        """
+        from contentcuration.models import ContentNodeAggregate
+
+        with self.lock_mptt(tree_id, operation="rebuild"):
+            nodes = (
+                self.filter(tree_id=tree_id)
+                .order_by("lft")
+                .values("id", "parent_id", *AGGREGATE_SOURCE_FIELDS)
+            )
+            aggregates = self._accumulate_aggregates(
+                (node["id"], node["parent_id"], node_aggregate_contribution(node))
+                for node in nodes.iterator()
+            )
+            ContentNodeAggregate.objects.filter(contentnode__tree_id=tree_id).delete()
+            ContentNodeAggregate.objects.bulk_create(
+                (
+                    ContentNodeAggregate(contentnode_id=node_id, **values)
+                    for node_id, values in aggregates.items()
+                ),
+                batch_size=batch_size,
+            )
+
+    def _renumber_tree(self, tree_id, gap=0, batch_size=1000):
+        nodes = (
+            self.filter(tree_id=tree_id).order_by("lft").values_list("id", "parent_id")
+        )
+        renumbered = []
+        stack = []
+        cursor = 1
+
+        def close():
+            node = stack.pop()
+            node.rght = cursor
+            renumbered.append(node)
+            return cursor + 1 + (gap if stack else 0)
+
+        for node_id, parent_id in nodes.iterator():
+            while stack and stack[-1].id != parent_id:
+                cursor = close()
+            stack.append(self.model(id=node_id, lft=cursor))
+            cursor += 1
+        while stack:
+            cursor = close()
+
+        bulk_update(renumbered, update_fields=["lft", "rght"], batch_size=batch_size)
+
+    def renumber_tree(self, tree_id, gap=0, batch_size=1000):
+        """
+        Renumbers the lft and rght values of every node in a tree, keeping their order.
+        By default the tree is numbered densely, compacting any gaps left by inserts with
+        settings.MPTT_SPARSE_GAP, otherwise gap free values are left after every child node.
+        """
+        with self.lock_mptt(tree_id, operation="rebuild"):
+            self._renumber_tree(tree_id, gap=gap, batch_size=batch_size)
+
     def move_node(self, node, target, position="last-child"):
         """
         Vendored from mptt - by default mptt moves then saves
@@ -208,41 +747,159 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
         ``MPTTMeta.order_insertion_by``.  In most cases you should just
         move the node yourself by setting node.parent.
         """
-        with self.lock_mptt(node.tree_id, target.tree_id):
-            # Call _mptt_refresh to ensure that the mptt fields on
-            # these nodes are up to date once we have acquired a lock
-            # on the associated trees. This means that the mptt data
-            # will remain fresh until the lock is released at the end
-            # of the context manager.
-            self._mptt_refresh(node, target)
-            # N.B. this only calls save if we are running inside a
-            # delay MPTT updates context
-            self._move_node(node, target, position=position)
-            node.save(skip_lock=True)
+        with self.lock_mptt(node.tree_id, target.tree_id, operation="move"):
+            self._move_node_in_lock(node, target, position)
         node_moved.send(
             sender=node.__class__, instance=node, target=target, position=position,
         )
 
+    def _move_node_in_lock(self, node, target, position):
+        # Call _mptt_refresh to ensure that the mptt fields on
+        # these nodes are up to date once we have acquired a lock
+        # on the associated trees. This means that the mptt data
+        # will remain fresh until the lock is released at the end
+        # of the context manager.
+        self._mptt_refresh(node, target)
+        previous_tree_id = node.tree_id
+        # Take the descendant counts for this subtree away from its
+        # current ancestors, and give them to its new ancestors once moved.
+        subtree_aggregates = self.get_subtree_aggregates(node.id)
+        self.update_ancestor_aggregates(node.id, negate_aggregates(subtree_aggregates))
+        # N.B. this only calls save if we are running inside a
+        # delay MPTT updates context
+        self._move_node(node, target, position=position)
+        self.update_ancestor_aggregates(node.id, subtree_aggregates)
+        node.save(skip_lock=True)
+        if node.tree_id != previous_tree_id:
+            self._update_storage_ledger(node)
+
+    def _update_storage_ledger(self, node):
+        """
+        Recounts the storage used by the files of a subtree that has moved between
+        trees, such as to the trash tree, as it may no longer be in an active tree
+        """
+        from contentcuration.models import File
+        from contentcuration.models import StorageLedger
+
+        StorageLedger.objects.update_for_files(
+            File.objects.filter(
+                contentnode__tree_id=node.tree_id,
+                contentnode__lft__gte=node.lft,
+                contentnode__rght__lte=node.rght,
+            )
+        )
+
+    def move_nodes(self, moves):
+        """
+        Moves many nodes in a single lock of all the trees involved.
+        ``moves`` is a list of (node, target, position) tuples, which are applied in order.
+        Where a node is the target of another move, or is moved more than once, the same
+        instance should be used each time, so that its parent stays up to date in memory.
+
+        Returns a list with an entry for each move, which is None if the move succeeded,
+        or the exception raised if it was an invalid move, in which case the move has
+        been rolled back without affecting the other moves.
+        """
+        tree_ids = set()
+        for node, target, _ in moves:
+            tree_ids.update((node.tree_id, target.tree_id))
+
+        errors = []
+        completed = []
+        with self.lock_mptt(*tree_ids, operation="move"):
+            for node, target, position in moves:
+                try:
+                    with transaction.atomic():
+                        self._move_node_in_lock(node, target, position)
+                except (InvalidMove, ValueError) as e:
+                    # Reset the in memory values of the node to match the database
+                    node.refresh_from_db()
+                    errors.append(e)
+                else:
+                    errors.append(None)
+                    completed.append((node, target, position))
+
+        for node, target, position in completed:
+            node_moved.send(
+                sender=node.__class__, instance=node, target=target, position=position,
+            )
+        return errors
+
     def get_source_attributes(self, source):
         """
         These attributes will be copied when the node is copied
         and also when a copy is synced with its source
         """
-        return {
-            "content_id": source.content_id,
-            "kind_id": source.kind_id,
-            "title": source.title,
-            "description": source.description,
-            "language_id": source.language_id,
-            "license_id": source.license_id,
-            "license_description": source.license_description,
-            "thumbnail_encoding": source.thumbnail_encoding,
-            "extra_fields": source.extra_fields,
-            "copyright_holder": source.copyright_holder,
-            "author": source.author,
-            "provider": source.provider,
-            "role_visibility": source.role_visibility,
-        }
+        return {attname: getattr(source, attname) for attname in SOURCE_ATTRIBUTES}
+
+    def get_original_nodes(self, nodes):
+        """
+        Returns a dict of the original node of each of nodes, keyed by pk, as would be
+        returned by ContentNode.get_original_node for each node. The nodes are grouped by
+        their original channel, and the originals in each channel's main tree are found
+        with a single query, matching on node_id first and falling back to content_id.
+        """
+        from contentcuration.models import ChannelTree
+
+        nodes = list(nodes.select_related("original_node"))
+        original_nodes = {node.pk: node.original_node or node for node in nodes}
+        nodes_by_channel = defaultdict(list)
+        for node in nodes:
+            if node.original_channel_id and node.original_source_node_id:
+                nodes_by_channel[node.original_channel_id].append(node)
+        tree_ids = dict(
+            ChannelTree.objects.filter(
+                channel_id__in=list(nodes_by_channel), tree_name="main_tree"
+            ).values_list("channel_id", "tree_id")
+        )
+
+        for channel_id, channel_nodes in nodes_by_channel.items():
+            if channel_id not in tree_ids:
+                continue
+            node_ids = {node.original_source_node_id for node in channel_nodes}
+            content_ids = {node.content_id for node in channel_nodes if node.content_id}
+            by_node_id = {}
+            by_content_id = {}
+            # Keep the first match in tree order, as get_original_node would
+            for original in self.filter(
+                Q(node_id__in=node_ids) | Q(content_id__in=content_ids),
+                tree_id=tree_ids[channel_id],
+            ).order_by("lft"):
+                by_node_id.setdefault(original.node_id, original)
+                by_content_id.setdefault(original.content_id, original)
+            for node in channel_nodes:
+                original_nodes[node.pk] = (
+                    by_node_id.get(node.original_source_node_id)
+                    or by_content_id.get(node.content_id)
+                    or node
+                )
+        return original_nodes
+
+    def _fill_original_attributes(self, source, copy, original_node=None, tree_channel_ids=None):
+        """
+        :param original_node: The original node of source, if it has already been resolved
+        :param tree_channel_ids: A dict of channel ids by tree_id, to look up the channel
+            of the original node in, rather than querying for it
+        """
+        # There might be some legacy nodes that don't have these, so ensure they are added
+        if (
+            copy["original_channel_id"] is None
+            or copy["original_source_node_id"] is None
+        ):
+            original_node = original_node or source.get_original_node()
+            if copy["original_channel_id"] is None:
+                copy["original_channel_id"] = self._get_original_channel_id(
+                    original_node, tree_channel_ids
+                )
+            if copy["original_source_node_id"] is None:
+                copy["original_source_node_id"] = original_node.node_id
+        return copy
+
+    def _get_original_channel_id(self, original_node, tree_channel_ids):
+        if tree_channel_ids is not None:
+            return tree_channel_ids.get(original_node.tree_id)
+        original_channel = original_node.get_channel()
+        return original_channel.id if original_channel else None
 
     def _clone_node(
         self, source, parent_id, source_channel_id, can_edit_source_channel, pk, mods
@@ -268,67 +925,39 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
         if isinstance(mods, dict):
             copy.update(mods)
 
-        # There might be some legacy nodes that don't have these, so ensure they are added
-        if (
-            copy["original_channel_id"] is None
-            or copy["original_source_node_id"] is None
-        ):
-            original_node = source.get_original_node()
-            if copy["original_channel_id"] is None:
-                original_channel = original_node.get_channel()
-                copy["original_channel_id"] = (
-                    original_channel.id if original_channel else None
-                )
-            if copy["original_source_node_id"] is None:
-                copy["original_source_node_id"] = original_node.node_id
+        return self._fill_original_attributes(source, copy)
 
-        return copy
-
-    def _recurse_to_create_tree(
-        self,
-        source,
-        parent_id,
-        source_channel_id,
-        nodes_by_parent,
-        source_copy_id_map,
-        can_edit_source_channel,
-        pk,
-        mods,
-    ):
-        copy = self._clone_node(
-            source, parent_id, source_channel_id, can_edit_source_channel, pk, mods,
-        )
-
-        if source.kind_id == content_kinds.TOPIC and source.id in nodes_by_parent:
-            children = sorted(nodes_by_parent[source.id], key=lambda x: x.lft)
-            copy["children"] = list(
-                map(
-                    lambda x: self._recurse_to_create_tree(
-                        x,
-                        copy["id"],
-                        source_channel_id,
-                        nodes_by_parent,
-                        source_copy_id_map,
-                        can_edit_source_channel,
-                        None,
-                        None,
-                    ),
-                    children,
-                )
-            )
-        source_copy_id_map[source.id] = copy["id"]
-        return copy
+    def _get_excluded_nodes(self, node, excluded_descendants):
+        """
+        Returns the id, lft and rght of the outermost excluded descendants of node, in lft order,
+        as excluding a node also excludes all of its descendants.
+        """
+        if not excluded_descendants:
+            return []
+
+        excluded_nodes = []
+        for pk, lft, rght in (
+            node.get_descendants()
+            .filter(node_id__in=excluded_descendants.keys())
+            .order_by("lft")
+            .values_list("id", "lft", "rght")
+        ):
+            if not excluded_nodes or lft > excluded_nodes[-1][2]:
+                excluded_nodes.append((pk, lft, rght))
+        return excluded_nodes
 
-    def _all_nodes_to_copy(self, node, excluded_descendants):
+    def _all_nodes_to_copy(self, node, excluded_nodes):
         nodes_to_copy = node.get_descendants(include_self=True)
 
-        if excluded_descendants:
-            excluded_descendants = self.filter(
-                node_id__in=excluded_descendants.keys()
-            ).get_descendants(include_self=True)
-            nodes_to_copy = nodes_to_copy.difference(excluded_descendants)
+        for _, lft, rght in excluded_nodes:
+            nodes_to_copy = nodes_to_copy.exclude(lft__gte=lft, rght__lte=rght)
         return nodes_to_copy
 
+    def count_nodes_to_copy(self, node, excluded_descendants=None, excluded_nodes=None):
+        if excluded_nodes is None:
+            excluded_nodes = self._get_excluded_nodes(node, excluded_descendants)
+        return self._all_nodes_to_copy(node, excluded_nodes).count()
+
     def copy_node(
         self,
         node,
@@ -339,12 +968,21 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
         excluded_descendants=None,
         can_edit_source_channel=None,
         batch_size=None,
+        total_nodes=None,
     ):
-        if batch_size is None:
-            batch_size = BATCH_SIZE
+        """
+        :param batch_size: A fixed batch size of lft/rght values to copy at once,
+            by default this is adapted to the measured copy rate, see CopyBatchSizer.
+        :param total_nodes: The total number of nodes that progress is tracked against,
+            when this copy is one of several copies being tracked together. Defaults to the
+            number of nodes being copied.
+        """
         source_channel_id = node.get_channel_id()
 
-        total_nodes = self._all_nodes_to_copy(node, excluded_descendants).count()
+        excluded_nodes = self._get_excluded_nodes(node, excluded_descendants)
+
+        if total_nodes is None:
+            total_nodes = self.count_nodes_to_copy(node, excluded_nodes=excluded_nodes)
 
         set_total(total_nodes)
 
@@ -355,9 +993,9 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
             source_channel_id,
             pk,
             mods,
-            excluded_descendants,
+            excluded_nodes,
             can_edit_source_channel,
-            batch_size,
+            CopyBatchSizer(batch_size),
         )
 
     def _copy(
@@ -368,11 +1006,15 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
         source_channel_id,
         pk,
         mods,
-        excluded_descendants,
+        excluded_nodes,
         can_edit_source_channel,
-        batch_size,
+        batch_sizer,
     ):
-        if node.rght - node.lft < batch_size:
+        """
+        :param excluded_nodes: The outermost excluded descendants of the node being copied,
+            as returned by _get_excluded_nodes.
+        """
+        if node.rght - node.lft < batch_sizer.batch_size:
             return self._deep_copy(
                 node,
                 target,
@@ -380,8 +1022,9 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
                 source_channel_id,
                 pk,
                 mods,
-                excluded_descendants,
+                excluded_nodes,
                 can_edit_source_channel,
+                batch_sizer,
             )
         else:
             node_copy = self._shallow_copy(
@@ -393,10 +1036,10 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
                 mods,
                 can_edit_source_channel,
             )
-            children = node.get_children().order_by("lft")
-            if excluded_descendants:
-                children = children.exclude(node_id__in=excluded_descendants.keys())
-            for child in children:
+            excluded_ids = {pk for pk, _, _ in excluded_nodes}
+            for child in node.get_children().order_by("lft"):
+                if child.id in excluded_ids:
+                    continue
                 self._copy(
                     child,
                     node_copy,
@@ -404,138 +1047,183 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
                     source_channel_id,
                     None,
                     None,
-                    excluded_descendants,
+                    excluded_nodes,
                     can_edit_source_channel,
-                    batch_size,
+                    batch_sizer,
                 )
             return [node_copy]
 
-    def _parse_filter_kwargs(self, contentnode, contentnode__in):
-        filter_kwargs = {}
-        if contentnode is not None:
-            filter_kwargs["contentnode"] = contentnode
-        elif contentnode__in is not None:
-            filter_kwargs["contentnode__in"] = contentnode__in
-        else:
-            raise ValueError("Must specify one of contentnode or contentnode__in")
-
-        return filter_kwargs
+    def _copy_values(self, model, overrides, copy_unspecified=True):
+        """
+        Returns the SQL column list and select list for copying rows of a model
+        with an INSERT ... SELECT from a source row aliased as `source`, along with
+        any params needed by the select list.
+        Columns in overrides are set to the SQL expression given, auto_now fields
+        are set to the current time, and all other columns are either copied from
+        the source row, or if copy_unspecified is False, set to their default.
+        """
+        qn = connection.ops.quote_name
+        now = timezone.now()
+        columns = []
+        values = []
+        params = {}
+        for field in model._meta.concrete_fields:
+            columns.append(qn(field.column))
+            if field.attname in overrides:
+                values.append(overrides[field.attname])
+            elif getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+                values.append("%(now)s")
+                params["now"] = now
+            elif copy_unspecified:
+                values.append("source.{}".format(qn(field.column)))
+            else:
+                param = "default_{}".format(field.attname)
+                values.append("%({})s".format(param))
+                params[param] = field.get_db_prep_save(field.get_default(), connection)
+        return ", ".join(columns), ", ".join(values), params
 
-    def _copy_tags(self, source_copy_id_map, contentnode, contentnode__in):
+    def _copy_tags(self, cursor, copy_map, params):
         from contentcuration.models import ContentTag
 
-        filter_kwargs = self._parse_filter_kwargs(contentnode, contentnode__in)
-
-        node_tags_mappings = list(
-            self.model.tags.through.objects.filter(**filter_kwargs)
-        )
-        if contentnode is not None:
-            tags_to_copy = ContentTag.objects.filter(
-                tagged_content=contentnode, channel__isnull=False
-            )
-        elif contentnode__in is not None:
-            tags_to_copy = ContentTag.objects.filter(
-                tagged_content__in=contentnode__in, channel__isnull=False
+        through_table = self.model.tags.through._meta.db_table
+        tag_table = ContentTag._meta.db_table
+
+        # Tags that belong to a channel are not copied, instead the copies are tagged
+        # with a tag of the same name that does not belong to a channel, so create
+        # any of those that do not already exist.
+        cursor.execute(
+            """
+            INSERT INTO {tag_table} (id, tag_name, channel_id)
+            SELECT {uuid}, names.tag_name, NULL
+            FROM (
+                SELECT DISTINCT tag.tag_name
+                FROM {copy_map} AS map
+                JOIN {through_table} AS source ON source.contentnode_id = map.source_id
+                JOIN {tag_table} AS tag ON tag.id = source.contenttag_id
+                WHERE tag.channel_id IS NOT NULL
+            ) AS names
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {tag_table} AS existing
+                WHERE existing.tag_name = names.tag_name AND existing.channel_id IS NULL
             )
+            """.format(
+                tag_table=tag_table,
+                through_table=through_table,
+                copy_map=copy_map,
+                uuid=RANDOM_UUID_SQL,
+            ),
+            params,
+        )
+        cursor.execute(
+            """
+            INSERT INTO {through_table} (contentnode_id, contenttag_id)
+            SELECT DISTINCT map.id, CASE
+                WHEN tag.channel_id IS NULL THEN tag.id
+                ELSE (
+                    SELECT existing.id FROM {tag_table} AS existing
+                    WHERE existing.tag_name = tag.tag_name AND existing.channel_id IS NULL
+                    LIMIT 1
+                )
+            END
+            FROM {copy_map} AS map
+            JOIN {through_table} AS source ON source.contentnode_id = map.source_id
+            JOIN {tag_table} AS tag ON tag.id = source.contenttag_id
+            """.format(
+                tag_table=tag_table, through_table=through_table, copy_map=copy_map,
+            ),
+            params,
+        )
 
-        # Get a lookup of all existing null channel tags so we don't duplicate
-        existing_tags_lookup = {
-            t["tag_name"]: t["id"]
-            for t in ContentTag.objects.filter(
-                tag_name__in=tags_to_copy.values_list("tag_name", flat=True),
-                channel__isnull=True,
-            ).values("tag_name", "id")
-        }
-        tags_to_copy = list(tags_to_copy)
-
-        tags_to_create = []
-
-        tag_id_map = {}
-
-        for tag in tags_to_copy:
-            if tag.tag_name in existing_tags_lookup:
-                tag_id_map[tag.id] = existing_tags_lookup.get(tag.tag_name)
-            else:
-                new_tag = ContentTag(tag_name=tag.tag_name)
-                tag_id_map[tag.id] = new_tag.id
-                tags_to_create.append(new_tag)
-
-        ContentTag.objects.bulk_create(tags_to_create)
+    def _copy_assessment_items(self, cursor, copy_map, params):
+        from contentcuration.models import AssessmentItem
+        from contentcuration.models import File
 
-        mappings_to_create = [
-            self.model.tags.through(
-                contenttag_id=tag_id_map.get(
-                    mapping.contenttag_id, mapping.contenttag_id
-                ),
-                contentnode_id=source_copy_id_map.get(mapping.contentnode_id),
+        item_table = AssessmentItem._meta.db_table
+        item_columns, item_values, item_params = self._copy_values(
+            AssessmentItem, {"id": "item_map.id", "contentnode_id": "item_map.contentnode_id"}
+        )
+        file_columns, file_values, file_params = self._copy_values(
+            File, {"id": RANDOM_UUID_SQL, "assessment_item_id": "item_map.id"}
+        )
+        # Assign the new ids for the assessment items up front,
+        # so that their files can be copied in the same statement.
+        cursor.execute(
+            """
+            WITH item_map AS (
+                SELECT
+                    source.id AS source_id,
+                    nextval(pg_get_serial_sequence('{item_table}', 'id')) AS id,
+                    map.id AS contentnode_id
+                FROM {copy_map} AS map
+                JOIN {item_table} AS source ON source.contentnode_id = map.source_id
+            ), new_items AS (
+                INSERT INTO {item_table} ({item_columns})
+                SELECT {item_values}
+                FROM item_map
+                JOIN {item_table} AS source ON source.id = item_map.source_id
             )
-            for mapping in node_tags_mappings
-        ]
-
-        self.model.tags.through.objects.bulk_create(mappings_to_create)
+            INSERT INTO {file_table} ({file_columns})
+            SELECT {file_values}
+            FROM item_map
+            JOIN {file_table} AS source ON source.assessment_item_id = item_map.source_id
+            """.format(
+                item_table=item_table,
+                item_columns=item_columns,
+                item_values=item_values,
+                file_table=File._meta.db_table,
+                file_columns=file_columns,
+                file_values=file_values,
+                copy_map=copy_map,
+            ),
+            dict(params, **dict(item_params, **file_params)),
+        )
 
-    def _copy_assessment_items(self, source_copy_id_map, contentnode, contentnode__in):
+    def _copy_files(self, cursor, copy_map, params):
         from contentcuration.models import File
-        from contentcuration.models import AssessmentItem
 
-        filter_kwargs = self._parse_filter_kwargs(contentnode, contentnode__in)
-
-        node_assessmentitems = list(AssessmentItem.objects.filter(**filter_kwargs))
-        node_assessmentitem_files = list(
-            File.objects.filter(assessment_item__in=node_assessmentitems)
+        file_columns, file_values, file_params = self._copy_values(
+            File, {"id": RANDOM_UUID_SQL, "contentnode_id": "map.id"}
+        )
+        cursor.execute(
+            """
+            INSERT INTO {file_table} ({file_columns})
+            SELECT {file_values}
+            FROM {copy_map} AS map
+            JOIN {file_table} AS source ON source.contentnode_id = map.source_id
+            """.format(
+                file_table=File._meta.db_table,
+                file_columns=file_columns,
+                file_values=file_values,
+                copy_map=copy_map,
+            ),
+            dict(params, **file_params),
         )
 
-        assessmentitem_old_id_lookup = {}
-
-        for assessmentitem in node_assessmentitems:
-            old_id = assessmentitem.id
-            assessmentitem.id = None
-            assessmentitem.contentnode_id = source_copy_id_map[
-                assessmentitem.contentnode_id
-            ]
-            assessmentitem_old_id_lookup[
-                assessmentitem.contentnode_id + ":" + assessmentitem.assessment_id
-            ] = old_id
-
-        node_assessmentitems = AssessmentItem.objects.bulk_create(node_assessmentitems)
-
-        assessmentitem_new_id_lookup = {}
-
-        for assessmentitem in node_assessmentitems:
-            old_id = assessmentitem_old_id_lookup[
-                assessmentitem.contentnode_id + ":" + assessmentitem.assessment_id
-            ]
-            assessmentitem_new_id_lookup[old_id] = assessmentitem.id
-
-        for file in node_assessmentitem_files:
-            file.id = None
-            file.assessment_item_id = assessmentitem_new_id_lookup[
-                file.assessment_item_id
-            ]
-
-        File.objects.bulk_create(node_assessmentitem_files)
-
-    def _copy_files(self, source_copy_id_map, contentnode, contentnode__in):
+    def _copy_associated_objects(self, copy_map, params=None):
+        """
+        Copies the files, assessment items and tags of the source nodes in copy_map
+        to their copies. copy_map is a table, or a subquery, with a source_id
+        and an id column, for the id of each source node and the id of its copy.
+        """
         from contentcuration.models import File
+        from contentcuration.models import StorageLedger
 
-        filter_kwargs = self._parse_filter_kwargs(contentnode, contentnode__in)
-
-        node_files = list(File.objects.filter(**filter_kwargs))
-
-        for file in node_files:
-            file.id = None
-            file.contentnode_id = source_copy_id_map[file.contentnode_id]
-
-        File.objects.bulk_create(node_files)
+        params = params or {}
+        with connection.cursor() as cursor:
+            self._copy_files(cursor, copy_map, params)
 
-    def _copy_associated_objects(
-        self, source_copy_id_map, contentnode=None, contentnode__in=None
-    ):
-        self._copy_files(source_copy_id_map, contentnode, contentnode__in)
+            self._copy_assessment_items(cursor, copy_map, params)
 
-        self._copy_assessment_items(source_copy_id_map, contentnode, contentnode__in)
+            self._copy_tags(cursor, copy_map, params)
 
-        self._copy_tags(source_copy_id_map, contentnode, contentnode__in)
+        StorageLedger.objects.update(
+            """
+            SELECT file.uploaded_by_id AS user_id, file.checksum
+            FROM {copy_map} AS map
+            JOIN {file_table} AS file ON file.contentnode_id = map.id
+            """.format(copy_map=copy_map, file_table=File._meta.db_table),
+            params,
+        )
 
     def _shallow_copy(
         self,
@@ -550,7 +1238,7 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
         data = self._clone_node(
             node, None, source_channel_id, can_edit_source_channel, pk, mods,
         )
-        with self.lock_mptt(target.tree_id if target else None):
+        with self.lock_mptt(target.tree_id if target else None, operation="copy"):
             node_copy = self.model(**data)
             if target:
                 self._mptt_refresh(target)
@@ -558,69 +1246,329 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
             node_copy.save(force_insert=True)
 
         self._copy_associated_objects(
-            {node.id: node_copy.id}, contentnode=node,
+            "(SELECT %(source_id)s::text AS source_id, %(copy_id)s::text AS id)",
+            {"source_id": node.id, "copy_id": node_copy.id},
         )
         increment_progress(1)
         return node_copy
 
-    def _deep_copy(
+    def _create_copy_map(self, cursor, copy_map, node, pk, excluded_nodes):
+        """
+        Creates a temporary table mapping the id of every node in the subtree being copied to
+        a newly generated id and node_id for its copy, along with the lft, rght and level of the
+        copy relative to the root of the copy, after leaving out any excluded descendants.
+        Returns the number of nodes to be copied, and the width of the lft/rght values they span.
+        The table lasts until it is dropped, so that it can be used after the transaction that
+        created it has been committed.
+        """
+        cursor.execute(
+            """
+            CREATE TEMPORARY TABLE {copy_map} AS
+            WITH root AS (
+                SELECT tree_id, lft, rght, level FROM {node_table} WHERE id = %(source_id)s
+            ), excluded_ranges AS (
+                -- The excluded nodes are only the outermost ones, so their ranges don't overlap
+                SELECT node.lft, node.rght
+                FROM {node_table} AS node, root
+                WHERE node.id = ANY(%(excluded_ids)s::text[])
+                AND node.tree_id = root.tree_id
+                AND node.lft > root.lft
+                AND node.rght < root.rght
+            )
+            SELECT
+                source.id AS source_id,
+                CASE
+                    WHEN source.id = %(source_id)s THEN COALESCE(%(pk)s, {uuid})
+                    ELSE {uuid}
+                END AS id,
+                {uuid} AS node_id,
+                source.parent_id AS source_parent_id,
+                -- Close up the gaps left by any excluded descendants
+                source.lft - root.lft - (
+                    SELECT COALESCE(SUM(excluded_ranges.rght - excluded_ranges.lft + 1), 0)
+                    FROM excluded_ranges WHERE excluded_ranges.rght < source.lft
+                ) AS lft,
+                source.rght - root.lft - (
+                    SELECT COALESCE(SUM(excluded_ranges.rght - excluded_ranges.lft + 1), 0)
+                    FROM excluded_ranges WHERE excluded_ranges.rght < source.rght
+                ) AS rght,
+                source.level - root.level AS level
+            FROM {node_table} AS source, root
+            WHERE source.tree_id = root.tree_id
+            AND source.lft >= root.lft
+            AND source.rght <= root.rght
+            AND NOT EXISTS (
+                SELECT 1 FROM excluded_ranges
+                WHERE source.lft >= excluded_ranges.lft AND source.rght <= excluded_ranges.rght
+            )
+            """.format(
+                copy_map=copy_map,
+                node_table=self.model._meta.db_table,
+                uuid=RANDOM_UUID_SQL,
+            ),
+            {
+                "source_id": node.id,
+                "pk": pk,
+                "excluded_ids": [excluded_id for excluded_id, _, _ in excluded_nodes],
+            },
+        )
+        # The map is looked up by source id for the parents and paths of the copies
+        cursor.execute("CREATE INDEX ON {} (source_id)".format(copy_map))
+        # Any gaps between sibling intervals in the source are kept in the copy
+        cursor.execute("SELECT COUNT(*), MAX(rght) + 1 FROM {}".format(copy_map))
+        return cursor.fetchone()
+
+    def _insert_copied_nodes(
         self,
-        node,
+        cursor,
+        copy_map,
         target,
-        position,
+        tree_id,
+        cursor_position,
+        level,
         source_channel_id,
-        pk,
-        mods,
-        excluded_descendants,
         can_edit_source_channel,
     ):
+        qn = connection.ops.quote_name
+        overrides = {
+            "id": "map.id",
+            "node_id": "map.node_id",
+            "parent_id": "COALESCE(parent_map.id, %(target_id)s)",
+            "tree_id": "%(tree_id)s",
+            "lft": "map.lft + %(cursor)s",
+            "rght": "map.rght + %(cursor)s",
+            "level": "map.level + %(level)s",
+            "aggregator": "source.aggregator",
+            "cloned_source_id": "source.id",
+            "source_channel_id": "%(source_channel_id)s",
+            "source_node_id": "source.node_id",
+            "original_channel_id": "source.original_channel_id",
+            "original_source_node_id": "source.original_source_node_id",
+            "freeze_authoring_data": "source.freeze_authoring_data OR %(freeze_authoring_data)s",
+            "changed": "TRUE",
+            "published": "FALSE",
+        }
+        overrides.update(
+            {
+                attname: "source.{}".format(qn(self.model._meta.get_field(attname).column))
+                for attname in SOURCE_ATTRIBUTES
+            }
+        )
+        columns, values, params = self._copy_values(
+            self.model, overrides, copy_unspecified=False
+        )
+        params.update(
+            {
+                "target_id": target.id if target else None,
+                "tree_id": tree_id,
+                "cursor": cursor_position,
+                "level": level,
+                "source_channel_id": source_channel_id,
+                "freeze_authoring_data": not can_edit_source_channel,
+            }
+        )
+        cursor.execute(
+            """
+            INSERT INTO {node_table} ({columns})
+            SELECT {values}
+            FROM {copy_map} AS map
+            JOIN {node_table} AS source ON source.id = map.source_id
+            LEFT JOIN {copy_map} AS parent_map ON parent_map.source_id = map.source_parent_id
+            """.format(
+                node_table=self.model._meta.db_table,
+                columns=columns,
+                values=values,
+                copy_map=copy_map,
+            ),
+            params,
+        )
 
-        nodes_to_copy = self._all_nodes_to_copy(node, excluded_descendants)
-
-        nodes_by_parent = {}
+    def _fill_copied_original_attributes(self, cursor, copy_map):
+        """
+        Fills in the original channel and node ids for copies of any legacy nodes
+        that do not have them.
+        """
+        cursor.execute(
+            """
+            SELECT map.source_id, map.id
+            FROM {copy_map} AS map
+            JOIN {node_table} AS source ON source.id = map.source_id
+            WHERE source.original_channel_id IS NULL OR source.original_source_node_id IS NULL
+            """.format(copy_map=copy_map, node_table=self.model._meta.db_table)
+        )
+        copy_ids = dict(cursor.fetchall())
+        if not copy_ids:
+            return
+        from contentcuration.models import ChannelTree
+
+        sources = self.filter(pk__in=list(copy_ids))
+        original_nodes = self.get_original_nodes(sources)
+        tree_channel_ids = dict(
+            ChannelTree.objects.filter(
+                tree_id__in={node.tree_id for node in original_nodes.values()}
+            ).values_list("tree_id", "channel_id")
+        )
+        for source in sources:
+            copy = self._fill_original_attributes(
+                source,
+                {
+                    "original_channel_id": source.original_channel_id,
+                    "original_source_node_id": source.original_source_node_id,
+                },
+                original_node=original_nodes[source.pk],
+                tree_channel_ids=tree_channel_ids,
+            )
+            self.filter(pk=copy_ids[source.id]).update(**copy)
 
-        for copy_node in nodes_to_copy:
-            if copy_node.parent_id not in nodes_by_parent:
-                nodes_by_parent[copy_node.parent_id] = []
-            nodes_by_parent[copy_node.parent_id].append(copy_node)
+    def _set_copied_paths(self, cursor, copy_map, copy_id):
+        """
+        Sets the paths of the copied nodes, from the path of the parent of the root of
+        the copy, and the copies of the ancestors in the path of each source node. The
+        ancestors of the root of the source are not in copy_map, so are left out.
+        """
+        parent_id = self.filter(pk=copy_id).values_list("parent_id", flat=True).get()
+        cursor.execute(
+            """
+            UPDATE {node_table} AS node
+            SET path = %(prefix)s::varchar(32)[] || ARRAY(
+                SELECT ancestor_map.id
+                FROM UNNEST(source.path) WITH ORDINALITY AS ancestor (source_id, position)
+                JOIN {copy_map} AS ancestor_map ON ancestor_map.source_id = ancestor.source_id
+                ORDER BY ancestor.position
+            )::varchar(32)[]
+            FROM {copy_map} AS map
+            JOIN {node_table} AS source ON source.id = map.source_id
+            WHERE node.id = map.id
+            """.format(node_table=self.model._meta.db_table, copy_map=copy_map),
+            {"prefix": self.get_child_path(parent_id)},
+        )
 
-        source_copy_id_map = {}
+    def _create_copied_aggregates(self, cursor, copy_map):
+        """
+        Stores the descendant counts for the copied nodes, counting
+        the contributions of descendants as in node_aggregate_contribution.
+        """
+        from contentcuration.models import ContentNodeAggregate
 
-        data = self._recurse_to_create_tree(
-            node,
-            target.id if target else None,
-            source_channel_id,
-            nodes_by_parent,
-            source_copy_id_map,
-            can_edit_source_channel,
-            pk,
-            mods,
+        cursor.execute(
+            """
+            INSERT INTO {aggregate_table} (
+                contentnode_id, resource_count, coach_count, error_count, updated_count, new_count
+            )
+            SELECT
+                map.id,
+                COUNT(descendant.id) FILTER (WHERE descendant.kind_id <> %(topic)s),
+                COUNT(descendant.id) FILTER (
+                    WHERE descendant.kind_id <> %(topic)s AND descendant.role_visibility = %(coach)s
+                ),
+                COUNT(descendant.id) FILTER (WHERE NOT descendant.complete),
+                COUNT(descendant.id) FILTER (
+                    WHERE descendant.kind_id <> %(topic)s AND descendant.changed AND descendant.published
+                ),
+                COUNT(descendant.id) FILTER (
+                    WHERE descendant.kind_id <> %(topic)s AND descendant.changed AND NOT descendant.published
+                )
+            FROM {copy_map} AS map
+            JOIN {node_table} AS node ON node.id = map.id
+            LEFT JOIN {node_table} AS descendant
+                ON descendant.tree_id = node.tree_id
+                AND descendant.lft > node.lft
+                AND descendant.rght < node.rght
+            GROUP BY map.id
+            """.format(
+                aggregate_table=ContentNodeAggregate._meta.db_table,
+                node_table=self.model._meta.db_table,
+                copy_map=copy_map,
+            ),
+            {"topic": content_kinds.TOPIC, "coach": roles.COACH},
         )
 
-        with self.lock_mptt(target.tree_id if target else None):
+    def _deep_copy(
+        self,
+        node,
+        target,
+        position,
+        source_channel_id,
+        pk,
+        mods,
+        excluded_nodes,
+        can_edit_source_channel,
+        batch_sizer=None,
+    ):
+        """
+        Copies a whole subtree with INSERT ... SELECT statements, so that none of the
+        copied rows have to be loaded into Python. Returns a list of the root of the copy.
+        """
+        copy_map = "contentnode_copy_{}".format(uuid.uuid4().hex)
+
+        # Always open a transaction, as there is no tree to lock when copying to a
+        # new tree, so that the nodes and the map are only kept if the copy succeeds.
+        with transaction.atomic(), self.lock_mptt(
+            target.tree_id if target else None, operation="copy"
+        ) as lock, connection.cursor() as cursor:
             if target:
                 self._mptt_refresh(target)
-            nodes_to_create = self.build_tree_nodes(
-                data, target=target, position=position
+            # The map must be created before space is made for the copy, as the
+            # source nodes may be in the same tree as the target.
+            total_nodes, width = self._create_copy_map(
+                cursor, copy_map, node, pk, excluded_nodes
             )
-            new_nodes = self.bulk_create(nodes_to_create)
+            tree_id, cursor_position, level = self._make_space(target, position, width)
+            self._insert_copied_nodes(
+                cursor,
+                copy_map,
+                target,
+                tree_id,
+                cursor_position,
+                level,
+                source_channel_id,
+                can_edit_source_channel,
+            )
+            cursor.execute(
+                "SELECT id FROM {} WHERE source_id = %s".format(copy_map), (node.id,)
+            )
+            copy_id = cursor.fetchone()[0]
+            self._fill_copied_original_attributes(cursor, copy_map)
+            self._set_copied_paths(cursor, copy_map, copy_id)
+            if isinstance(mods, dict):
+                self.filter(pk=copy_id).update(**mods)
+
+            self._create_copied_aggregates(cursor, copy_map)
+            self.update_ancestor_aggregates(copy_id, self.get_subtree_aggregates(copy_id))
+            if target and not target.changed:
+                # Marking the target as changed may change the counts of its ancestors
+                target_values = {f: getattr(target, f) for f in AGGREGATE_SOURCE_FIELDS}
+                self.update_ancestor_aggregates(
+                    target.pk,
+                    aggregate_delta(target_values, dict(target_values, changed=True)),
+                )
+
+        # The files, assessment items and tags don't change the tree, so are copied
+        # after the lock on the target tree has been released.
+        try:
+            with transaction.atomic():
+                self._copy_associated_objects(copy_map)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("DROP TABLE IF EXISTS {}".format(copy_map))
+
+        if batch_sizer:
+            batch_sizer.record(total_nodes, lock.hold_time)
         if target:
             self.filter(pk=target.pk).update(changed=True)
 
-        self._copy_associated_objects(source_copy_id_map, contentnode__in=nodes_to_copy)
-
-        increment_progress(len(nodes_to_copy))
+        increment_progress(total_nodes)
 
-        return new_nodes
+        return [self.get(pk=copy_id)]
 
-    def build_tree_nodes(self, data, target=None, position="last-child"):
+    def _get_insert_position(self, target, position):
         """
-        vendored from:
-        https://github.com/django-mptt/django-mptt/blob/fe2b9cc8cfd8f4b764d294747dba2758147712eb/mptt/managers.py#L614
+        Returns the tree_id, lft and level for a new subtree inserted at position
+        relative to target, or for a new tree if there is no target.
         """
         opts = self.model._mptt_meta
         if target:
-            tree_id = target.tree_id
+            tree_id = getattr(target, opts.tree_id_attr)
             if position in ("left", "right"):
                 level = getattr(target, opts.level_attr)
                 if position == "left":
@@ -637,26 +1585,313 @@ class CustomContentNodeTreeManager(TreeManager.from_queryset(CustomTreeQuerySet)
             tree_id = self._get_next_tree_id()
             cursor = 1
             level = 0
+        return tree_id, cursor, level
+
+    def _free_interval(self, target, position):
+        """
+        Returns the parent of a node inserted at position relative to target, as a dict of its
+        mptt values, and the lft/rght values bounding the free interval at that position, which
+        are those of the neighbouring siblings, or of the parent where there are none.
+        """
+        if position in ("first-child", "last-child"):
+            parent_id = target.id
+        else:
+            parent_id = target.parent_id
+        parent = self.filter(pk=parent_id).values("id", "lft", "rght", "level").get()
+        siblings = self.filter(parent_id=parent_id).order_by()
+        if position == "first-child":
+            low = parent["lft"]
+            high = siblings.aggregate(value=Min("lft"))["value"] or parent["rght"]
+        elif position == "last-child":
+            low = siblings.aggregate(value=Max("rght"))["value"] or parent["lft"]
+            high = parent["rght"]
+        elif position == "left":
+            low = (
+                siblings.filter(rght__lt=target.lft).aggregate(value=Max("rght"))["value"]
+                or parent["lft"]
+            )
+            high = target.lft
+        else:
+            low = target.rght
+            high = (
+                siblings.filter(lft__gt=target.rght).aggregate(value=Min("lft"))["value"]
+                or parent["rght"]
+            )
+        return parent, low, high
+
+    def _local_space(self, parent, low, size):
+        """
+        Finds the closest ancestor-or-self of parent that has at least size free values after
+        its last child, and which contains values after low, so that shifting the values between
+        low and its rght leaves the rest of the tree untouched.
+        Returns its rght and the number of free values after its last child, or None if there is
+        no such ancestor.
+        """
+        last_child_rght = (
+            self.filter(parent_id=OuterRef("id")).order_by("-rght").values("rght")[:1]
+        )
+        ancestors = (
+            self.filter(
+                tree_id=parent["tree_id"], lft__lte=parent["lft"], rght__gte=parent["rght"]
+            )
+            .annotate(last_child_rght=Subquery(last_child_rght))
+            .order_by("-lft")
+            .values("lft", "rght", "last_child_rght")
+        )
+        for ancestor in ancestors:
+            inner = ancestor["last_child_rght"] or ancestor["lft"]
+            free = ancestor["rght"] - 1 - inner
+            if inner > low and free >= size:
+                return ancestor["rght"], free
+        return None
+
+    def _shift_interval(self, size, target, limit, tree_id):
+        """
+        Like _create_space, but only shifts the lft and rght values between target and limit.
+        """
+        self.filter(tree_id=tree_id).filter(
+            Q(lft__gt=target, lft__lt=limit) | Q(rght__gt=target, rght__lt=limit)
+        ).update(
+            lft=Case(
+                When(lft__gt=target, lft__lt=limit, then=F("lft") + size),
+                default=F("lft"),
+            ),
+            rght=Case(
+                When(rght__gt=target, rght__lt=limit, then=F("rght") + size),
+                default=F("rght"),
+            ),
+        )
+
+    def _make_sparse_space(self, target, position, width, gap):
+        """
+        Finds space for a new subtree in the free interval at its position, only renumbering
+        when the interval is too small. Then the values after the interval are shifted into the
+        free values after the last child of the closest ancestor that has enough of them, taking
+        up to gap extra values for later inserts. When no ancestor has enough, the whole tree is
+        laid out again with gap free values after every child node, and the rest of the tree is
+        only shifted if that still leaves too little room.
+        """
+        tree_id = target.tree_id
+        parent, low, high = self._free_interval(target, position)
+        free = high - low - 1
+        if free < width:
+            required = width - free
+            local_space = self._local_space(dict(parent, tree_id=tree_id), low, required)
+            if local_space:
+                limit, available = local_space
+                size = required + min(gap, (available - required) // 2)
+                self._shift_interval(size, low, limit, tree_id)
+                free += size
+            else:
+                self._renumber_tree(tree_id, gap)
+                self._mptt_refresh(target)
+                parent, low, high = self._free_interval(target, position)
+                free = high - low - 1
+                if free < width:
+                    size = width - free + gap
+                    self._create_space(size, low, tree_id)
+                    free += size
+        offset = 0
+        if position != "last-child":
+            # Leave some of the free values before the new subtree,
+            # as there may be further inserts on either side of it
+            offset = min(gap, free - width) // 2
+        return tree_id, low + 1 + offset, parent["level"] + 1
+
+    def _make_space(self, target, position, width):
+        """
+        Makes space for a new subtree that spans width lft/rght values, at position relative
+        to target, or in a new tree if there is no target.
+        Returns the tree_id, lft and level for the root of the subtree.
+        """
+        if target and settings.MPTT_SPARSE_GAP and not self.model._mptt_is_tracking:
+            return self._make_sparse_space(
+                target, position, width, settings.MPTT_SPARSE_GAP
+            )
+        tree_id, cursor, level = self._get_insert_position(target, position)
+        if target:
+            self._create_space(width, cursor - 1, tree_id)
+        return tree_id, cursor, level
+
+    def build_tree_nodes(self, data, target=None, position="last-child"):
+        """
+        vendored from:
+        https://github.com/django-mptt/django-mptt/blob/fe2b9cc8cfd8f4b764d294747dba2758147712eb/mptt/managers.py#L614
+        """
+        opts = self.model._mptt_meta
 
         stack = []
 
-        def treeify(data, cursor=1, level=0):
+        def treeify(data, cursor=1, level=0, path=()):
             data = dict(data)
             children = data.pop("children", [])
             node = self.model(**data)
             stack.append(node)
-            setattr(node, opts.tree_id_attr, tree_id)
             setattr(node, opts.level_attr, level)
             setattr(node, opts.left_attr, cursor)
+            node.path = list(path)
             for child in children:
-                cursor = treeify(child, cursor=cursor + 1, level=level + 1)
+                cursor = treeify(
+                    child, cursor=cursor + 1, level=level + 1, path=node.path + [node.pk]
+                )
             cursor += 1
             setattr(node, opts.right_attr, cursor)
             return cursor
 
-        treeify(data, cursor=cursor, level=level)
+        # Lay out the nodes relative to the root, then move them into the space made for them
+        treeify(data)
 
-        if target:
-            self._create_space(2 * len(stack), cursor - 1, tree_id)
+        tree_id, cursor, level = self._make_space(target, position, 2 * len(stack))
+
+        if target is None:
+            parent_id = None
+        elif position in ("first-child", "last-child"):
+            parent_id = target.pk
+        else:
+            parent_id = target.parent_id
+        prefix = self.get_child_path(parent_id)
+
+        for node in stack:
+            node.path = prefix + node.path
+            setattr(node, opts.tree_id_attr, tree_id)
+            setattr(node, opts.level_attr, getattr(node, opts.level_attr) + level)
+            setattr(node, opts.left_attr, getattr(node, opts.left_attr) + cursor - 1)
+            setattr(node, opts.right_attr, getattr(node, opts.right_attr) + cursor - 1)
 
         return stack
+
+
+class StorageLedgerManager(Manager):
+    """
+    Keeps the StorageLedger up to date, by recounting the active files of each
+    pair of user and checksum that has been affected by a change.
+    """
+
+    def _active_files_sql(self):
+        """
+        SQL for the files that count towards the storage used by the user that uploaded them,
+        which are those in the main tree of a channel that is not deleted, and that the user edits
+        """
+        from contentcuration.models import Channel
+        from contentcuration.models import ChannelTree
+        from contentcuration.models import File
+        from contentcuration.models import FormatPreset
+
+        return """
+            SELECT
+                file.id,
+                file.uploaded_by_id,
+                file.checksum,
+                file.file_size,
+                preset.kind_id
+            FROM {file_table} AS file
+            JOIN {node_table} AS node ON node.id = file.contentnode_id
+            JOIN {tree_table} AS tree ON tree.tree_id = node.tree_id AND tree.tree_name = 'main_tree'
+            JOIN {channel_table} AS channel ON channel.id = tree.channel_id AND NOT channel.deleted
+            JOIN {editor_table} AS editor
+                ON editor.channel_id = channel.id AND editor.user_id = file.uploaded_by_id
+            LEFT JOIN {preset_table} AS preset ON preset.id = file.preset_id
+        """.format(
+            file_table=File._meta.db_table,
+            node_table=File._meta.get_field("contentnode").related_model._meta.db_table,
+            tree_table=ChannelTree._meta.db_table,
+            channel_table=Channel._meta.db_table,
+            editor_table=Channel.editors.through._meta.db_table,
+            preset_table=FormatPreset._meta.db_table,
+        )
+
+    def update(self, pairs_sql, params=None):
+        """
+        Recounts the active files for each pair of user and checksum selected by pairs_sql,
+        as its user_id and checksum columns.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH pairs AS (
+                    SELECT DISTINCT pairs.user_id, pairs.checksum
+                    FROM ({pairs}) AS pairs
+                    WHERE pairs.user_id IS NOT NULL
+                )
+                INSERT INTO {ledger_table} (user_id, checksum, file_size, kind_id, refcount)
+                SELECT
+                    pairs.user_id,
+                    pairs.checksum,
+                    COALESCE(MAX(file.file_size), 0),
+                    MAX(file.kind_id),
+                    COUNT(file.id)
+                FROM pairs
+                LEFT JOIN ({active_files}) AS file
+                    ON file.uploaded_by_id = pairs.user_id AND file.checksum = pairs.checksum
+                GROUP BY pairs.user_id, pairs.checksum
+                ON CONFLICT (user_id, checksum) DO UPDATE SET
+                    file_size = EXCLUDED.file_size,
+                    kind_id = EXCLUDED.kind_id,
+                    refcount = EXCLUDED.refcount
+                """.format(
+                    pairs=pairs_sql,
+                    ledger_table=self.model._meta.db_table,
+                    active_files=self._active_files_sql(),
+                ),
+                params,
+            )
+
+    def update_for_pairs(self, pairs):
+        """
+        :param pairs: A list of (user_id, checksum) tuples
+        """
+        pairs = [(user_id, checksum) for user_id, checksum in pairs if user_id]
+        if pairs:
+            user_ids, checksums = zip(*pairs)
+            self.update(
+                "SELECT UNNEST(%s::integer[]) AS user_id, UNNEST(%s::text[]) AS checksum",
+                [list(user_ids), list(checksums)],
+            )
+
+    def update_for_files(self, files):
+        """
+        :param files: A File queryset
+        """
+        sql, params = files.values("uploaded_by_id", "checksum").query.sql_with_params()
+        self.update(
+            "SELECT files.uploaded_by_id AS user_id, files.checksum FROM ({}) AS files".format(sql),
+            params,
+        )
+
+    def reconcile(self, user_ids=None):
+        """
+        Recounts all of the active files of the users with user_ids, or of every user
+        """
+        user_filter = "" if user_ids is None else "WHERE file.uploaded_by_id = ANY(%(user_ids)s)"
+        params = {"user_ids": list(user_ids or [])}
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {ledger_table} {user_filter}".format(
+                    ledger_table=self.model._meta.db_table,
+                    user_filter="" if user_ids is None else "WHERE user_id = ANY(%(user_ids)s)",
+                ),
+                params,
+            )
+            cursor.execute(
+                """
+                INSERT INTO {ledger_table} (user_id, checksum, file_size, kind_id, refcount)
+                SELECT
+                    file.uploaded_by_id,
+                    file.checksum,
+                    COALESCE(MAX(file.file_size), 0),
+                    MAX(file.kind_id),
+                    COUNT(file.id)
+                FROM ({active_files}) AS file
+                {user_filter}
+                GROUP BY file.uploaded_by_id, file.checksum
+                ON CONFLICT (user_id, checksum) DO UPDATE SET
+                    file_size = EXCLUDED.file_size,
+                    kind_id = EXCLUDED.kind_id,
+                    refcount = EXCLUDED.refcount
+                """.format(
+                    ledger_table=self.model._meta.db_table,
+                    active_files=self._active_files_sql(),
+                    user_filter=user_filter,
+                ),
+                params,
+            )
@@ -1,7 +1,6 @@
 import logging as logmodule
 
 from django.core.management.base import BaseCommand
-from django.db import transaction
 
 from contentcuration.models import ChannelResourceSize
 logmodule.basicConfig()
@@ -12,12 +11,19 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--init', action='store_true', dest='init', default=False)
+        # Only bring the TreeResourceSize summary up to date, without refreshing the view
+        parser.add_argument('--incremental', action='store_true', dest='incremental', default=False)
+        # Lock out readers of the view while it is refreshed, which is faster
+        parser.add_argument('--blocking', action='store_true', dest='blocking', default=False)
 
     def handle(self, *args, **options):
         if options['init']:
             logging.debug("Initializing channel resource sizes")
             ChannelResourceSize.initialize_view()
-        else:
+        elif not options['incremental']:
             logging.debug("Recalculating channel resource sizes")
-            with transaction.atomic():
-                ChannelResourceSize.refresh_view()
+            ChannelResourceSize.refresh_view(concurrently=not options['blocking'])
+        # Every run drains the log of changed trees, and calculates the sizes of any
+        # main trees that do not have one, such as the first time this is run
+        tree_count = ChannelResourceSize.refresh_summary()
+        logging.debug("Recalculated resource sizes for {} changed trees".format(tree_count))
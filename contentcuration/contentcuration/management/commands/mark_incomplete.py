@@ -44,4 +44,10 @@ class Command(BaseCommand):
         ).values_list('id', flat=True)
 
         # Getting an error on bulk update with the annotations, so query again
-        ContentNode.objects.filter(pk__in=invalid_nodes).update(complete=False)
+        invalid_nodes = ContentNode.objects.filter(pk__in=invalid_nodes)
+        tree_ids = list(invalid_nodes.filter(complete=True).order_by().values_list('tree_id', flat=True).distinct())
+        invalid_nodes.update(complete=False)
+
+        # Error counts of ancestors are not updated by queryset updates, so recalculate them
+        for tree_id in tree_ids:
+            ContentNode.objects.rebuild_aggregates(tree_id)
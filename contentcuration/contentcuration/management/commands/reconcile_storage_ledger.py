@@ -0,0 +1,19 @@
+import logging as logmodule
+
+from django.core.management.base import BaseCommand
+
+from contentcuration.models import StorageLedger
+logmodule.basicConfig()
+logging = logmodule.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, dest='user_ids', action='append', default=[])
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids'] or None
+
+        logging.debug("Recounting the storage used by {}".format(user_ids or "every user"))
+        StorageLedger.objects.reconcile(user_ids)
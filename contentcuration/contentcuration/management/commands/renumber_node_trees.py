@@ -0,0 +1,35 @@
+import logging as logmodule
+
+from django.core.management.base import BaseCommand
+
+from contentcuration.models import Channel
+from contentcuration.models import CHANNEL_TREES
+from contentcuration.models import ContentNode
+logmodule.basicConfig()
+logging = logmodule.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channel-id', type=str, dest='channel_ids', action='append', default=[])
+        parser.add_argument('--tree-id', type=int, dest='tree_ids', action='append', default=[])
+        parser.add_argument(
+            '--gap', type=int, default=0,
+            help='Free lft/rght values to leave after every child node, by default trees are compacted to dense values'
+        )
+
+    def handle(self, *args, **options):
+        tree_ids = set(options['tree_ids'])
+        channel_tree_ids = Channel.objects.filter(pk__in=options['channel_ids']).values_list(
+            *["{}__tree_id".format(tree_name) for tree_name in CHANNEL_TREES]
+        )
+        for ids in channel_tree_ids:
+            tree_ids.update(tree_id for tree_id in ids if tree_id is not None)
+
+        if not tree_ids and not options['channel_ids']:
+            tree_ids = ContentNode.objects.order_by().values_list('tree_id', flat=True).distinct()
+
+        for tree_id in tree_ids:
+            logging.debug("Renumbering tree {}".format(tree_id))
+            ContentNode.objects.renumber_tree(tree_id, gap=options['gap'])
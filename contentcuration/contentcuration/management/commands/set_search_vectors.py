@@ -0,0 +1,51 @@
+import logging as logmodule
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from contentcuration.models import ContentNode
+logmodule.basicConfig()
+logging = logmodule.getLogger(__name__)
+
+BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    """
+    Fills in the search vectors of nodes that don't have one yet, such as those created before
+    the search vector triggers were added, in batches ordered by id so that each batch is a
+    short transaction of its own. Nodes are only found by keyword searches once this has run.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size', default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        last_id = ""
+        total = 0
+        with connection.cursor() as cursor:
+            while last_id is not None:
+                cursor.execute(
+                    """
+                    WITH batch AS (
+                        SELECT id FROM {node_table}
+                        WHERE id > %(last_id)s
+                        ORDER BY id
+                        LIMIT %(batch_size)s
+                    ), updated AS (
+                        UPDATE {node_table} AS node
+                        SET search_vector = contentcuration_contentnode_search_vector(
+                            node.id, node.title, node.description, node.author, node.language_id
+                        )
+                        FROM batch
+                        WHERE node.id = batch.id
+                        AND node.search_vector IS NULL
+                        RETURNING node.id
+                    )
+                    SELECT (SELECT MAX(id) FROM batch), (SELECT COUNT(*) FROM updated)
+                    """.format(node_table=ContentNode._meta.db_table),
+                    {"last_id": last_id, "batch_size": options['batch_size']},
+                )
+                last_id, updated = cursor.fetchone()
+                total += updated
+                logging.debug("Set the search vectors of {} nodes".format(total))
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2020-10-02 18:04
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contentcuration", "0123_auto_20200921_1536"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContentNodeAggregate",
+            fields=[
+                (
+                    "contentnode",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="aggregates",
+                        serialize=False,
+                        to="contentcuration.ContentNode",
+                    ),
+                ),
+                ("resource_count", models.IntegerField(default=0)),
+                ("coach_count", models.IntegerField(default=0)),
+                ("error_count", models.IntegerField(default=0)),
+                ("updated_count", models.IntegerField(default=0)),
+                ("new_count", models.IntegerField(default=0)),
+            ],
+        ),
+    ]
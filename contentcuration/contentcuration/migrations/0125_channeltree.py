@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2020-10-05 17:22
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+CHANNEL_TREES = (
+    "main_tree",
+    "chef_tree",
+    "trash_tree",
+    "staging_tree",
+    "previous_tree",
+)
+
+POPULATE_CHANNEL_TREES_SQL = """
+INSERT INTO contentcuration_channeltree (tree_id, channel_id, tree_name, root_id)
+{}
+""".format(
+    " UNION ALL ".join(
+        """
+        SELECT node.tree_id, channel.id, '{tree_name}', node.id
+        FROM contentcuration_channel AS channel
+        INNER JOIN contentcuration_contentnode AS node ON node.id = channel.{tree_name}_id
+        """.format(tree_name=tree_name)
+        for tree_name in CHANNEL_TREES
+    )
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contentcuration", "0124_contentnodeaggregate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChannelTree",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tree_id", models.IntegerField()),
+                (
+                    "tree_name",
+                    models.CharField(
+                        choices=[
+                            ("main_tree", "main_tree"),
+                            ("chef_tree", "chef_tree"),
+                            ("trash_tree", "trash_tree"),
+                            ("staging_tree", "staging_tree"),
+                            ("previous_tree", "previous_tree"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "channel",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tree_lookups",
+                        to="contentcuration.Channel",
+                    ),
+                ),
+                (
+                    "root",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="contentcuration.ContentNode",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name="channeltree", unique_together=set([("channel", "tree_name")]),
+        ),
+        migrations.AlterIndexTogether(
+            name="channeltree", index_together=set([("tree_id", "tree_name")]),
+        ),
+        migrations.RunSQL(POPULATE_CHANNEL_TREES_SQL, migrations.RunSQL.noop),
+    ]
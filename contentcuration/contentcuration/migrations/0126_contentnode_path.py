@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2020-10-12 09:21
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+import contentcuration.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contentcuration", "0125_channeltree"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contentnode",
+            name="path",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=contentcuration.models.UUIDField(max_length=32),
+                blank=True,
+                default=list,
+                size=None,
+            ),
+        ),
+        # Fill in the paths of existing nodes, walking down from the root of every tree
+        migrations.RunSQL(
+            """
+            WITH RECURSIVE paths (id, path) AS (
+                SELECT id, ARRAY[]::varchar(32)[]
+                FROM contentcuration_contentnode
+                WHERE parent_id IS NULL
+                UNION ALL
+                SELECT node.id, paths.path || node.parent_id
+                FROM contentcuration_contentnode AS node
+                JOIN paths ON node.parent_id = paths.id
+            )
+            UPDATE contentcuration_contentnode AS node
+            SET path = paths.path
+            FROM paths
+            WHERE node.id = paths.id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="contentnode",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["path"], name="node_path_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2020-10-15 10:12
+from __future__ import unicode_literals
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contentcuration", "0126_contentnode_path"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StorageLedger",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("checksum", models.CharField(max_length=400)),
+                ("file_size", models.IntegerField(default=0)),
+                ("refcount", models.IntegerField(default=0)),
+                (
+                    "kind",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="contentcuration.ContentKind",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="storage_ledger",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name="storageledger", unique_together=set([("user", "checksum")]),
+        ),
+        # Count the active files of every user
+        migrations.RunSQL(
+            """
+            INSERT INTO contentcuration_storageledger (user_id, checksum, file_size, kind_id, refcount)
+            SELECT
+                file.uploaded_by_id,
+                file.checksum,
+                COALESCE(MAX(file.file_size), 0),
+                MAX(preset.kind_id),
+                COUNT(file.id)
+            FROM contentcuration_file AS file
+            JOIN contentcuration_contentnode AS node ON node.id = file.contentnode_id
+            JOIN contentcuration_channeltree AS tree
+                ON tree.tree_id = node.tree_id AND tree.tree_name = 'main_tree'
+            JOIN contentcuration_channel AS channel
+                ON channel.id = tree.channel_id AND NOT channel.deleted
+            JOIN contentcuration_channel_editors AS editor
+                ON editor.channel_id = channel.id AND editor.user_id = file.uploaded_by_id
+            LEFT JOIN contentcuration_formatpreset AS preset ON preset.id = file.preset_id
+            GROUP BY file.uploaded_by_id, file.checksum
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
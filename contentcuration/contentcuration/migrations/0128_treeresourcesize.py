@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2020-10-15 16:38
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contentcuration", "0127_storageledger"),
+    ]
+
+    operations = [
+        # The view is created by the calculateresources command, so it may not exist
+        migrations.RunSQL(
+            """
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_matviews WHERE matviewname = 'contentcuration_channel_resource_sizes'
+                ) THEN
+                    CREATE UNIQUE INDEX IF NOT EXISTS channel_resource_sizes_id_idx
+                    ON contentcuration_channel_resource_sizes (id);
+                END IF;
+            END
+            $$
+            """,
+            "DROP INDEX IF EXISTS channel_resource_sizes_id_idx",
+        ),
+        migrations.CreateModel(
+            name="TreeResourceSize",
+            fields=[
+                ("tree_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("resource_size", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TreeResourceSizeChange",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tree_id", models.IntegerField()),
+            ],
+        ),
+    ]
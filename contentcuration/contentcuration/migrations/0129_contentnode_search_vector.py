@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2020-10-15 16:02
+from __future__ import unicode_literals
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contentcuration", "0128_treeresourcesize"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contentnode",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                blank=True, editable=False, null=True
+            ),
+        ),
+        # The text search configuration for a language, from the base language of its code
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION contentcuration_search_config(language_id varchar)
+            RETURNS regconfig AS $$
+                SELECT (CASE lower(split_part(replace($1, '_', '-'), '-', 1))
+                    WHEN 'da' THEN 'danish'
+                    WHEN 'de' THEN 'german'
+                    WHEN 'en' THEN 'english'
+                    WHEN 'es' THEN 'spanish'
+                    WHEN 'fi' THEN 'finnish'
+                    WHEN 'fr' THEN 'french'
+                    WHEN 'hu' THEN 'hungarian'
+                    WHEN 'it' THEN 'italian'
+                    WHEN 'nb' THEN 'norwegian'
+                    WHEN 'nl' THEN 'dutch'
+                    WHEN 'no' THEN 'norwegian'
+                    WHEN 'pt' THEN 'portuguese'
+                    WHEN 'ro' THEN 'romanian'
+                    WHEN 'ru' THEN 'russian'
+                    WHEN 'sv' THEN 'swedish'
+                    WHEN 'tr' THEN 'turkish'
+                    ELSE 'simple'
+                END)::regconfig
+            $$ LANGUAGE sql IMMUTABLE;
+
+            CREATE OR REPLACE FUNCTION contentcuration_contentnode_search_vector(
+                node_id varchar, title text, description text, author text, language_id varchar
+            )
+            RETURNS tsvector AS $$
+                SELECT
+                    setweight(to_tsvector(contentcuration_search_config($5), coalesce($2, '')), 'A')
+                    || setweight(to_tsvector(contentcuration_search_config($5), coalesce($3, '')), 'B')
+                    || setweight(to_tsvector(contentcuration_search_config($5), coalesce((
+                        SELECT string_agg(tag.tag_name, ' ')
+                        FROM contentcuration_contentnode_tags AS node_tag
+                        JOIN contentcuration_contenttag AS tag ON tag.id = node_tag.contenttag_id
+                        WHERE node_tag.contentnode_id = $1
+                    ), '')), 'C')
+                    || setweight(to_tsvector('simple', coalesce($4, '')), 'D')
+            $$ LANGUAGE sql STABLE;
+
+            CREATE OR REPLACE FUNCTION contentcuration_contentnode_search_vector_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                NEW.search_vector := contentcuration_contentnode_search_vector(
+                    NEW.id, NEW.title, NEW.description, NEW.author, NEW.language_id
+                );
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION contentcuration_contentnode_tags_search_vector_trigger()
+            RETURNS trigger AS $$
+            DECLARE
+                tagged_node_id varchar;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    tagged_node_id := OLD.contentnode_id;
+                ELSE
+                    tagged_node_id := NEW.contentnode_id;
+                END IF;
+                UPDATE contentcuration_contentnode
+                SET search_vector = contentcuration_contentnode_search_vector(
+                    id, title, description, author, language_id
+                )
+                WHERE id = tagged_node_id;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION contentcuration_contenttag_search_vector_trigger()
+            RETURNS trigger AS $$
+            BEGIN
+                UPDATE contentcuration_contentnode AS node
+                SET search_vector = contentcuration_contentnode_search_vector(
+                    node.id, node.title, node.description, node.author, node.language_id
+                )
+                FROM contentcuration_contentnode_tags AS node_tag
+                WHERE node_tag.contenttag_id = NEW.id
+                AND node.id = node_tag.contentnode_id;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER contentnode_search_vector
+            BEFORE INSERT OR UPDATE OF title, description, author, language_id
+            ON contentcuration_contentnode
+            FOR EACH ROW EXECUTE PROCEDURE contentcuration_contentnode_search_vector_trigger();
+
+            CREATE TRIGGER contentnode_tags_search_vector
+            AFTER INSERT OR DELETE
+            ON contentcuration_contentnode_tags
+            FOR EACH ROW EXECUTE PROCEDURE contentcuration_contentnode_tags_search_vector_trigger();
+
+            -- Renaming a tag changes the vectors of every node tagged with it
+            CREATE TRIGGER contenttag_search_vector
+            AFTER UPDATE OF tag_name
+            ON contentcuration_contenttag
+            FOR EACH ROW WHEN (OLD.tag_name IS DISTINCT FROM NEW.tag_name)
+            EXECUTE PROCEDURE contentcuration_contenttag_search_vector_trigger();
+            """,
+            """
+            DROP TRIGGER IF EXISTS contenttag_search_vector ON contentcuration_contenttag;
+            DROP TRIGGER IF EXISTS contentnode_tags_search_vector ON contentcuration_contentnode_tags;
+            DROP TRIGGER IF EXISTS contentnode_search_vector ON contentcuration_contentnode;
+            DROP FUNCTION IF EXISTS contentcuration_contenttag_search_vector_trigger();
+            DROP FUNCTION IF EXISTS contentcuration_contentnode_tags_search_vector_trigger();
+            DROP FUNCTION IF EXISTS contentcuration_contentnode_search_vector_trigger();
+            DROP FUNCTION IF EXISTS contentcuration_contentnode_search_vector(varchar, text, text, text, varchar);
+            DROP FUNCTION IF EXISTS contentcuration_search_config(varchar);
+            """,
+        ),
+        # The search vectors of existing nodes are filled in, in batches,
+        # by the set_search_vectors command rather than in this migration
+        migrations.AddIndex(
+            model_name="contentnode",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="node_search_vector_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2020-10-16 09:40
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# The columns matched by substring or regular expression in the keyword filters,
+# which pg_trgm GIN indexes can be used for, as (index name, table, column)
+TRIGRAM_INDEXES = [
+    ("node_author_trgm_idx", "contentcuration_contentnode", "author"),
+    ("node_aggregator_trgm_idx", "contentcuration_contentnode", "aggregator"),
+    ("node_provider_trgm_idx", "contentcuration_contentnode", "provider"),
+    ("channel_name_trgm_idx", "contentcuration_channel", "name"),
+    ("user_first_name_trgm_idx", "contentcuration_user", "first_name"),
+    ("user_last_name_trgm_idx", "contentcuration_user", "last_name"),
+    ("user_email_trgm_idx", "contentcuration_user", "email"),
+]
+
+# Only a superuser can create extensions, so pg_trgm is expected to have been installed
+# when the database was set up (see docs/manual_setup.md). Create it here only if it is
+# missing and we are able to, and otherwise explain what needs to be done.
+CREATE_TRIGRAM_EXTENSION_SQL = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') THEN
+        IF NOT (SELECT rolsuper FROM pg_roles WHERE rolname = current_user) THEN
+            RAISE EXCEPTION 'The pg_trgm extension is not installed'
+                USING HINT = 'Run CREATE EXTENSION pg_trgm; in this database as a superuser';
+        END IF;
+        CREATE EXTENSION pg_trgm;
+    END IF;
+END
+$$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    # Create the indexes concurrently, so that writes are not blocked while they build
+    atomic = False
+
+    dependencies = [
+        ("contentcuration", "0129_contentnode_search_vector"),
+    ]
+
+    operations = [migrations.RunSQL(CREATE_TRIGRAM_EXTENSION_SQL, migrations.RunSQL.noop)] + [
+        migrations.RunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} USING gin ({} gin_trgm_ops)".format(
+                index_name, table, column
+            ),
+            "DROP INDEX CONCURRENTLY IF EXISTS {}".format(index_name),
+        )
+        for index_name, table, column in TRIGRAM_INDEXES
+    ]
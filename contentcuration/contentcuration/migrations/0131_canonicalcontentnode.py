@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2020-10-16 14:25
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+import contentcuration.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contentcuration", "0130_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CanonicalContentNode",
+            fields=[
+                (
+                    "content_id",
+                    contentcuration.models.UUIDField(
+                        max_length=32, primary_key=True, serialize=False
+                    ),
+                ),
+                (
+                    "location_ids",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=contentcuration.models.UUIDField(max_length=32),
+                        default=list,
+                        size=None,
+                    ),
+                ),
+                (
+                    "tree_ids",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.IntegerField(), default=list, size=None
+                    ),
+                ),
+                (
+                    "node",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="canonical_content",
+                        to="contentcuration.ContentNode",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="canonicalcontentnode",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["tree_ids"], name="canonical_node_tree_ids_idx"
+            ),
+        ),
+        # Find the canonical nodes of all the content in public channels
+        migrations.RunSQL(
+            """
+            INSERT INTO contentcuration_canonicalcontentnode (content_id, node_id, location_ids, tree_ids)
+            SELECT
+                node.content_id,
+                (ARRAY_AGG(
+                    node.id ORDER BY (node.original_source_node_id = node.node_id) IS NOT TRUE, node.created
+                ))[1],
+                ARRAY_AGG(node.id),
+                ARRAY_AGG(DISTINCT node.tree_id)
+            FROM contentcuration_contentnode AS node
+            JOIN contentcuration_channeltree AS channel_tree
+                ON channel_tree.tree_id = node.tree_id AND channel_tree.tree_name = 'main_tree'
+            JOIN contentcuration_channel AS channel
+                ON channel.id = channel_tree.channel_id AND channel.public AND NOT channel.deleted
+            GROUP BY node.content_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
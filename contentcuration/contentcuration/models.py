@@ -11,6 +11,7 @@ import logging
 import os
 import urllib.parse
 import uuid
+from collections import Counter
 from datetime import datetime
 
 import pytz
@@ -18,7 +19,10 @@ from django.conf import settings
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned
 from django.core.exceptions import ObjectDoesNotExist
@@ -30,6 +34,8 @@ from django.core.mail import send_mail
 from django.db import connection
 from django.db import IntegrityError
 from django.db import models
+from django.db import transaction
+from django.db.models import Case
 from django.db.models import Count
 from django.db.models import Exists
 from django.db.models import Max
@@ -38,6 +44,7 @@ from django.db.models import Q
 from django.db.models import Sum
 from django.db.models import Subquery
 from django.db.models import Value
+from django.db.models import When
 from django.db.models.query_utils import DeferredAttribute
 from django.dispatch import receiver
 from django.utils import timezone
@@ -59,10 +66,20 @@ from rest_framework.authtoken.models import Token
 from contentcuration.db.models.expressions import Array
 from contentcuration.db.models.functions import Unnest
 from contentcuration.db.models.functions import ArrayRemove
+from contentcuration.db.models.manager import aggregate_delta
+from contentcuration.db.models.manager import AGGREGATE_SOURCE_FIELDS
 from contentcuration.db.models.manager import CustomManager
 from contentcuration.db.models.manager import CustomContentNodeTreeManager
+from contentcuration.db.models.manager import negate_aggregates
+from contentcuration.db.models.manager import StorageLedgerManager
 from contentcuration.statistics import record_channel_stats
+from contentcuration.utils.cache import bump_channel_generations
+from contentcuration.utils.cache import bump_tree_revisions
+from contentcuration.utils.cache import bump_user_permissions_generations
+from contentcuration.utils.cache import CHANNEL_CACHE_TIMEOUT
 from contentcuration.utils.cache import delete_public_channel_cache_keys
+from contentcuration.utils.cache import get_channel_generation
+from contentcuration.utils.cache import get_user_permissions_generation
 from contentcuration.utils.parser import load_json_string
 
 EDIT_ACCESS = "edit"
@@ -270,27 +287,25 @@ class User(AbstractBaseUser, PermissionsMixin):
         return True
 
     def check_space(self, size, checksum):
-        active_files = self.get_user_active_files()
-        if active_files.filter(checksum=checksum).exists():
+        if self.get_active_storage().filter(checksum=checksum).exists():
             return True
 
-        space = self.get_available_space(active_files=active_files)
+        space = self.get_available_space()
         if space < size:
             raise PermissionDenied(_("Not enough space. Check your storage under Settings page."))
 
     def check_channel_space(self, channel):
-        active_files = self.get_user_active_files()
-        active_size = float(active_files.aggregate(used=Sum('file_size'))['used'] or 0)
+        active_size = self.get_space_used()
 
         staging_tree_id = channel.staging_tree.tree_id
         channel_files = self.files\
                             .filter(contentnode__tree_id=staging_tree_id)\
                             .values('checksum')\
                             .distinct()\
-                            .exclude(checksum__in=active_files.values_list('checksum', flat=True))
+                            .exclude(checksum__in=self.get_active_storage().values_list('checksum', flat=True))
         staged_size = float(channel_files.aggregate(used=Sum('file_size'))['used'] or 0)
 
-        if self.get_available_space(active_files=active_files) < (active_size + staged_size):
+        if self.get_available_space() < (active_size + staged_size):
             raise PermissionDenied(_('Out of storage! Request more space under Settings > Storage.'))
 
     def check_staged_space(self, size, checksum):
@@ -304,8 +319,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         space_used = self.staged_files.values('checksum').distinct().aggregate(size=Sum("file_size"))['size'] or 0
         return float(max(self.disk_space - space_used, 0))
 
-    def get_available_space(self, active_files=None):
-        return float(max(self.disk_space - self.get_space_used(active_files=active_files), 0))
+    def get_available_space(self):
+        return float(max(self.disk_space - self.get_space_used(), 0))
 
     def get_user_active_trees(self):
         return self.editable_channels.exclude(deleted=True)\
@@ -316,20 +331,24 @@ class User(AbstractBaseUser, PermissionsMixin):
         return self.files.filter(contentnode__tree_id__in=active_trees)\
             .values('checksum').distinct()
 
-    def get_space_used(self, active_files=None):
-        active_files = active_files or self.get_user_active_files()
-        files = active_files.aggregate(total_used=Sum('file_size'))
+    def get_active_storage(self):
+        """
+        The entries of the StorageLedger for the files that count towards the user's storage
+        """
+        return self.storage_ledger.filter(refcount__gt=0)
+
+    def get_space_used(self):
+        files = self.get_active_storage().aggregate(total_used=Sum('file_size'))
         return float(files['total_used'] or 0)
 
     def get_space_used_by_kind(self):
-        active_files = self.get_user_active_files()
-        files = active_files.values('preset__kind_id')\
-                            .annotate(space=Sum('file_size'))\
-                            .order_by()
+        files = self.get_active_storage().values('kind_id')\
+                                         .annotate(space=Sum('file_size'))\
+                                         .order_by()
 
         kind_dict = {}
         for item in files:
-            kind_dict[item['preset__kind_id']] = item['space']
+            kind_dict[item['kind_id']] = item['space']
         return kind_dict
 
     def email_user(self, subject, message, from_email=None, **kwargs):
@@ -552,6 +571,12 @@ class FileOnDiskStorage(FileSystemStorage):
         return super(FileOnDiskStorage, self)._save(name, content)
 
 
+CHANNEL_RESOURCE_SIZE_INDEX_NAME = "channel_resource_sizes_id_idx"
+
+# How many trees without a TreeResourceSize to calculate in each transaction
+SUMMARY_BATCH_SIZE = 100
+
+
 class ChannelResourceSize(models.Model):
     tree_id = models.IntegerField()
     resource_size = models.IntegerField()
@@ -569,18 +594,140 @@ class ChannelResourceSize(models.Model):
               ' WITH DATA;'.format(view=cls.pg_view_name, file_table=cls.file_table, node=cls.node_table)
         with connection.cursor() as cursor:
             cursor.execute(sql)
+            cursor.execute(cls.index_sql())
 
     @classmethod
-    def refresh_view(cls):
-        sql = "REFRESH MATERIALIZED VIEW {}".format(cls.pg_view_name)
+    def index_sql(cls):
+        """
+        A unique index is needed to refresh the view concurrently
+        """
+        return 'CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {view} (id)'.format(
+            index=CHANNEL_RESOURCE_SIZE_INDEX_NAME, view=cls.pg_view_name
+        )
+
+    @classmethod
+    def refresh_view(cls, concurrently=True):
+        """
+        :param concurrently: Refresh the view without locking out readers, which is slower
+        """
+        sql = "REFRESH MATERIALIZED VIEW {}{}".format("CONCURRENTLY " if concurrently else "", cls.pg_view_name)
         with connection.cursor() as cursor:
             cursor.execute(sql)
 
+    @classmethod
+    def _calculate_summary(cls, cursor, tree_ids):
+        cursor.execute(
+            """
+            INSERT INTO {summary_table} (tree_id, resource_size)
+            SELECT tree.tree_id, COALESCE(SUM(files.file_size), 0)
+            FROM UNNEST(%(tree_ids)s::integer[]) AS tree (tree_id)
+            LEFT JOIN (
+                SELECT DISTINCT node.tree_id, file.checksum, file.file_size
+                FROM {node_table} AS node
+                JOIN {file_table} AS file ON file.contentnode_id = node.id
+                WHERE node.tree_id = ANY(%(tree_ids)s::integer[])
+            ) AS files ON files.tree_id = tree.tree_id
+            GROUP BY tree.tree_id
+            ON CONFLICT (tree_id) DO UPDATE SET resource_size = EXCLUDED.resource_size
+            """.format(
+                summary_table=TreeResourceSize._meta.db_table,
+                node_table=cls.node_table,
+                file_table=cls.file_table,
+            ),
+            {"tree_ids": tree_ids},
+        )
+
+    @classmethod
+    def refresh_summary(cls, batch_size=SUMMARY_BATCH_SIZE):
+        """
+        Recalculates the TreeResourceSize of the trees that have changed since the last refresh,
+        as recorded by TreeResourceSizeChange, and removes those of trees that no longer exist.
+        Then calculates the TreeResourceSize of the channel main trees that do not have one,
+        batch_size trees at a time, such as when the summary is first filled, or for trees that
+        were changed while changes were not being tracked.
+        :returns: The number of changed trees that were recalculated
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {change_table} RETURNING tree_id".format(
+                    change_table=TreeResourceSizeChange._meta.db_table
+                )
+            )
+            tree_ids = list(set(tree_id for tree_id, in cursor.fetchall()))
+            if tree_ids:
+                cls._calculate_summary(cursor, tree_ids)
+                cursor.execute(
+                    """
+                    DELETE FROM {summary_table} AS summary
+                    WHERE summary.tree_id = ANY(%(tree_ids)s)
+                    AND NOT EXISTS (SELECT 1 FROM {node_table} AS node WHERE node.tree_id = summary.tree_id)
+                    """.format(summary_table=TreeResourceSize._meta.db_table, node_table=cls.node_table),
+                    {"tree_ids": tree_ids},
+                )
+        if tree_ids:
+            # Channel sizes may have been cached from the sizes before they were recalculated
+            bump_channel_generations(
+                *ChannelTree.objects.filter(tree_id__in=tree_ids).values_list("channel_id", flat=True)
+            )
+
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT tree.tree_id FROM {tree_table} AS tree
+                    WHERE tree.tree_name = 'main_tree'
+                    AND NOT EXISTS (SELECT 1 FROM {summary_table} AS summary WHERE summary.tree_id = tree.tree_id)
+                    LIMIT %(batch_size)s
+                    """.format(
+                        tree_table=ChannelTree._meta.db_table,
+                        summary_table=TreeResourceSize._meta.db_table,
+                    ),
+                    {"batch_size": batch_size},
+                )
+                missing_tree_ids = [tree_id for tree_id, in cursor.fetchall()]
+                if not missing_tree_ids:
+                    break
+                cls._calculate_summary(cursor, missing_tree_ids)
+        return len(tree_ids)
+
     class Meta:
         managed = False
         db_table = "contentcuration_channel_resource_sizes"
 
 
+class TreeResourceSize(models.Model):
+    """
+    The total size of the distinct files in each tree, kept up to date incrementally
+    by ChannelResourceSize.refresh_summary, as an alternative to the view that does
+    not have to recalculate the size of every tree. Channel sizes are read from here
+    when a tree has a size. A tree's size is either current, or the tree has changes
+    waiting in TreeResourceSizeChange, or it is removed when the tree is changed.
+    """
+    tree_id = models.IntegerField(primary_key=True)
+    resource_size = models.BigIntegerField(default=0)
+
+
+class TreeResourceSizeChange(models.Model):
+    """
+    A log of the trees that have changed since the last ChannelResourceSize.refresh_summary,
+    which is only ever inserted into by writers, so that they don't contend on any rows.
+    Only kept when settings.TRACK_TREE_RESOURCE_SIZE_CHANGES is set.
+    """
+    tree_id = models.IntegerField()
+
+    @classmethod
+    def record(cls, tree_ids):
+        tree_ids = set(tree_id for tree_id in tree_ids if tree_id is not None)
+        if not tree_ids:
+            return
+        if settings.TRACK_TREE_RESOURCE_SIZE_CHANGES:
+            cls.objects.bulk_create([cls(tree_id=tree_id) for tree_id in tree_ids])
+        else:
+            # Nothing will recalculate the sizes of these trees, so
+            # remove them until they are recalculated from scratch
+            TreeResourceSize.objects.filter(tree_id__in=tree_ids).delete()
+
+
 class SecretToken(models.Model):
     """Tokens for channels"""
     token = models.CharField(max_length=100, unique=True)
@@ -659,6 +806,10 @@ def boolean_val(val):
     return Value(val, output_field=models.BooleanField())
 
 
+def boolean_case(condition):
+    return Case(When(condition, then=boolean_val(True)), default=boolean_val(False), output_field=models.BooleanField())
+
+
 class PermissionCTE(With):
     tree_id_fields = [
         "channel__{}__tree_id".format(tree_name)
@@ -684,6 +835,59 @@ class PermissionCTE(With):
         return Exists(self.queryset().filter(*filters).values("user_id"))
 
 
+PERMISSION_SNAPSHOT_KEY = "permission_snapshot_{}_{}"
+
+
+class PermissionSnapshot(object):
+    """
+    The ids of the channels a user can edit, and of those they can only view, along with the
+    tree ids of those channels, so that permissions can be checked against short lists of ids
+    rather than by joining the user's channels in every query. Snapshots are cached under the
+    user's permissions generation, which changes when their channels, or the trees of their
+    channels, change, and are held on the user object for the rest of the request.
+    """
+
+    def __init__(self, editable_channel_ids, editable_tree_ids, view_only_channel_ids, view_only_tree_ids, generation=None):
+        self.editable_channel_ids = editable_channel_ids
+        self.editable_tree_ids = editable_tree_ids
+        self.view_only_channel_ids = view_only_channel_ids
+        self.view_only_tree_ids = view_only_tree_ids
+        self.generation = generation
+
+    @property
+    def viewable_tree_ids(self):
+        return self.editable_tree_ids + self.view_only_tree_ids
+
+    @classmethod
+    def _get_ids(cls, through, user_id):
+        rows = through.objects.filter(user_id=user_id).values_list("channel_id", *PermissionCTE.tree_id_fields)
+        channel_ids = set()
+        tree_ids = set()
+        for row in rows:
+            channel_ids.add(row[0])
+            tree_ids.update(tree_id for tree_id in row[1:] if tree_id is not None)
+        return sorted(channel_ids), sorted(tree_ids)
+
+    @classmethod
+    def for_user(cls, user=None, user_id=None):
+        user_id = user_id or user.id
+        generation = get_user_permissions_generation(user_id)
+        snapshot = getattr(user, "_permission_snapshot", None)
+        if snapshot is not None and snapshot.generation == generation:
+            return snapshot
+
+        key = PERMISSION_SNAPSHOT_KEY.format(user_id, generation)
+        ids = cache.get(key)
+        if ids is None:
+            ids = cls._get_ids(User.editable_channels.through, user_id) + \
+                cls._get_ids(User.view_only_channels.through, user_id)
+            cache.set(key, ids, CHANNEL_CACHE_TIMEOUT)
+        snapshot = cls(*ids, generation=generation)
+        if user is not None:
+            user._permission_snapshot = snapshot
+        return snapshot
+
+
 class Channel(models.Model):
     """ Permissions come from association with organizations """
     id = UUIDField(primary_key=True, default=uuid.uuid4)
@@ -765,6 +969,10 @@ class Channel(models.Model):
         "deleted",
         "public",
         "main_tree_id",
+        "trash_tree_id",
+        "staging_tree_id",
+        "chef_tree_id",
+        "previous_tree_id",
         "version",
     ])
 
@@ -776,8 +984,8 @@ class Channel(models.Model):
         if not user_id:
             return queryset.none()
 
-        edit = Exists(User.editable_channels.through.objects.filter(user_id=user_id, channel_id=OuterRef("id")))
-        return queryset.annotate(edit=edit).filter(edit=True)
+        snapshot = PermissionSnapshot.for_user(user)
+        return queryset.annotate(edit=boolean_val(True)).filter(pk__in=snapshot.editable_channel_ids)
 
     @classmethod
     def filter_view_queryset(cls, queryset, user):
@@ -785,9 +993,9 @@ class Channel(models.Model):
         user_email = not user.is_anonymous() and user.email
 
         if user_id:
-            filters = dict(user_id=user_id, channel_id=OuterRef("id"))
-            edit = Exists(User.editable_channels.through.objects.filter(**filters).values("user_id"))
-            view = Exists(User.view_only_channels.through.objects.filter(**filters).values("user_id"))
+            snapshot = PermissionSnapshot.for_user(user)
+            edit = boolean_case(Q(pk__in=snapshot.editable_channel_ids))
+            view = boolean_case(Q(pk__in=snapshot.view_only_channel_ids))
         else:
             edit = boolean_val(False)
             view = boolean_val(False)
@@ -799,7 +1007,9 @@ class Channel(models.Model):
 
         permission_filter = Q()
         if user_id:
-            permission_filter = Q(view=True) | Q(edit=True) | Q(deleted=False, pending_editors__email=user_email)
+            permission_filter = Q(pk__in=snapshot.editable_channel_ids + snapshot.view_only_channel_ids) | Q(
+                deleted=False, pending_editors__email=user_email
+            )
 
         return queryset.filter(permission_filter | Q(deleted=False, public=True))
 
@@ -808,13 +1018,14 @@ class Channel(models.Model):
         return cls.objects.select_related('main_tree').prefetch_related('editors', 'viewers').distinct()
 
     def resource_size_key(self):
-        return "{}_resource_size".format(self.pk)
+        return "{}_resource_size_{}".format(self.pk, get_channel_generation(self.pk))
 
     # Might be good to display resource size, but need to improve query time first
 
     def get_resource_size(self):
-        cached_data = cache.get(self.resource_size_key())
-        if cached_data:
+        key = self.resource_size_key()
+        cached_data = cache.get(key)
+        if cached_data is not None:
             return cached_data
         tree_id = self.main_tree.tree_id
         files = File.objects.select_related('contentnode', 'assessment_item')\
@@ -822,7 +1033,7 @@ class Channel(models.Model):
             .values('checksum', 'file_size')\
             .distinct()\
             .aggregate(resource_size=Sum('file_size'))
-        cache.set(self.resource_size_key(), files['resource_size'] or 0, None)
+        cache.set(key, files['resource_size'] or 0, CHANNEL_CACHE_TIMEOUT)
         return files['resource_size'] or 0
 
     def on_create(self):
@@ -863,6 +1074,10 @@ class Channel(models.Model):
         blacklist = set([
             "public",
             "main_tree_id",
+            "trash_tree_id",
+            "staging_tree_id",
+            "chef_tree_id",
+            "previous_tree_id",
             "version",
         ])
 
@@ -894,11 +1109,38 @@ class Channel(models.Model):
     def save(self, *args, **kwargs):
         if self._state.adding:
             self.on_create()
+            changed_trees = CHANNEL_TREES
+            active_files_changed = False
+            public_trees_changed = False
         else:
             self.on_update()
+            original_values = self._field_updates.changed()
+            changed_trees = [tree_name for tree_name in CHANNEL_TREES if "{}_id".format(tree_name) in original_values]
+            active_files_changed = "main_tree_id" in original_values or "deleted" in original_values
+            public_trees_changed = (self.public or original_values.get("public")) and any(
+                field in original_values for field in ("public", "deleted", "main_tree_id")
+            )
 
         super(Channel, self).save(*args, **kwargs)
 
+        if changed_trees:
+            ChannelTree.update_channel_trees(self, changed_trees)
+            # The trees have been swapped, so anything cached from them no longer applies
+            bump_channel_generations(self.pk)
+            # as well as the tree ids in the permissions of the channel's editors and viewers
+            bump_user_permissions_generations(*User.objects.filter(
+                Q(editable_channels=self) | Q(view_only_channels=self)
+            ).values_list("id", flat=True))
+
+        if active_files_changed:
+            # The files of the channel have started or stopped counting towards its editors' storage
+            StorageLedger.objects.reconcile(self.editors.values_list("id", flat=True))
+
+        if public_trees_changed:
+            # The main tree has started or stopped being searched as public content
+            root_ids = [pk for pk in (self.main_tree_id, original_values.get("main_tree_id")) if pk]
+            CanonicalContentNode.refresh(ContentNode.objects.filter(pk__in=root_ids).values_list("tree_id", flat=True))
+
     def get_thumbnail(self):
         return get_channel_thumbnail(self)
 
@@ -973,6 +1215,45 @@ class Channel(models.Model):
         ]
 
 
+class ChannelTree(models.Model):
+    """
+    A lookup from the tree_id of each of a channel's trees to the channel,
+    the name of the Channel field the tree is assigned to, and its root node,
+    so that these can be annotated onto ContentNodes without searching every
+    tree field of the Channel table. Kept up to date by Channel.save.
+    """
+    tree_id = models.IntegerField()
+    channel = models.ForeignKey(Channel, related_name="tree_lookups", on_delete=models.CASCADE)
+    tree_name = models.CharField(max_length=20, choices=[(tree_name, tree_name) for tree_name in CHANNEL_TREES])
+    root = models.ForeignKey('ContentNode', related_name="+", on_delete=models.CASCADE)
+
+    @classmethod
+    def update_channel_trees(cls, channel, tree_names):
+        root_ids = {tree_name: getattr(channel, "{}_id".format(tree_name)) for tree_name in tree_names}
+        tree_ids = dict(ContentNode.objects.filter(pk__in=[pk for pk in root_ids.values() if pk]).values_list("id", "tree_id"))
+        with transaction.atomic():
+            cls.objects.filter(channel=channel, tree_name__in=tree_names).delete()
+            cls.objects.bulk_create([
+                cls(tree_id=tree_ids[root_id], channel=channel, tree_name=tree_name, root_id=root_id)
+                for tree_name, root_id in root_ids.items() if root_id in tree_ids
+            ])
+
+    @classmethod
+    def main_tree_channel_id(cls, tree_id_field="tree_id"):
+        """
+        Returns a subquery for the id of the channel whose main tree has the tree_id in tree_id_field
+        """
+        return Subquery(
+            cls.objects.filter(tree_id=OuterRef(tree_id_field), tree_name="main_tree").values_list("channel_id", flat=True)[:1]
+        )
+
+    class Meta:
+        unique_together = ("channel", "tree_name")
+        index_together = [
+            ["tree_id", "tree_name"]
+        ]
+
+
 class ChannelSet(models.Model):
     # NOTE: this is referred to as "channel collections" on the front-end, but we need to call it
     # something else as there is already a ChannelCollection model on the front-end
@@ -1073,6 +1354,8 @@ class License(models.Model):
 NODE_ID_INDEX_NAME = "node_id_idx"
 NODE_MODIFIED_INDEX_NAME = "node_modified_idx"
 NODE_MODIFIED_DESC_INDEX_NAME = "node_modified_desc_idx"
+NODE_PATH_INDEX_NAME = "node_path_idx"
+NODE_SEARCH_VECTOR_INDEX_NAME = "node_search_vector_idx"
 
 
 class ContentNode(MPTTModel, models.Model):
@@ -1152,24 +1435,27 @@ class ContentNode(MPTTModel, models.Model):
     role_visibility = models.CharField(max_length=50, choices=roles.choices, default=roles.LEARNER)
     freeze_authoring_data = models.BooleanField(default=False)
 
+    # The ids of the ancestors of this node, from the root of its tree down to its parent.
+    # This is kept up to date alongside the mptt fields when nodes are inserted, moved
+    # or copied, so that ancestors can be looked up by primary key.
+    path = ArrayField(UUIDField(), default=list, blank=True)
+
+    # The title, description, tags and author of the node for full text search, weighted in that
+    # order and parsed with the text search configuration for the node's language. This is set by
+    # database triggers on the node and its tags, see migration 0129_contentnode_search_vector,
+    # and for nodes created before the triggers, by the set_search_vectors command.
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+
     objects = CustomContentNodeTreeManager()
 
     # Track all updates and ignore a blacklist of attributes
     # when we check for changes
     _field_updates = FieldTracker()
 
-    _permission_filter = Q(tree_id=OuterRef("tree_id"))
-
     @classmethod
     def _annotate_channel_id(cls, queryset):
         # Annotate channel id
-        return queryset.annotate(
-            channel_id=Subquery(
-                Channel.objects.filter(
-                    main_tree__tree_id=OuterRef("tree_id")
-                ).values_list("id", flat=True)[:1]
-            )
-        )
+        return queryset.annotate(channel_id=ChannelTree.main_tree_channel_id())
 
     @classmethod
     def _orphan_tree_id_subquery(cls):
@@ -1186,11 +1472,11 @@ class ContentNode(MPTTModel, models.Model):
         if not user_id:
             return queryset.none()
 
-        edit_cte = PermissionCTE.editable_channels(user_id)
+        snapshot = PermissionSnapshot.for_user(user=user, user_id=user_id)
 
-        return queryset.with_cte(edit_cte).annotate(
-            edit=edit_cte.exists(cls._permission_filter),
-        ).filter(Q(edit=True) | Q(tree_id=cls._orphan_tree_id_subquery()))
+        return queryset.annotate(
+            edit=boolean_case(Q(tree_id__in=snapshot.editable_tree_ids)),
+        ).filter(Q(tree_id__in=snapshot.editable_tree_ids) | Q(tree_id=cls._orphan_tree_id_subquery()))
 
     @classmethod
     def filter_view_queryset(cls, queryset, user):
@@ -1207,17 +1493,15 @@ class ContentNode(MPTTModel, models.Model):
         if not user_id:
             return queryset.annotate(edit=boolean_val(False), view=boolean_val(False)).filter(public=True)
 
-        edit_cte = PermissionCTE.editable_channels(user_id)
-        view_cte = PermissionCTE.view_only_channels(user_id)
+        snapshot = PermissionSnapshot.for_user(user)
 
-        queryset = queryset.with_cte(edit_cte).with_cte(view_cte).annotate(
-            edit=edit_cte.exists(cls._permission_filter),
-            view=view_cte.exists(cls._permission_filter),
+        queryset = queryset.annotate(
+            edit=boolean_case(Q(tree_id__in=snapshot.editable_tree_ids)),
+            view=boolean_case(Q(tree_id__in=snapshot.view_only_tree_ids)),
         )
 
         return queryset.filter(
-            Q(view=True)
-            | Q(edit=True)
+            Q(tree_id__in=snapshot.viewable_tree_ids)
             | Q(public=True)
             | Q(tree_id=cls._orphan_tree_id_subquery())
         )
@@ -1240,6 +1524,65 @@ class ContentNode(MPTTModel, models.Model):
             parent=None,
         )
 
+    def get_ancestors(self, ascending=False, include_self=False):
+        """
+        Looks up the ancestors of this node by the ids stored in its path,
+        rather than with a range query on the mptt fields of its tree.
+        """
+        if self.is_root_node():
+            return super(ContentNode, self).get_ancestors(ascending=ascending, include_self=include_self)
+        ancestor_ids = ContentNode.objects.filter(pk=self.pk).annotate(
+            ancestor_id=Unnest("path")
+        ).values("ancestor_id")
+        query = Q(pk__in=ancestor_ids)
+        if include_self:
+            query |= Q(pk=self.pk)
+        return ContentNode.objects.filter(query).order_by("-lft" if ascending else "lft")
+
+    def get_descendant_count(self):
+        # With settings.MPTT_SPARSE_GAP there may be gaps between the lft and rght
+        # values of descendants, so they can only be counted in the database
+        if not settings.MPTT_SPARSE_GAP or self._mpttfield('right') is None:
+            return super(ContentNode, self).get_descendant_count()
+        return ContentNode.objects.filter(
+            tree_id=self._mpttfield('tree_id'),
+            lft__gt=self._mpttfield('left'),
+            rght__lt=self._mpttfield('right'),
+        ).count()
+
+    def iter_tree_data(self, levels=float('inf')):
+        """
+        Yields the tree information of the node and its descendants, up to `levels` deep,
+        in tree order from a single query. Instead of children lists, each node has the
+        `parent_id` of its parent, so the tree can be streamed without holding it in memory.
+        """
+        file_sizes = File.objects.filter(contentnode_id=OuterRef("id")).order_by() \
+            .values("contentnode_id").annotate(size=Sum("file_size")).values("size")
+        assessment_counts = AssessmentItem.objects.filter(contentnode_id=OuterRef("id")).order_by() \
+            .values("contentnode_id").annotate(count=Count("id")).values("count")
+        nodes = ContentNode.objects.filter(tree_id=self.tree_id, lft__gte=self.lft, rght__lte=self.rght)
+        if levels != float('inf'):
+            nodes = nodes.filter(level__lte=self.level + levels)
+        nodes = nodes.annotate(
+            resource_file_size=Subquery(file_sizes, output_field=models.BigIntegerField()),
+            assessment_count=Subquery(assessment_counts, output_field=models.IntegerField()),
+        ).order_by("lft").values_list(
+            "id", "parent_id", "title", "kind_id", "node_id", "resource_file_size", "assessment_count"
+        )
+        for pk, parent_id, title, kind_id, node_id, file_size, assessment_count in nodes.iterator():
+            node_data = {
+                "title": title,
+                "kind": kind_id,
+                "node_id": node_id,
+                "studio_id": pk,
+                "parent_id": parent_id if pk != self.pk else None,
+            }
+            if kind_id == content_kinds.EXERCISE:
+                node_data["count"] = assessment_count or 0
+            elif kind_id != content_kinds.TOPIC:
+                node_data["file_size"] = file_size
+            yield node_data
+
     def get_tree_data(self, levels=float('inf')):
         """
         Returns `levels`-deep tree information starting at current node.
@@ -1249,33 +1592,21 @@ class ContentNode(MPTTModel, models.Model):
           tree (dict): starting with self, with children list containing either
                        the just the children's `node_id`s or full recusive tree.
         """
-        if self.kind_id == content_kinds.TOPIC:
-            node_data = {
-                "title": self.title,
-                "kind": self.kind_id,
-                "node_id": self.node_id,
-                "studio_id": self.id,
-            }
-            children = self.children.all()
-            if levels > 0:
-                node_data["children"] = [c.get_tree_data(levels=levels - 1) for c in children]
-            return node_data
-        elif self.kind_id == content_kinds.EXERCISE:
-            return {
-                "title": self.title,
-                "kind": self.kind_id,
-                "count": self.assessment_items.count(),
-                "node_id": self.node_id,
-                "studio_id": self.id,
-            }
-        else:
-            return {
-                "title": self.title,
-                "kind": self.kind_id,
-                "file_size": self.files.values('file_size').aggregate(size=Sum('file_size'))['size'],
-                "node_id": self.node_id,
-                "studio_id": self.id,
-            }
+        root_data = None
+        # Nodes come in tree order, so the ancestors of each node are the nodes on the stack
+        stack = []
+        for node_data in self.iter_tree_data(levels=levels):
+            parent_id = node_data.pop("parent_id")
+            while stack and stack[-1]["studio_id"] != parent_id:
+                stack.pop()
+            if node_data["kind"] == content_kinds.TOPIC and len(stack) < levels:
+                node_data["children"] = []
+            if not stack:
+                root_data = node_data
+            elif "children" in stack[-1]:
+                stack[-1]["children"].append(node_data)
+            stack.append(node_data)
+        return root_data
 
     def get_original_node(self):
         original_node = self.original_node or self
@@ -1356,35 +1687,80 @@ class ContentNode(MPTTModel, models.Model):
         else:
             return cls.objects.filter(title=title)
 
-    def get_details(self):
+    def _summarize_descendants(self):
         """
-        Returns information about the node and its children, including total size, languages, files, etc.
-
-        :return: A dictionary with detailed statistics and information about the node.
+        Walks the descendants of the node once, in tree order, collecting the
+        values the details are built from.
         """
-        descendants = self.get_descendants().prefetch_related('children', 'files', 'tags') \
-            .select_related('license', 'language')
-        channel = self.get_channel()
-
-        # Get resources
-        resources = descendants.exclude(kind=content_kinds.TOPIC)
-
-        # Get all copyright holders, authors, aggregators, and providers and split into lists
-        creators = resources.values_list('copyright_holder', 'author', 'aggregator', 'provider')
-        split_lst = list(zip(*creators))
-        copyright_holders = list(filter(bool, set(split_lst[0]))) if len(split_lst) > 0 else []
-        authors = list(filter(bool, set(split_lst[1]))) if len(split_lst) > 1 else []
-        aggregators = list(filter(bool, set(split_lst[2]))) if len(split_lst) > 2 else []
-        providers = list(filter(bool, set(split_lst[3]))) if len(split_lst) > 3 else []
-
-        # Get sample pathway by getting longest path
-        # Using resources.aggregate adds a lot of time, use values that have already been fetched
-        max_level = max(resources.values_list('level', flat=True).distinct() or [0])
-        deepest_node = resources.filter(level=max_level).first()
+        summary = {
+            "resource_count": 0,
+            "creators": [set(), set(), set(), set()],
+            "deepest_node_id": None,
+            "deepest_level": -1,
+            "originals": Counter(),
+            "languages": set(),
+            "licenses": set(),
+            "kinds": Counter(),
+            "coach_content": 0,
+        }
+        rows = self.get_descendants().order_by("lft").values_list(
+            "id", "kind_id", "level", "original_channel_id", "role_visibility",
+            "language__native_name", "license__license_name",
+            "copyright_holder", "author", "aggregator", "provider",
+        )
+        for row in rows.iterator():
+            if row[5]:
+                summary["languages"].add(row[5])
+            if row[1] != content_kinds.TOPIC:
+                self._summarize_resource(summary, row)
+        return summary
+
+    def _summarize_resource(self, summary, row):
+        node_id, kind_id, level, original_channel_id, role_visibility, _language, license_name = row[:7]
+        summary["resource_count"] += 1
+        summary["kinds"][kind_id] += 1
+        for values, creator in zip(summary["creators"], row[7:]):
+            values.add(creator)
+        if level > summary["deepest_level"]:
+            summary["deepest_level"] = level
+            summary["deepest_node_id"] = node_id
+        if original_channel_id:
+            summary["originals"][original_channel_id] += 1
+        if license_name:
+            summary["licenses"].add(license_name)
+        if role_visibility == roles.COACH:
+            summary["coach_content"] += 1
+
+    def _summarize_resource_files(self):
+        """
+        Returns the total size of the distinct files of the resources under the node
+        and the languages of their subtitles, from a single pass over the files.
+        """
+        files = File.objects.filter(
+            contentnode__tree_id=self.tree_id,
+            contentnode__lft__gt=self.lft,
+            contentnode__rght__lt=self.rght,
+        ).exclude(contentnode__kind_id=content_kinds.TOPIC).values_list(
+            "checksum", "file_size", "preset_id", "language__native_name"
+        )
+        checksums = set()
+        accessible_languages = set()
+        for checksum, file_size, preset_id, language in files.iterator():
+            checksums.add((checksum, file_size or 0))
+            if preset_id == format_presets.VIDEO_SUBTITLE and language:
+                accessible_languages.add(language)
+        return sum(size for _checksum, size in checksums), list(accessible_languages)
+
+    def _get_sample_details(self, deepest_node_id):
+        """
+        Returns the path to the deepest resource under the node and up to four of its siblings
+        """
+        deepest_node = ContentNode.objects.filter(pk=deepest_node_id).first() if deepest_node_id else None
+        if not deepest_node:
+            return [], []
         pathway = list(deepest_node.get_ancestors()
                        .exclude(parent=None)
-                       .values('title', 'node_id', 'kind_id')
-                       ) if deepest_node else []
+                       .values('title', 'node_id', 'kind_id'))
         sample_nodes = [
             {
                 "node_id": n.node_id,
@@ -1393,67 +1769,68 @@ class ContentNode(MPTTModel, models.Model):
                 "thumbnail": n.get_thumbnail(),
                 "kind": n.kind_id,
             } for n in deepest_node.get_siblings(include_self=True)[0:4]
-        ] if deepest_node else []
+        ]
+        return pathway, sample_nodes
 
+    def _get_original_channels(self, originals):
         # Get list of channels nodes were originally imported from (omitting the current channel)
+        channel = self.get_channel()
         channel_id = channel and channel.id
-        originals = resources.values("original_channel_id") \
-            .annotate(count=Count("original_channel_id")) \
-            .order_by("original_channel_id")
-        originals = {c['original_channel_id']: c['count'] for c in originals}
         original_channels = Channel.objects.exclude(pk=channel_id) \
-            .filter(pk__in=[k for k, v in list(originals.items())], deleted=False)
-        original_channels = [{
+            .filter(pk__in=list(originals.keys()), deleted=False)
+        return [{
             "id": c.id,
             "name": "{}{}".format(c.name, _(" (Original)") if channel_id == c.id else ""),
             "thumbnail": c.get_thumbnail(),
             "count": originals[c.id]
         } for c in original_channels]
 
+    def get_details(self):
+        """
+        Returns information about the node and its children, including total size, languages, files, etc.
+        The descendants and their files are each read in a single pass, so the number of queries
+        does not grow with the size of the tree.
+
+        :return: A dictionary with detailed statistics and information about the node.
+        """
+        summary = self._summarize_descendants()
+        resource_size, accessible_languages = self._summarize_resource_files()
+        pathway, sample_nodes = self._get_sample_details(summary["deepest_node_id"])
+        copyright_holders, authors, aggregators, providers = [
+            list(filter(bool, values)) for values in summary["creators"]
+        ]
+
         # Get tags from channel
-        tags = list(ContentTag.objects.filter(tagged_content__pk__in=descendants.values_list('pk', flat=True))
+        tags = list(ContentTag.objects.filter(tagged_content__tree_id=self.tree_id,
+                                              tagged_content__lft__gt=self.lft,
+                                              tagged_content__rght__lt=self.rght)
                     .values('tag_name')
                     .annotate(count=Count('tag_name'))
                     .order_by('tag_name'))
 
-        # Get resource variables
-        resource_count = resources.count() or 0
-        resource_size = resources.values('files__checksum', 'files__file_size').distinct().aggregate(
-            resource_size=Sum('files__file_size'))['resource_size'] or 0
-
-        languages = list(set(descendants.exclude(language=None).values_list('language__native_name', flat=True)))
-        accessible_languages = resources.filter(files__preset_id=format_presets.VIDEO_SUBTITLE) \
-            .values_list('files__language_id', flat=True)
-        accessible_languages = list(
-            Language.objects.filter(id__in=accessible_languages).distinct().values_list('native_name', flat=True))
-
-        licenses = list(set(resources.exclude(license=None).values_list('license__license_name', flat=True)))
-        kind_count = list(resources.values('kind_id').annotate(count=Count('kind_id')).order_by('kind_id'))
-
-        # Add "For Educators" booleans
-        for_educators = {
-            "coach_content": resources.filter(role_visibility=roles.COACH).count(),
-            "exercises": resources.filter(kind_id=content_kinds.EXERCISE).count(),
-        }
-
         # Serialize data
         data = {
             "last_update": pytz.utc.localize(datetime.now()).strftime(settings.DATE_TIME_FORMAT),
             "created": self.created.strftime(settings.DATE_TIME_FORMAT),
-            "resource_count": resource_count,
+            "resource_count": summary["resource_count"],
             "resource_size": resource_size,
-            "includes": for_educators,
-            "kind_count": kind_count,
-            "languages": languages,
+            "includes": {
+                "coach_content": summary["coach_content"],
+                "exercises": summary["kinds"][content_kinds.EXERCISE],
+            },
+            "kind_count": [
+                {"kind_id": kind_id, "count": count} for kind_id, count in sorted(summary["kinds"].items())
+            ],
+            "languages": list(summary["languages"]),
             "accessible_languages": accessible_languages,
-            "licenses": licenses,
+            "licenses": list(summary["licenses"]),
             "tags": tags,
             "copyright_holders": copyright_holders,
             "authors": authors,
             "aggregators": aggregators,
             "providers": providers,
             "sample_pathway": pathway,
-            "original_channels": original_channels,
+            "original_channels": self._get_original_channels(summary["originals"]),
             "sample_nodes": sample_nodes,
         }
 
@@ -1472,6 +1849,7 @@ class ContentNode(MPTTModel, models.Model):
             mptt_opts.left_attr,
             mptt_opts.right_attr,
             mptt_opts.level_attr,
+            'path',
         ])
         original_values = self._field_updates.changed()
         return any((True for field in original_values if field not in blacklist))
@@ -1482,8 +1860,39 @@ class ContentNode(MPTTModel, models.Model):
     def on_update(self):
         self.changed = self.changed or self.has_changes()
 
+    def _aggregate_source_values(self, previous=False):
+        """
+        Returns the values of the fields that determine how this node contributes
+        to the descendant counts of its ancestors, or, if previous is True, the values
+        they had when the node was last loaded or saved.
+        """
+        original_values = self._field_updates.changed() if previous else {}
+        values = {}
+        for field in AGGREGATE_SOURCE_FIELDS:
+            value = original_values.get(field, DeferredAttribute)
+            values[field] = getattr(self, field) if value is DeferredAttribute else value
+        return values
+
+    def _update_ancestor_aggregates(self, adding, moved, previous_values):
+        if adding:
+            ContentNode.objects.create_aggregates([self])
+        elif moved:
+            # Add this subtree to the descendant counts of its new ancestors
+            ContentNode.objects.update_ancestor_aggregates(
+                self.id, ContentNode.objects.get_subtree_aggregates(self.id)
+            )
+        else:
+            ContentNode.objects.update_ancestor_aggregates(
+                self.id, aggregate_delta(previous_values, self._aggregate_source_values())
+            )
+
+    def _update_descendant_paths(self, adding, same_order, previous_path):
+        if not adding and not same_order:
+            ContentNode.objects.update_descendant_paths(self, previous_path)
+
     def save(self, skip_lock=False, *args, **kwargs):
-        if self._state.adding:
+        adding = self._state.adding
+        if adding:
             self.on_create()
         else:
             self.on_update()
@@ -1500,7 +1909,7 @@ class ContentNode(MPTTModel, models.Model):
         # trigger a write lock on mptt fields.
 
         old_parent_id = self._field_updates.changed().get("parent_id")
-        if self._state.adding and (self.parent_id or self.parent):
+        if adding and (self.parent_id or self.parent):
             same_order = False
         elif old_parent_id is DeferredAttribute:
             same_order = True
@@ -1512,22 +1921,40 @@ class ContentNode(MPTTModel, models.Model):
         else:
             changed_ids = []
 
+        previous_path = self.path
+        if not same_order:
+            self.path = ContentNode.objects.get_child_path(self.parent_id)
+
+        previous_values = None if adding else self._aggregate_source_values(previous=True)
+
         if not same_order and not skip_lock:
             # Lock the mptt fields for the trees of the old and new parent
             with ContentNode.objects.lock_mptt(*ContentNode.objects
                                                .filter(id__in=[pid for pid in [old_parent_id, self.parent_id] if pid])
-                                               .values_list('tree_id', flat=True).distinct()):
+                                               .values_list('tree_id', flat=True).distinct(), operation="save"):
+                if not adding:
+                    # Remove this subtree from the descendant counts of its current ancestors
+                    ContentNode.objects.update_ancestor_aggregates(
+                        self.id, negate_aggregates(ContentNode.objects.get_subtree_aggregates(self.id))
+                    )
                 super(ContentNode, self).save(*args, **kwargs)
                 # Always write to the database for the parent change updates, as we have
                 # no persistent object references for the original and new parent to modify
                 if changed_ids:
                     ContentNode.objects.filter(id__in=changed_ids).update(changed=True)
+                self._update_descendant_paths(adding, same_order, previous_path)
+                self._update_ancestor_aggregates(adding, True, previous_values)
         else:
             super(ContentNode, self).save(*args, **kwargs)
+            self._update_descendant_paths(adding, same_order, previous_path)
             # Always write to the database for the parent change updates, as we have
             # no persistent object references for the original and new parent to modify
             if changed_ids:
                 ContentNode.objects.filter(id__in=changed_ids).update(changed=True)
+            # Moves made with skip_lock have already updated the counts for the subtree
+            # in the move_node manager method, so only apply changes to this node itself.
+            self._update_ancestor_aggregates(adding, False, previous_values)
+        bump_tree_revisions(self.tree_id)
 
     # Copied from MPTT
     save.alters_data = True
@@ -1538,7 +1965,11 @@ class ContentNode(MPTTModel, models.Model):
             parent.changed = True
             parent.save()
         # Lock the mptt fields for the tree of this node
-        with ContentNode.objects.lock_mptt(self.tree_id):
+        with ContentNode.objects.lock_mptt(self.tree_id, operation="delete"):
+            # Remove this subtree from the descendant counts of its ancestors
+            ContentNode.objects.update_ancestor_aggregates(
+                self.id, negate_aggregates(ContentNode.objects.get_subtree_aggregates(self.id))
+            )
             return super(ContentNode, self).delete(*args, **kwargs)
 
     # Copied from MPTT
@@ -1567,6 +1998,107 @@ class ContentNode(MPTTModel, models.Model):
         indexes = [
             models.Index(fields=["node_id"], name=NODE_ID_INDEX_NAME),
             models.Index(fields=["-modified"], name=NODE_MODIFIED_DESC_INDEX_NAME),
+            # For finding all the descendants of a node by its id with path__contains
+            GinIndex(fields=["path"], name=NODE_PATH_INDEX_NAME),
+            GinIndex(fields=["search_vector"], name=NODE_SEARCH_VECTOR_INDEX_NAME),
+        ]
+
+
+class ContentNodeAggregate(models.Model):
+    """
+    Denormalized counts over the descendants of a ContentNode, kept up to date
+    by the CustomContentNodeTreeManager as nodes are created, updated, moved,
+    copied and deleted, so that they do not have to be counted on every read.
+    These can be recalculated with the rebuild_node_aggregates management command.
+    """
+    contentnode = models.OneToOneField(ContentNode, primary_key=True, related_name="aggregates", on_delete=models.CASCADE)
+    # Count of non-topic descendants
+    resource_count = models.IntegerField(default=0)
+    # Count of non-topic descendants that are only visible to coaches
+    coach_count = models.IntegerField(default=0)
+    # Count of incomplete descendants
+    error_count = models.IntegerField(default=0)
+    # Count of changed non-topic descendants that have been published before
+    updated_count = models.IntegerField(default=0)
+    # Count of changed non-topic descendants that have never been published
+    new_count = models.IntegerField(default=0)
+
+
+CANONICAL_NODE_TREE_IDS_INDEX_NAME = "canonical_node_tree_ids_idx"
+
+# An arbitrary key for the advisory lock that serializes CanonicalContentNode refreshes,
+# in the single bigint key space so that it cannot clash with the tree locks of lock_mptt
+CANONICAL_NODE_REFRESH_LOCK_KEY = 6723
+
+
+class CanonicalContentNode(models.Model):
+    """
+    For each content_id in the main trees of public channels, the node that search results are
+    deduplicated to, preferring original nodes and then the earliest created, along with the ids
+    of every public node with that content_id and the trees they are in. Refreshed for the main
+    tree of a public channel when it is published, and when a channel's visibility or main tree
+    changes, so that search can join on it rather than finding the canonical node of every result.
+    """
+    content_id = UUIDField(primary_key=True)
+    node = models.OneToOneField(ContentNode, related_name="canonical_content", on_delete=models.CASCADE)
+    location_ids = ArrayField(UUIDField(), default=list)
+    tree_ids = ArrayField(models.IntegerField(), default=list)
+
+    @classmethod
+    def refresh(cls, tree_ids):
+        """
+        Recalculates the canonical nodes of the content in the trees,
+        and of the content that was in the trees when last refreshed.
+        Refreshes are serialized, as trees that share content would otherwise
+        delete and insert the same rows concurrently.
+        """
+        tree_ids = list(set(tree_id for tree_id in tree_ids if tree_id is not None))
+        if not tree_ids:
+            return
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (CANONICAL_NODE_REFRESH_LOCK_KEY,))
+            cursor.execute(
+                """
+                SELECT content_id FROM {node_table} WHERE tree_id = ANY(%(tree_ids)s::integer[])
+                UNION
+                SELECT content_id FROM {canonical_table} WHERE tree_ids && %(tree_ids)s::integer[]
+                """.format(node_table=ContentNode._meta.db_table, canonical_table=cls._meta.db_table),
+                {"tree_ids": tree_ids},
+            )
+            content_ids = [content_id for content_id, in cursor.fetchall()]
+            cursor.execute(
+                "DELETE FROM {} WHERE content_id = ANY(%(content_ids)s::varchar[])".format(cls._meta.db_table),
+                {"content_ids": content_ids},
+            )
+            cursor.execute(
+                """
+                INSERT INTO {canonical_table} (content_id, node_id, location_ids, tree_ids)
+                SELECT
+                    node.content_id,
+                    (ARRAY_AGG(
+                        node.id ORDER BY (node.original_source_node_id = node.node_id) IS NOT TRUE, node.created
+                    ))[1],
+                    ARRAY_AGG(node.id),
+                    ARRAY_AGG(DISTINCT node.tree_id)
+                FROM {node_table} AS node
+                JOIN {channel_tree_table} AS channel_tree
+                    ON channel_tree.tree_id = node.tree_id AND channel_tree.tree_name = 'main_tree'
+                JOIN {channel_table} AS channel
+                    ON channel.id = channel_tree.channel_id AND channel.public AND NOT channel.deleted
+                WHERE node.content_id = ANY(%(content_ids)s::varchar[])
+                GROUP BY node.content_id
+                """.format(
+                    canonical_table=cls._meta.db_table,
+                    node_table=ContentNode._meta.db_table,
+                    channel_tree_table=ChannelTree._meta.db_table,
+                    channel_table=Channel._meta.db_table,
+                ),
+                {"content_ids": content_ids},
+            )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=["tree_ids"], name=CANONICAL_NODE_TREE_IDS_INDEX_NAME),
         ]
 
 
@@ -1675,8 +2207,6 @@ class AssessmentItem(models.Model):
             models.Index(fields=["assessment_id"], name=ASSESSMENT_ID_INDEX_NAME),
         ]
 
-    _permission_filter = Q(tree_id=OuterRef("contentnode__tree_id"))
-
     @classmethod
     def filter_edit_queryset(cls, queryset, user):
         user_id = not user.is_anonymous() and user.id
@@ -1684,11 +2214,11 @@ class AssessmentItem(models.Model):
         if not user_id:
             return queryset.none()
 
-        edit_cte = PermissionCTE.editable_channels(user_id)
+        snapshot = PermissionSnapshot.for_user(user)
 
-        return queryset.with_cte(edit_cte).annotate(
-            edit=edit_cte.exists(cls._permission_filter),
-        ).filter(edit=True)
+        return queryset.annotate(
+            edit=boolean_val(True),
+        ).filter(contentnode__tree_id__in=snapshot.editable_tree_ids)
 
     @classmethod
     def filter_view_queryset(cls, queryset, user):
@@ -1705,15 +2235,14 @@ class AssessmentItem(models.Model):
         if not user_id:
             return queryset.annotate(edit=boolean_val(False), view=boolean_val(False)).filter(public=True)
 
-        edit_cte = PermissionCTE.editable_channels(user_id)
-        view_cte = PermissionCTE.view_only_channels(user_id)
+        snapshot = PermissionSnapshot.for_user(user)
 
-        queryset = queryset.with_cte(edit_cte).with_cte(view_cte).annotate(
-            edit=edit_cte.exists(cls._permission_filter),
-            view=view_cte.exists(cls._permission_filter),
+        queryset = queryset.annotate(
+            edit=boolean_case(Q(contentnode__tree_id__in=snapshot.editable_tree_ids)),
+            view=boolean_case(Q(contentnode__tree_id__in=snapshot.view_only_tree_ids)),
         )
 
-        return queryset.filter(Q(view=True) | Q(edit=True) | Q(public=True))
+        return queryset.filter(Q(contentnode__tree_id__in=snapshot.viewable_tree_ids) | Q(public=True))
 
 
 class SlideshowSlide(models.Model):
@@ -1757,7 +2286,9 @@ class File(models.Model):
 
     objects = CustomManager()
 
-    _permission_filter = Q(tree_id=OuterRef("contentnode__tree_id")) | Q(tree_id=OuterRef("assessment_item__contentnode__tree_id"))
+    @classmethod
+    def _tree_filter(cls, tree_ids):
+        return Q(contentnode__tree_id__in=tree_ids) | Q(assessment_item__contentnode__tree_id__in=tree_ids)
 
     @classmethod
     def filter_edit_queryset(cls, queryset, user):
@@ -1766,9 +2297,10 @@ class File(models.Model):
         if not user_id:
             return queryset.none()
 
-        cte = PermissionCTE.editable_channels(user_id)
-        return queryset.with_cte(cte).annotate(edit=cte.exists(cls._permission_filter)).filter(
-            Q(edit=True) | Q(uploaded_by=user, contentnode__isnull=True, assessment_item__isnull=True)
+        snapshot = PermissionSnapshot.for_user(user)
+        edit_filter = cls._tree_filter(snapshot.editable_tree_ids)
+        return queryset.annotate(edit=boolean_case(edit_filter)).filter(
+            edit_filter | Q(uploaded_by=user, contentnode__isnull=True, assessment_item__isnull=True)
         )
 
     @classmethod
@@ -1787,17 +2319,15 @@ class File(models.Model):
         if not user_id:
             return queryset.annotate(edit=boolean_val(False), view=boolean_val(False)).filter(public=True)
 
-        edit_cte = PermissionCTE.editable_channels(user_id)
-        view_cte = PermissionCTE.view_only_channels(user_id)
+        snapshot = PermissionSnapshot.for_user(user)
 
-        queryset = queryset.with_cte(edit_cte).with_cte(view_cte).annotate(
-            edit=edit_cte.exists(cls._permission_filter),
-            view=view_cte.exists(cls._permission_filter),
+        queryset = queryset.annotate(
+            edit=boolean_case(cls._tree_filter(snapshot.editable_tree_ids)),
+            view=boolean_case(cls._tree_filter(snapshot.view_only_tree_ids)),
         )
 
         return queryset.filter(
-            Q(view=True)
-            | Q(edit=True)
+            cls._tree_filter(snapshot.viewable_tree_ids)
             | Q(public=True)
             | Q(uploaded_by=user, contentnode__isnull=True, assessment_item__isnull=True)
         )
@@ -1860,6 +2390,158 @@ def auto_delete_file_on_delete(sender, instance, **kwargs):
     delete_empty_file_reference(instance.checksum, instance.file_format.extension)
 
 
+def record_related_changes(files=(), assessment_items=()):
+    """
+    Records writes to files and assessment items: changes the revisions of the trees that
+    they belong to, so that any metadata cached from the trees is no longer used, and for files,
+    changes the generations of the channels of the trees, as their sizes may have changed,
+    records the changes for TreeResourceSize, and recounts the storage used by their uploaders.
+    Writes that do not send signals, such as bulk_create and bulk_update, must call this themselves.
+    """
+    file_node_ids = set(f.contentnode_id for f in files if f.contentnode_id)
+    file_assessment_item_ids = set(f.assessment_item_id for f in files if f.assessment_item_id)
+    node_ids = set(item.contentnode_id for item in assessment_items if item.contentnode_id)
+
+    file_tree_ids = set()
+    if file_node_ids or file_assessment_item_ids:
+        file_tree_ids.update(
+            ContentNode.objects.filter(
+                Q(pk__in=file_node_ids) | Q(assessment_items__in=file_assessment_item_ids)
+            ).values_list("tree_id", flat=True).distinct()
+        )
+    tree_ids = set(file_tree_ids)
+    if node_ids:
+        tree_ids.update(ContentNode.objects.filter(pk__in=node_ids).values_list("tree_id", flat=True).distinct())
+
+    bump_tree_revisions(*tree_ids)
+    if file_tree_ids:
+        bump_channel_generations(
+            *ChannelTree.objects.filter(tree_id__in=file_tree_ids).values_list("channel_id", flat=True)
+        )
+        TreeResourceSizeChange.record(file_tree_ids)
+    StorageLedger.objects.update_for_pairs(set((f.uploaded_by_id, f.checksum) for f in files))
+
+
+class RelatedDeletes(object):
+    """
+    The files and assessment items deleted in a transaction, which are recorded together
+    once it commits, so that deleting a large subtree looks up and invalidates each of its
+    trees and checksums once, rather than once for every row.
+    """
+
+    def __init__(self):
+        self.files = []
+        self.assessment_items = []
+
+    def record(self):
+        record_related_changes(files=self.files, assessment_items=self.assessment_items)
+
+    @classmethod
+    def current(cls):
+        connection = transaction.get_connection()
+        deletes = getattr(connection, "_related_deletes", None)
+        # The callback is discarded if the transaction rolls back, so only
+        # add to a batch that is still waiting for its transaction to commit
+        if deletes is None or not any(func == deletes.record for _, func in connection.run_on_commit):
+            deletes = cls()
+            connection._related_deletes = deletes
+            transaction.on_commit(deletes.record)
+        return deletes
+
+
+@receiver(models.signals.post_save, sender=File)
+@receiver(models.signals.post_save, sender=AssessmentItem)
+def record_related_save(sender, instance, **kwargs):
+    if sender is File:
+        record_related_changes(files=[instance])
+    else:
+        record_related_changes(assessment_items=[instance])
+
+
+@receiver(models.signals.post_delete, sender=File)
+@receiver(models.signals.post_delete, sender=AssessmentItem)
+def record_related_delete(sender, instance, **kwargs):
+    # Deletes always run in a transaction, so this is recorded when it commits
+    deletes = RelatedDeletes.current()
+    if sender is File:
+        deletes.files.append(instance)
+    else:
+        deletes.assessment_items.append(instance)
+
+
+@receiver(models.signals.m2m_changed, sender=Channel.editors.through)
+def update_storage_ledger_on_editors_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Recounts the storage used by users who have started or stopped editing a channel
+    """
+    if action == "pre_clear":
+        # Hold on to the users being removed, as they are no longer known after the clear
+        instance._cleared_editor_ids = list(
+            [instance.pk] if reverse else instance.editors.values_list("id", flat=True)
+        )
+    elif action == "post_clear":
+        StorageLedger.objects.reconcile(getattr(instance, "_cleared_editor_ids", []))
+    elif action in ("post_add", "post_remove"):
+        StorageLedger.objects.reconcile([instance.pk] if reverse else pk_set)
+
+
+@receiver(models.signals.m2m_changed, sender=Channel.editors.through)
+@receiver(models.signals.m2m_changed, sender=Channel.viewers.through)
+def bump_channel_generation_on_members_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Changes the generation of channels whose editors or viewers have changed,
+    so that their cached editor and viewer counts are no longer used
+    """
+    if not reverse:
+        channel_ids = [instance.pk]
+    elif action == "pre_clear":
+        channel_ids = sender.objects.filter(user_id=instance.pk).values_list("channel_id", flat=True)
+    elif action in ("post_add", "post_remove"):
+        channel_ids = pk_set
+    else:
+        return
+    bump_channel_generations(*channel_ids)
+
+
+@receiver(models.signals.m2m_changed, sender=Channel.editors.through)
+@receiver(models.signals.m2m_changed, sender=Channel.viewers.through)
+def bump_user_permissions_on_members_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Changes the permissions generation of users who have started or stopped
+    editing or viewing a channel, so that their cached permissions are no longer used
+    """
+    if reverse:
+        user_ids = [instance.pk]
+    elif action == "pre_clear":
+        user_ids = sender.objects.filter(channel_id=instance.pk).values_list("user_id", flat=True)
+    elif action in ("post_add", "post_remove"):
+        user_ids = pk_set
+    else:
+        return
+    bump_user_permissions_generations(*user_ids)
+
+
+class StorageLedger(models.Model):
+    """
+    The files that count towards the storage used by each user, one entry for each checksum
+    the user has uploaded, with the number of active files that have that checksum. Files are
+    active when they are in the main tree of a channel that is not deleted, and that the user edits.
+    Kept up to date as files are saved, copied, moved and deleted, and channels are activated,
+    deleted or have their editors changed, so that checking quotas does not have to count every
+    active file. These can be recounted with the reconcile_storage_ledger management command.
+    """
+    user = models.ForeignKey(User, related_name="storage_ledger", on_delete=models.CASCADE)
+    checksum = models.CharField(max_length=400)
+    file_size = models.IntegerField(default=0)
+    kind = models.ForeignKey(ContentKind, related_name="+", null=True, blank=True, on_delete=models.SET_NULL)
+    refcount = models.IntegerField(default=0)
+
+    objects = StorageLedgerManager()
+
+    class Meta:
+        unique_together = ("user", "checksum")
+
+
 def delete_empty_file_reference(checksum, extension):
     filename = checksum + '.' + extension
     if not File.objects.filter(checksum=checksum).exists() and not Channel.objects.filter(thumbnail=filename).exists():
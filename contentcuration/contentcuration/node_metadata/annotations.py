@@ -1,7 +1,5 @@
-from django.contrib.postgres.aggregates.general import ArrayAgg
 from django.contrib.postgres.aggregates.general import BoolOr
 from django.db.models import BooleanField
-from django.db.models import CharField
 from django.db.models import IntegerField
 from django.db.models.aggregates import Count
 from django.db.models.aggregates import Max
@@ -15,9 +13,11 @@ from le_utils.constants import roles
 
 from contentcuration.db.models.expressions import BooleanComparison
 from contentcuration.db.models.expressions import WhenQ
+from contentcuration.db.models.functions import ArrayAppend
 from contentcuration.node_metadata.cte import AssessmentCountCTE
 from contentcuration.node_metadata.cte import ResourceSizeCTE
 from contentcuration.node_metadata.cte import TreeMetadataCTE
+from contentcuration.viewsets.common import descendant_count
 
 
 class MetadataAnnotation(object):
@@ -38,41 +38,23 @@ class MetadataAnnotation(object):
 
 
 class AncestorAnnotation(MetadataAnnotation):
-    cte = TreeMetadataCTE
-    cte_columns = ("lft", "rght", "pk")
-
     def __init__(self, *args, **kwargs):
         self.include_self = kwargs.pop("include_self", False)
         super(AncestorAnnotation, self).__init__(*args, **kwargs)
 
-    def build_ancestor_condition(self, cte):
+    def build_ancestor_ids(self):
         """
-        @see MPTTModel.get_ancestors()
+        The ids of the ancestors of the node from the root down, which are stored
+        on the node itself, @see ContentNode.path
         """
-        left_op = "<="
-        right_op = ">="
-
-        if not self.include_self:
-            left_op = "<"
-            right_op = ">"
-
-        return [
-            BooleanComparison(cte.col.lft, left_op, F("lft")),
-            BooleanComparison(cte.col.rght, right_op, F("rght")),
-        ]
+        if self.include_self:
+            return ArrayAppend(F("path"), F("id"))
+        return F("path")
 
 
 class AncestorArrayAgg(AncestorAnnotation):
     def get_annotation(self, cte):
-        ancestor_condition = self.build_ancestor_condition(cte)
-
-        return ArrayAgg(
-            Case(
-                When(condition=WhenQ(*ancestor_condition), then=cte.col.pk),
-                default=Value(None),
-            ),
-            output_field=CharField(),
-        )
+        return self.build_ancestor_ids()
 
 
 class DescendantCount(MetadataAnnotation):
@@ -82,13 +64,14 @@ class DescendantCount(MetadataAnnotation):
         """
         return Max(
             Case(
-                # when selected node is topic, use algorithm to get descendant count
+                # when selected node is topic, count its descendants,
+                # @see contentcuration.viewsets.common.descendant_count
                 When(
                     condition=WhenQ(*self.build_topic_condition(F("kind_id"))),
-                    then=(F("rght") - F("lft") - Value(1)) / Value(2),
+                    then=descendant_count(),
                 ),
-                # integer division floors the result in postgres
                 default=Value(1),
+                output_field=IntegerField(),
             )
         )
 
@@ -1,5 +1,17 @@
+import hashlib
+
+from django.core.cache import cache
+
 from contentcuration.models import ContentNode
 from contentcuration.node_metadata.annotations import MetadataAnnotation
+from contentcuration.utils.cache import get_tree_revision
+
+
+# Cached metadata is keyed by the revision of its tree, so it is never stale, and only
+# expires to clear out the metadata of old revisions
+METADATA_CACHE_TIMEOUT = 24 * 60 * 60
+
+METADATA_CACHE_KEY = "node_metadata_{tree_id}_{revision}_{annotations}_{node_pk}"
 
 
 class Metadata(object):
@@ -20,6 +32,10 @@ class Metadata(object):
     Example:
         node = ContentNode.objects.get(pk='123...abc')
         data = Metadata(some_thing=MetadataAnnotation()).get(node.pk)
+
+    Example:
+        topic = ContentNode.objects.get(pk='123...abc')
+        data = Metadata(some_thing=MetadataAnnotation()).for_children(topic.pk)
     """
     def __init__(self, queryset_or_model=None, **annotations):
         """
@@ -52,15 +68,91 @@ class Metadata(object):
             return Metadata(ContentNode.objects.filter(pk=node_pk), **self.annotations).get(node_pk)
 
         if self.metadata is None:
-            self.metadata = {}
-            query = self.build()
-
-            # Finally, clear ordering (MPTT adds ordering by default)
-            for row in query:
-                self.metadata.update({row.pop('id'): row})
+            self.metadata = self.fetch()
 
         return self.metadata.get(node_pk, None)
 
+    def get_many(self, node_pks):
+        """
+        A dict of metadata for each of the nodes identified by `node_pks`, queried together
+        :param node_pks: A list of node pks
+        :return: A dict of metadata keyed by node pk
+        """
+        query = ContentNode.objects.all() if self.query is None else self.query
+        return Metadata(query.filter(pk__in=node_pks), **self.annotations).fetch()
+
+    def for_children(self, parent_pk):
+        """
+        A dict of metadata for each of the children of the node identified by `parent_pk`,
+        queried together
+        :param parent_pk: The pk of the parent node
+        :return: A dict of metadata keyed by node pk
+        """
+        query = ContentNode.objects.all() if self.query is None else self.query
+        return Metadata(query.filter(parent_id=parent_pk), **self.annotations).fetch()
+
+    def fetch(self):
+        """
+        Metadata is cached for each node, under the revision of the node's tree, so only the
+        metadata of nodes that is not cached for the current revision of their tree is queried
+        :return: A dict of metadata keyed by node pk
+        """
+        annotations_key = self.get_annotations_key()
+        if annotations_key is None:
+            return self.fetch_uncached(self.query)
+
+        revisions = {}
+        cache_keys = {}
+        for node_pk, tree_id in self.query.values_list('id', 'tree_id').order_by():
+            if tree_id not in revisions:
+                revisions[tree_id] = get_tree_revision(tree_id)
+            cache_keys[node_pk] = METADATA_CACHE_KEY.format(
+                tree_id=tree_id,
+                revision=revisions[tree_id],
+                annotations=annotations_key,
+                node_pk=node_pk,
+            )
+
+        cached = cache.get_many(list(cache_keys.values()))
+        metadata = {
+            node_pk: cached[key] for node_pk, key in cache_keys.items() if key in cached
+        }
+        missing = [node_pk for node_pk in cache_keys if node_pk not in metadata]
+
+        if missing:
+            fetched = self.fetch_uncached(self.query.filter(pk__in=missing))
+            cache.set_many(
+                {cache_keys[node_pk]: row for node_pk, row in fetched.items()},
+                METADATA_CACHE_TIMEOUT,
+            )
+            metadata.update(fetched)
+
+        return metadata
+
+    def fetch_uncached(self, query):
+        """
+        :param query: A ContentNode queryset
+        :return: A dict of metadata keyed by node pk, for the nodes in `query`
+        """
+        metadata = {}
+        for row in Metadata(query, **self.annotations).build():
+            metadata.update({row.pop('id'): row})
+        return metadata
+
+    def get_annotations_key(self):
+        """
+        :return: A string identifying the set of annotations, or None when there are
+            annotations other than instances of MetadataAnnotation, which can't be identified
+        """
+        parts = []
+        for field_name, annotation in sorted(self.annotations.items()):
+            if not isinstance(annotation, MetadataAnnotation):
+                return None
+            parts.append('{}={}{}'.format(
+                field_name, type(annotation).__name__, sorted(vars(annotation).items())
+            ))
+        return hashlib.md5(','.join(parts).encode('utf-8')).hexdigest()
+
     def build(self):
         """
         :return: A complete queryset to return the metadata
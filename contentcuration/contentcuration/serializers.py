@@ -109,3 +109,4 @@ class GetTreeDataSerializer(serializers.Serializer):
     channel_id = serializers.CharField(required=True)
     tree = serializers.CharField(required=False, default='main')
     node_id = serializers.CharField(required=False)
+    stream = serializers.BooleanField(required=False, default=False)
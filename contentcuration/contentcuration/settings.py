@@ -394,6 +394,43 @@ ORPHANAGE_ROOT_ID = "00000000000000000000000000000000"
 # do choose to implement restore of old chefs, we will need to ensure moving nodes does not cause a tree sort.
 DELETED_CHEFS_ROOT_ID = "11111111111111111111111111111111"
 
+# How mptt operations on a ContentNode tree are serialized, either "rows" to lock every node
+# in the tree with SELECT ... FOR UPDATE, or "advisory" to take a single advisory lock on
+# the tree_id. Advisory locks only exclude other advisory locks, so all Studio processes
+# sharing a database must use the same backend.
+MPTT_LOCK_BACKEND = os.getenv("MPTT_LOCK_BACKEND") or "rows"
+
+# How many times to retry acquiring a lock on ContentNode trees after a deadlock, and the base delay
+# in seconds before retrying, which is doubled for each retry and jittered.
+MPTT_LOCK_DEADLOCK_RETRIES = int(os.getenv("MPTT_LOCK_DEADLOCK_RETRIES") or 3)
+MPTT_LOCK_RETRY_DELAY = float(os.getenv("MPTT_LOCK_RETRY_DELAY") or 0.05)
+
+# When set, ContentNode inserts and copies leave this many free lft/rght values alongside the
+# subtrees they add, so that later inserts can usually be placed without renumbering the rest of
+# the tree. When the free values run out, only the closest ancestor with enough room is renumbered.
+# Trees can be compacted back to dense values with the renumber_node_trees command.
+MPTT_SPARSE_GAP = int(os.getenv("MPTT_SPARSE_GAP") or 0)
+
+# When set, the trees whose files or structure are written are logged in TreeResourceSizeChange,
+# so that the `calculateresources` command only recalculates the sizes of trees that have changed.
+# Every run of the command drains the log, so only set this where it is scheduled to run regularly,
+# for example every few minutes from cron with --incremental, otherwise the log grows without bound.
+# When not set, the sizes of changed trees are removed instead, and channel sizes are calculated
+# from their files until the command next runs and recalculates them.
+TRACK_TREE_RESOURCE_SIZE_CHANGES = bool(os.getenv("TRACK_TREE_RESOURCE_SIZE_CHANGES"))
+
+# How long, in seconds, copy operations should aim to hold a lock on the target tree for
+# when copying each batch of nodes. Batch sizes are adapted to the measured copy rate
+# to meet this, so raising it speeds up large copies at the cost of longer waits for
+# other operations on the same tree.
+COPY_TARGET_LOCK_TIME = float(os.getenv("COPY_TARGET_LOCK_TIME") or 0.05)
+
+# The address of a Prometheus Pushgateway, such as pushgateway:9091, that Celery workers push
+# their metrics to after every task, as they don't serve /metrics. Each worker process pushes
+# to its own group, labelled with the host name and process id, so groups of workers that
+# have stopped should be deleted from the Pushgateway, or they are reported indefinitely.
+PROMETHEUS_PUSHGATEWAY = os.getenv("PROMETHEUS_PUSHGATEWAY")
+
 # How long we should cache any APIs that return public channel list details, which change infrequently
 PUBLIC_CHANNELS_CACHE_DURATION = 300
 
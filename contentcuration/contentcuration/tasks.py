@@ -21,11 +21,14 @@ from contentcuration.utils.channel import calculate_channel_metadata
 from contentcuration.utils.csv_writer import write_channel_csv_file
 from contentcuration.utils.csv_writer import write_user_csv
 from contentcuration.utils.publish import publish_channel
+from contentcuration.utils.sentry import report_exception
 from contentcuration.utils.sync import sync_channel
 from contentcuration.utils.user import cache_multiple_users_metadata
 from contentcuration.viewsets.sync.constants import CHANNEL
 from contentcuration.viewsets.sync.constants import CONTENTNODE
 from contentcuration.viewsets.sync.constants import COPYING_FLAG
+from contentcuration.viewsets.sync.utils import add_event_for_user
+from contentcuration.viewsets.sync.utils import generate_delete_event
 from contentcuration.viewsets.sync.utils import generate_update_event
 
 
@@ -95,6 +98,75 @@ def duplicate_nodes_task(
     return {"changes": [generate_update_event(pk, CONTENTNODE, {COPYING_FLAG: False})]}
 
 
+@task(bind=True, name="duplicate_nodes_batch_task")
+def duplicate_nodes_batch_task(self, user_id, channel_id, copies):
+    """
+    Copies a batch of nodes in a single task. Each entry in copies is a dict of the keyword
+    arguments accepted by duplicate_nodes_task (source_id, target_id, pk, position, mods and
+    excluded_descendants).
+
+    Copies are run one after the other, so the copies in a batch never contend with each other
+    for the target tree locks, and progress is tracked against the total number of nodes in the
+    batch. The result of each copy is sent to the user through the sync event channel as soon as
+    it completes, rather than only once the whole batch has finished. A copy that fails is
+    reported with the errors of its change, and the rest of the batch carries on.
+    """
+    self.progress = 0
+    self.update_state(state="STARTED", meta={"progress": self.progress})
+
+    source_ids = [copy["source_id"] for copy in copies]
+    sources = ContentNode.objects.in_bulk(source_ids)
+    editable_source_ids = set(
+        ContentNode.filter_edit_queryset(
+            ContentNode.objects.filter(id__in=source_ids), user_id=user_id
+        ).values_list("id", flat=True)
+    )
+
+    total_nodes = sum(
+        ContentNode.objects.count_nodes_to_copy(
+            sources[copy["source_id"]], copy.get("excluded_descendants")
+        )
+        for copy in copies
+        if copy["source_id"] in sources
+    )
+
+    changes = []
+    for copy in copies:
+        pk = copy.get("pk")
+        try:
+            # Fetch the source and target for each copy, as earlier copies in
+            # the batch may have changed their positions in the tree
+            source = ContentNode.objects.get(id=copy["source_id"])
+            target = ContentNode.objects.get(id=copy["target_id"])
+        except ContentNode.DoesNotExist:
+            event = generate_delete_event(pk, CONTENTNODE)
+        else:
+            event = generate_update_event(pk, CONTENTNODE, {COPYING_FLAG: False})
+            try:
+                ContentNode.objects.copy_node(
+                    source,
+                    target,
+                    copy.get("position", "last-child"),
+                    pk,
+                    copy.get("mods"),
+                    copy.get("excluded_descendants"),
+                    can_edit_source_channel=source.id in editable_source_ids,
+                    total_nodes=total_nodes,
+                )
+            except IntegrityError:
+                # This will happen if the node has already been created,
+                # see duplicate_nodes_task
+                pass
+            except Exception as e:
+                # Report the failed copy to the user and carry on with the rest of the batch
+                logger.exception("Failed to copy node {} to {}".format(source.id, target.id))
+                report_exception(e)
+                event["errors"] = [str(e)]
+        add_event_for_user(user_id, event)
+        changes.append(event)
+    return {"changes": changes}
+
+
 @task(bind=True, name="export_channel_task")
 def export_channel_task(self, user_id, channel_id, version_notes=""):
     channel = publish_channel(
@@ -193,6 +265,7 @@ def cache_multiple_users_metadata_task(users):
 
 type_mapping = {
     "duplicate-nodes": {"task": duplicate_nodes_task, "progress_tracking": True},
+    "duplicate-nodes-batch": {"task": duplicate_nodes_batch_task, "progress_tracking": True},
     "export-channel": {"task": export_channel_task, "progress_tracking": True},
     "sync-channel": {"task": sync_channel_task, "progress_tracking": True},
 }
@@ -21,6 +21,17 @@ from contentcuration.models import User
 from contentcuration.utils import minio_utils
 
 
+def run_on_commit_callbacks():
+    """
+    Runs the callbacks waiting for the current transaction to commit,
+    as the transaction that wraps each TestCase never does
+    """
+    while connection.run_on_commit:
+        callbacks, connection.run_on_commit = connection.run_on_commit, []
+        for _, callback in callbacks:
+            callback()
+
+
 class BucketTestClassMixin(object):
     @classmethod
     def create_bucket(cls):
@@ -5,6 +5,7 @@ from builtins import range
 from builtins import str
 
 from django.core.urlresolvers import reverse
+from mock import patch
 
 from .base import BaseAPITestCase
 from contentcuration.models import ContentNode
@@ -14,6 +15,7 @@ from contentcuration.tasks_test import non_async_test_task
 from contentcuration.viewsets.sync.constants import CONTENTNODE
 from contentcuration.viewsets.sync.constants import COPYING_FLAG
 from contentcuration.viewsets.sync.utils import generate_update_event
+from contentcuration.viewsets.sync.utils import get_and_clear_user_events
 
 
 class AsyncTaskTestCase(BaseAPITestCase):
@@ -182,3 +184,88 @@ class AsyncTaskTestCase(BaseAPITestCase):
             if child.original_source_node_id and child.source_node_id:
                 assert child.original_source_node_id in node_ids
                 assert child.source_node_id in node_ids
+
+    def test_duplicate_nodes_batch_task(self):
+        source_ids = [
+            ContentNode.objects.get(node_id="0000000000000000000000000000000" + str(i)).pk
+            for i in range(3, 6)
+        ]
+        parent_node = ContentNode.objects.get(
+            node_id="00000000000000000000000000000002"
+        )
+        copies = [
+            {"source_id": source_id, "target_id": parent_node.pk, "pk": uuid.uuid4().hex}
+            for source_id in source_ids
+        ]
+
+        task, task_info = create_async_task(
+            "duplicate-nodes-batch",
+            self.user,
+            apply_async=False,
+            user_id=self.user.pk,
+            channel_id=self.channel.pk,
+            copies=copies,
+        )
+
+        url = reverse("task-detail", kwargs={"task_id": task_info.task_id})
+        response = self.get(url)
+        self.assertEqual(response.data["status"], "SUCCESS")
+        self.assertEqual(response.data["task_type"], "duplicate-nodes-batch")
+        self.assertEqual(response.data["metadata"]["progress"], 100)
+        self.assertEqual(
+            response.data["metadata"]["result"]["changes"],
+            [
+                generate_update_event(copy["pk"], CONTENTNODE, {COPYING_FLAG: False})
+                for copy in copies
+            ],
+        )
+        self.assertEqual(
+            get_and_clear_user_events(self.user.pk),
+            response.data["metadata"]["result"]["changes"],
+        )
+
+        children = list(parent_node.get_children().values_list("id", flat=True))
+        self.assertEqual(children[-3:], [copy["pk"] for copy in copies])
+
+    def test_duplicate_nodes_batch_task_error(self):
+        source_ids = [
+            ContentNode.objects.get(node_id="0000000000000000000000000000000" + str(i)).pk
+            for i in range(3, 6)
+        ]
+        parent_node = ContentNode.objects.get(
+            node_id="00000000000000000000000000000002"
+        )
+        copies = [
+            {"source_id": source_id, "target_id": parent_node.pk, "pk": uuid.uuid4().hex}
+            for source_id in source_ids
+        ]
+        copy_node = ContentNode.objects.copy_node
+
+        def fail_second_copy(source, *args, **kwargs):
+            if source.pk == source_ids[1]:
+                raise ValueError("Copy failed")
+            return copy_node(source, *args, **kwargs)
+
+        with patch.object(ContentNode.objects, "copy_node", side_effect=fail_second_copy):
+            task, task_info = create_async_task(
+                "duplicate-nodes-batch",
+                self.user,
+                apply_async=False,
+                user_id=self.user.pk,
+                channel_id=self.channel.pk,
+                copies=copies,
+            )
+
+        url = reverse("task-detail", kwargs={"task_id": task_info.task_id})
+        response = self.get(url)
+        self.assertEqual(response.data["status"], "SUCCESS")
+        changes = response.data["metadata"]["result"]["changes"]
+        self.assertEqual([change["key"] for change in changes], [copy["pk"] for copy in copies])
+        for change in changes:
+            self.assertEqual(change["mods"], {COPYING_FLAG: False})
+        self.assertEqual(changes[1]["errors"], ["Copy failed"])
+        self.assertNotIn("errors", changes[0])
+        self.assertNotIn("errors", changes[2])
+
+        children = list(parent_node.get_children().values_list("id", flat=True))
+        self.assertEqual(children[-2:], [copies[0]["pk"], copies[2]["pk"]])
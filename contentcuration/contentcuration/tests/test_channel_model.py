@@ -5,18 +5,29 @@ import json
 from datetime import datetime
 
 from django.core.urlresolvers import reverse_lazy
+from django.test import override_settings
+from le_utils.constants import content_kinds
 from past.utils import old_div
 
 from .base import BaseAPITestCase
+from .base import run_on_commit_callbacks
 from .base import StudioTestCase
 from .testdata import base64encoding
 from .testdata import channel
 from .testdata import node
 from contentcuration.models import Channel
+from contentcuration.models import ChannelResourceSize
 from contentcuration.models import ChannelSet
+from contentcuration.models import ContentNode
+from contentcuration.models import File
 from contentcuration.models import generate_storage_url
 from contentcuration.models import SecretToken
+from contentcuration.models import TreeResourceSize
+from contentcuration.models import TreeResourceSizeChange
+from contentcuration.models import User
 from contentcuration.tests.utils import mixer
+from contentcuration.utils.cache import get_channel_generation
+from contentcuration.utils.channel import get_tree_resource_size
 
 
 class PublicChannelsTestCase(StudioTestCase):
@@ -122,6 +133,135 @@ class ChannelResourceCountTestCase(StudioTestCase):
         assert self.channel.get_resource_count() == count
 
 
+class ChannelResourceSizeTestCase(StudioTestCase):
+    """
+    Tests for channel.get_resource_size().
+    """
+
+    def setUp(self):
+        super(ChannelResourceSizeTestCase, self).setUp()
+        self.channel = channel()
+        self.resource = self.channel.main_tree.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+
+    def _calculate_size(self):
+        files = File.objects.filter(contentnode__tree_id=self.channel.main_tree.tree_id)
+        return sum(file_size or 0 for _, file_size in set(files.values_list("checksum", "file_size")))
+
+    def test_cached(self):
+        size = self.channel.get_resource_size()
+
+        with self.assertNumQueries(0):
+            assert self.channel.get_resource_size() == size
+
+    def test_file_added(self):
+        size = self.channel.get_resource_size()
+
+        File.objects.create(contentnode=self.resource, checksum="a" * 32, file_size=1000)
+
+        assert self.channel.get_resource_size() == size + 1000
+        assert self.channel.get_resource_size() == self._calculate_size()
+
+    def test_node_copied(self):
+        self.channel.get_resource_size()
+        other_channel = channel()
+
+        other_channel.main_tree.get_children().first().copy_to(self.channel.main_tree)
+
+        assert self.channel.get_resource_size() == self._calculate_size()
+
+    def test_tree_swapped(self):
+        self.channel.get_resource_size()
+
+        self.channel.main_tree = channel().main_tree.copy()
+        self.channel.save()
+
+        assert self.channel.get_resource_size() == self._calculate_size()
+
+    def test_members_changed(self):
+        generation = get_channel_generation(self.channel.id)
+        user = mixer.blend(User)
+
+        self.channel.viewers.add(user)
+        assert get_channel_generation(self.channel.id) != generation
+
+        generation = get_channel_generation(self.channel.id)
+        user.editable_channels.add(self.channel)
+        assert get_channel_generation(self.channel.id) != generation
+
+
+@override_settings(TRACK_TREE_RESOURCE_SIZE_CHANGES=True)
+class TreeResourceSizeTestCase(StudioTestCase):
+    """
+    Tests for ChannelResourceSize.refresh_summary().
+    """
+
+    def setUp(self):
+        super(TreeResourceSizeTestCase, self).setUp()
+        self.channel = channel()
+        self.tree_id = self.channel.main_tree.tree_id
+        ChannelResourceSize.refresh_summary()
+
+    def _calculate_size(self):
+        return sum(
+            file_size for _, file_size in set(
+                File.objects.filter(contentnode__tree_id=self.tree_id).values_list("checksum", "file_size")
+            )
+        )
+
+    def test_initial_refresh_summary(self):
+        TreeResourceSize.objects.all().delete()
+
+        assert ChannelResourceSize.refresh_summary(batch_size=1) == 0
+        assert TreeResourceSize.objects.get(tree_id=self.tree_id).resource_size == self._calculate_size()
+
+    def test_refresh_summary(self):
+        resource = self.channel.main_tree.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+        File.objects.create(contentnode=resource, checksum="a" * 32, file_size=1000)
+
+        assert ChannelResourceSize.refresh_summary() == 1
+        assert TreeResourceSize.objects.get(tree_id=self.tree_id).resource_size == self._calculate_size()
+
+    def test_refresh_summary_unchanged(self):
+        assert ChannelResourceSize.refresh_summary() == 0
+
+    def test_refresh_summary_tree_deleted(self):
+        ContentNode.objects.filter(tree_id=self.tree_id).delete()
+        run_on_commit_callbacks()
+
+        ChannelResourceSize.refresh_summary()
+
+        assert not TreeResourceSize.objects.filter(tree_id=self.tree_id).exists()
+
+    def test_changes_not_tracked(self):
+        resource = self.channel.main_tree.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+        with self.settings(TRACK_TREE_RESOURCE_SIZE_CHANGES=False):
+            File.objects.create(contentnode=resource, checksum="a" * 32, file_size=1000)
+
+        assert not TreeResourceSizeChange.objects.exists()
+        # The size is removed until it is recalculated
+        assert not TreeResourceSize.objects.filter(tree_id=self.tree_id).exists()
+
+        ChannelResourceSize.refresh_summary()
+
+        assert TreeResourceSize.objects.get(tree_id=self.tree_id).resource_size == self._calculate_size()
+
+    def test_channel_metadata_size(self):
+        TreeResourceSize.objects.filter(tree_id=self.tree_id).update(resource_size=12345)
+
+        assert get_tree_resource_size(self.tree_id) == 12345
+
+        TreeResourceSize.objects.filter(tree_id=self.tree_id).delete()
+
+        assert get_tree_resource_size(self.tree_id) == self._calculate_size()
+
+    def test_refresh_view_concurrently(self):
+        ChannelResourceSize.initialize_view()
+
+        ChannelResourceSize.refresh_view(concurrently=True)
+
+        assert ChannelResourceSize.objects.get(tree_id=self.tree_id).resource_size == self._calculate_size()
+
+
 class ChannelGetDateModifiedTestCase(StudioTestCase):
     """
     Tests for channel.get_date_modified().
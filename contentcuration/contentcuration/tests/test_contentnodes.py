@@ -3,14 +3,22 @@ from __future__ import division
 
 import random
 import string
+import threading
 import time
 from builtins import range
 from builtins import str
 from builtins import zip
 
 import pytest
+from django.core.management import call_command
+from django.db import connection
 from django.db.utils import DataError
+from django.db.utils import OperationalError
+from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from le_utils.constants import content_kinds
+from le_utils.constants import roles
 from mixer.backend.django import mixer
 from mock import patch
 from past.utils import old_div
@@ -18,16 +26,27 @@ from past.utils import old_div
 from . import testdata
 from .base import BaseTestCase
 from .testdata import create_studio_file
+from contentcuration.db.models.manager import ADVISORY_LOCK_BACKEND
+from contentcuration.db.models.manager import BATCH_SIZE
+from contentcuration.db.models.manager import CopyBatchSizer
+from contentcuration.db.models.manager import MAX_BATCH_SIZE
+from contentcuration.db.models.manager import MIN_BATCH_SIZE
+from contentcuration.db.models.manager import ROW_LOCK_BACKEND
+from contentcuration.models import CanonicalContentNode
 from contentcuration.models import Channel
 from contentcuration.models import ContentKind
 from contentcuration.models import ContentNode
+from contentcuration.models import ContentNodeAggregate
 from contentcuration.models import ContentTag
 from contentcuration.models import FormatPreset
 from contentcuration.models import generate_storage_url
 from contentcuration.models import Language
+from contentcuration.node_metadata.annotations import DescendantCount
+from contentcuration.node_metadata.query import Metadata
 from contentcuration.utils.db_tools import TreeBuilder
 from contentcuration.utils.files import create_thumbnail_from_base64
 from contentcuration.utils.sync import sync_node
+from search.viewsets.contentnode import ContentNodeFilter
 
 
 def _create_nodes(num_nodes, title, parent=None, levels=2):
@@ -60,6 +79,82 @@ def _check_nodes(
         _check_nodes(node, title, original_channel_id, source_channel_id, channel)
 
 
+def _check_aggregates(root):
+    """
+    Checks that the stored descendant counts for every node in the tree
+    match the counts calculated from the descendants themselves.
+    """
+    for node in root.get_descendants(include_self=True):
+        stored = ContentNodeAggregate.objects.filter(contentnode=node).values(
+            "resource_count", "coach_count", "error_count", "updated_count", "new_count"
+        ).get()
+        calculated = ContentNode.objects._calculate_aggregates(node.get_descendants())
+        assert stored == calculated, "Node {} has incorrect aggregates {}, expected {}".format(
+            node.pk, stored, calculated
+        )
+
+
+def _check_tree_structure(tree_id):
+    """
+    Checks that the mptt values for a tree are consistent, by comparing
+    them to the values calculated when the tree is rebuilt.
+    """
+    values = list(
+        ContentNode.objects.filter(tree_id=tree_id)
+        .order_by("lft")
+        .values_list("id", "parent_id", "lft", "rght", "level")
+    )
+    ContentNode.objects.partial_rebuild(tree_id)
+    rebuilt = list(
+        ContentNode.objects.filter(tree_id=tree_id)
+        .order_by("lft")
+        .values_list("id", "parent_id", "lft", "rght", "level")
+    )
+    assert values == rebuilt, "Tree {} has inconsistent mptt values".format(tree_id)
+
+
+def _check_sparse_tree_structure(tree_id):
+    """
+    Checks that the mptt values for a tree, which may have gaps between them,
+    are properly nested and consistent with the parent and level of every node.
+    """
+    stack = []
+    nodes = (
+        ContentNode.objects.filter(tree_id=tree_id)
+        .order_by("lft")
+        .values_list("id", "parent_id", "lft", "rght", "level")
+    )
+    for node_id, parent_id, lft, rght, level in nodes:
+        while stack and stack[-1][2] < lft:
+            stack.pop()
+        assert lft < rght, "Node {} has inconsistent mptt values".format(node_id)
+        if stack:
+            parent = stack[-1]
+            assert parent[0] == parent_id and rght < parent[2] and level == parent[3] + 1, (
+                "Node {} is not nested in its parent".format(node_id)
+            )
+        else:
+            assert parent_id is None and level == 0, "Tree {} has more than one root".format(tree_id)
+        stack.append((node_id, lft, rght, level))
+
+
+def _check_paths(tree_id):
+    """
+    Checks that the stored path of every node in a tree
+    matches its ancestors according to the mptt fields.
+    """
+    nodes = ContentNode.objects.filter(tree_id=tree_id).values_list(
+        "id", "lft", "rght", "path"
+    )
+    for node_id, lft, rght, path in nodes:
+        ancestor_ids = list(
+            ContentNode.objects.filter(tree_id=tree_id, lft__lt=lft, rght__gt=rght)
+            .order_by("lft")
+            .values_list("id", flat=True)
+        )
+        assert path == ancestor_ids, "Node {} has an inconsistent path".format(node_id)
+
+
 def _check_files_for_object(source, copy):
     source_files = source.files.all().order_by("file_on_disk")
     copy_files = copy.files.all().order_by("file_on_disk")
@@ -170,6 +265,15 @@ class NodeGettersTestCase(BaseTestCase):
         assert details["resource_size"] > 0
         assert len(details["kind_count"]) > 0
 
+    def test_get_node_details_num_queries(self):
+        root = TreeBuilder(levels=2, num_children=4).root
+        with CaptureQueriesContext(connection) as small_tree:
+            root.get_details()
+        # A larger tree is summarized with the same number of queries
+        root = TreeBuilder(levels=3, num_children=6).root
+        with self.assertNumQueries(len(small_tree.captured_queries)):
+            root.get_details()
+
 
 class NodeOperationsTestCase(BaseTestCase):
     def setUp(self):
@@ -183,9 +287,10 @@ class NodeOperationsTestCase(BaseTestCase):
     @pytest.mark.skipif(True, reason="Benchmarking test")
     def test_duplicate_nodes_benchmark(self):
         """
-        Benchmarks copy operations with different batch_sizes
+        Benchmarks copy operations with different batch_sizes,
+        a batch_size of None uses adaptive batch sizes
         """
-        for batch_size in [50, 75, 100, 150, 200, 400, 500]:
+        for batch_size in [None, 50, 75, 100, 150, 200, 400, 500]:
             new_channel = testdata.channel()
             start = time.time()
             with patch(
@@ -440,6 +545,106 @@ class NodeOperationsTestCase(BaseTestCase):
             self.channel.main_tree.get_children().count() - 1,
         )
 
+    def test_duplicate_nodes_with_nested_excluded_descendants(self):
+        """
+        Ensures that when we exclude nodes, and some of their descendants,
+        the copy is given a consistent tree structure
+        """
+        new_channel = testdata.channel()
+
+        excluded_topic = self.channel.main_tree.get_children().first()
+        excluded_descendants = {
+            excluded_topic.node_id: True,
+            excluded_topic.get_children().first().node_id: True,
+            self.channel.main_tree.get_children().last().get_children().first().node_id: True,
+        }
+
+        copy = self.channel.main_tree.copy_to(
+            new_channel.main_tree, excluded_descendants=excluded_descendants
+        )
+
+        self.assertEqual(
+            copy.get_descendant_count(),
+            ContentNode.objects.count_nodes_to_copy(
+                self.channel.main_tree, excluded_descendants
+            ) - 1,
+        )
+        self.assertFalse(
+            copy.get_descendants()
+            .filter(source_node_id__in=excluded_descendants.keys())
+            .exists()
+        )
+        _check_tree_structure(new_channel.main_tree.tree_id)
+        _check_aggregates(new_channel.main_tree)
+
+    def test_duplicate_nodes_with_excluded_descendants_in_batches(self):
+        """
+        Ensures that excluded descendants are left out when the copy is split
+        into several smaller copies
+        """
+        new_channel = testdata.channel()
+
+        excluded_topic = self.channel.main_tree.get_children().first()
+        excluded_descendants = {
+            excluded_topic.get_children().first().node_id: True,
+            self.channel.main_tree.get_children().last().node_id: True,
+        }
+
+        copy = self.channel.main_tree.copy_to(
+            new_channel.main_tree,
+            excluded_descendants=excluded_descendants,
+            batch_size=1,
+        )
+
+        self.assertEqual(
+            copy.get_descendant_count(),
+            ContentNode.objects.count_nodes_to_copy(
+                self.channel.main_tree, excluded_descendants
+            ) - 1,
+        )
+        self.assertFalse(
+            copy.get_descendants()
+            .filter(source_node_id__in=excluded_descendants.keys())
+            .exists()
+        )
+        _check_tree_structure(new_channel.main_tree.tree_id)
+        _check_aggregates(new_channel.main_tree)
+
+    def test_duplicate_and_move_nodes_advisory_lock(self):
+        """
+        Ensures that copies and moves keep the tree consistent when
+        serialized with advisory locks
+        """
+        new_channel = testdata.channel()
+
+        with self.settings(MPTT_LOCK_BACKEND=ADVISORY_LOCK_BACKEND):
+            copy = self.channel.main_tree.copy_to(new_channel.main_tree, batch_size=10)
+            copy.get_children().last().move_to(new_channel.main_tree, "first-child")
+
+        _check_tree_structure(new_channel.main_tree.tree_id)
+        _check_aggregates(new_channel.main_tree)
+
+    def test_duplicate_nodes_into_own_descendant(self):
+        """
+        Ensures that a topic can be copied into one of its own descendants
+        """
+        topic = self.channel.main_tree.get_children().first()
+        target = topic.get_children().filter(kind_id=content_kinds.TOPIC).first()
+
+        descendant_titles = list(
+            topic.get_descendants().order_by("lft").values_list("title", flat=True)
+        )
+
+        copy = topic.copy_to(target)
+
+        self.assertEqual(copy.parent_id, target.id)
+        self.assertEqual(
+            list(copy.get_descendants().order_by("lft").values_list("title", flat=True)),
+            descendant_titles,
+        )
+        _check_tree_structure(self.channel.main_tree.tree_id)
+        _check_aggregates(self.channel.main_tree)
+
     def test_duplicate_nodes_freeze_authoring_data_no_edit(self):
         """
         Ensures that when we copy nodes, we can exclude nodes from the descendant
@@ -670,6 +875,331 @@ class NodeOperationsTestCase(BaseTestCase):
         )
 
 
+@pytest.mark.skipif(True, reason="Benchmarking test")
+class MPTTLockBenchmarkTestCase(TransactionTestCase):
+    """
+    Benchmarks the mptt lock backends with concurrent moves and copies in one tree.
+    Each thread has its own database connection, so this needs a TransactionTestCase
+    for the threads to see the test data.
+    """
+
+    workers = 8
+    operations = 10
+
+    def setUp(self):
+        call_command("loadconstants")
+        self.channel = testdata.channel()
+        self.channel.main_tree = TreeBuilder().root
+        self.channel.save()
+
+    def _operate(self, worker, errors):
+        try:
+            topics = list(
+                ContentNode.objects.get(pk=self.channel.main_tree_id).get_children()
+            )
+            for i in range(self.operations):
+                topic = topics[(worker + i) % len(topics)]
+                if i % 2:
+                    topic.get_children().last().copy_to(topic)
+                else:
+                    topic.get_children().first().move_to(
+                        topics[(worker + i + 1) % len(topics)]
+                    )
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_lock_backend_contention(self):
+        for backend in (ROW_LOCK_BACKEND, ADVISORY_LOCK_BACKEND):
+            errors = []
+            with self.settings(MPTT_LOCK_BACKEND=backend), patch(
+                "contentcuration.db.models.manager.log_lock_time_spent"
+            ) as mock_log:
+                start = time.time()
+                threads = [
+                    threading.Thread(target=self._operate, args=(worker, errors))
+                    for worker in range(self.workers)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.time() - start
+                timings = [log[0][0] for log in mock_log.call_args_list]
+            print(
+                "Backend: {} took {} seconds for {} workers doing {} operations each, with {} errors".format(
+                    backend, elapsed, self.workers, self.operations, len(errors)
+                )
+            )
+            print(
+                "Backend: {} spent an average of {} seconds in mptt locks with {} locks for a total of {}".format(
+                    backend,
+                    sum(timings) / len(timings),
+                    len(timings),
+                    sum(timings),
+                )
+            )
+            _check_tree_structure(self.channel.main_tree.tree_id)
+
+
+class MPTTLockTestCase(BaseTestCase):
+    def test_lock_times(self):
+        tree_id = self.channel.main_tree.tree_id
+        with ContentNode.objects.lock_mptt(tree_id, operation="move") as lock:
+            pass
+        self.assertEqual(lock.tree_ids, [tree_id])
+        self.assertEqual(lock.operation, "move")
+        self.assertIsNotNone(lock.wait_time)
+        self.assertIsNotNone(lock.hold_time)
+        self.assertEqual(lock.deadlock_retries, 0)
+
+    def test_deadlock_retry(self):
+        acquire_lock = ContentNode.objects._acquire_lock
+        attempts = []
+
+        def deadlock_once(lock, values):
+            attempts.append(lock)
+            if len(attempts) == 1:
+                raise OperationalError("deadlock detected")
+            return acquire_lock(lock, values)
+
+        with self.settings(MPTT_LOCK_RETRY_DELAY=0), patch.object(
+            ContentNode.objects, "_acquire_lock", side_effect=deadlock_once
+        ):
+            with ContentNode.objects.lock_mptt(self.channel.main_tree.tree_id) as lock:
+                pass
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(lock.deadlock_retries, 1)
+
+    def test_deadlock_retry_limit(self):
+        with self.settings(MPTT_LOCK_RETRY_DELAY=0, MPTT_LOCK_DEADLOCK_RETRIES=2), patch.object(
+            ContentNode.objects,
+            "_acquire_lock",
+            side_effect=OperationalError("deadlock detected"),
+        ) as mock_acquire:
+            with self.assertRaises(OperationalError):
+                with ContentNode.objects.lock_mptt(self.channel.main_tree.tree_id):
+                    pass
+        self.assertEqual(mock_acquire.call_count, 3)
+
+
+class SparseTreeTestCase(BaseTestCase):
+    def setUp(self):
+        super(SparseTreeTestCase, self).setUp()
+        self.tree = TreeBuilder()
+        self.root = self.tree.root
+        self.topic = self.root.get_children().filter(kind_id=content_kinds.TOPIC).first()
+
+    def _create_node(self, title, target, position="last-child"):
+        node = ContentNode(title=title, kind_id=content_kinds.VIDEO)
+        node.insert_at(target, position=position, save=True)
+        return node
+
+    def test_sparse_inserts(self):
+        with self.settings(MPTT_SPARSE_GAP=10):
+            first = self._create_node("First", self.topic, "first-child")
+            last = self._create_node("Last", self.topic)
+            self._create_node("Left", last, "left")
+            self._create_node("Right", first, "right")
+            self.topic.refresh_from_db()
+            self.assertEqual(self.topic.get_descendant_count(), self.topic.get_descendants().count())
+
+        _check_sparse_tree_structure(self.root.tree_id)
+        _check_aggregates(self.root)
+        titles = list(self.topic.get_children().values_list("title", flat=True))
+        self.assertEqual(titles[:2], ["First", "Right"])
+        self.assertEqual(titles[-2:], ["Left", "Last"])
+
+    def test_sparse_descendant_count_metadata(self):
+        with self.settings(MPTT_SPARSE_GAP=10):
+            self._create_node("First", self.topic, "first-child")
+            self._create_node("Last", self.topic)
+            metadata = Metadata(self.topic, descendant_count=DescendantCount()).get(self.topic.pk)
+        self.assertEqual(metadata["descendant_count"], self.topic.get_descendants().count())
+
+    def test_sparse_inserts_renumber_locally(self):
+        with self.settings(MPTT_SPARSE_GAP=10):
+            # The first insert lays out the tree with gaps
+            self._create_node("Video", self.topic)
+            self.root.refresh_from_db()
+            root_rght = self.root.rght
+            for i in range(5):
+                self._create_node("Video {}".format(i), self.topic, "first-child")
+            self.root.refresh_from_db()
+
+        self.assertEqual(self.root.rght, root_rght)
+        _check_sparse_tree_structure(self.root.tree_id)
+
+    def test_sparse_copies(self):
+        with self.settings(MPTT_SPARSE_GAP=10):
+            self._create_node("Video", self.topic)
+            target = self.root.get_children().last()
+            deep_copy = self.topic.copy_to(target, position="right")
+            shallow_copy = self.topic.copy_to(target, position="left", batch_size=1)
+
+        _check_sparse_tree_structure(self.root.tree_id)
+        _check_aggregates(self.root)
+        titles = list(self.topic.get_descendants().values_list("title", flat=True))
+        for copy in (deep_copy, shallow_copy):
+            self.assertEqual(
+                list(copy.get_descendants().values_list("title", flat=True)), titles
+            )
+
+    def test_renumber_node_trees(self):
+        with self.settings(MPTT_SPARSE_GAP=10):
+            for i in range(5):
+                self._create_node("Video {}".format(i), self.topic, "first-child")
+        titles = list(self.root.get_descendants().values_list("title", flat=True))
+
+        call_command("renumber_node_trees", "--tree-id", str(self.root.tree_id))
+
+        _check_tree_structure(self.root.tree_id)
+        self.assertEqual(
+            list(self.root.get_descendants().values_list("title", flat=True)), titles
+        )
+
+
+class NodePathTestCase(BaseTestCase):
+    def setUp(self):
+        super(NodePathTestCase, self).setUp()
+        self.tree = TreeBuilder()
+        self.root = self.tree.root
+        self.topics = self.root.get_children().filter(kind_id=content_kinds.TOPIC)
+
+    def test_tree_builder_paths(self):
+        _check_paths(self.root.tree_id)
+
+    def test_create_node_path(self):
+        topic = self.topics.first()
+        node = ContentNode.objects.create(
+            title="New video", parent=topic, kind_id=content_kinds.VIDEO
+        )
+        self.assertEqual(node.path, [self.root.id, topic.id])
+        _check_paths(self.root.tree_id)
+
+    def test_move_node_paths(self):
+        self.topics.first().move_to(self.topics.last(), "first-child")
+        _check_paths(self.root.tree_id)
+
+    def test_move_node_to_tree_paths(self):
+        other_tree = TreeBuilder()
+        self.topics.first().move_to(other_tree.root)
+        _check_paths(self.root.tree_id)
+        _check_paths(other_tree.root.tree_id)
+
+    def test_save_parent_paths(self):
+        topic = self.topics.first()
+        topic.parent = self.topics.last()
+        topic.save()
+        _check_paths(self.root.tree_id)
+
+    def test_deep_copy_node_paths(self):
+        self.topics.first().copy_to(self.topics.last())
+        _check_paths(self.root.tree_id)
+
+    def test_shallow_copy_node_paths(self):
+        self.topics.first().copy_to(self.topics.last(), batch_size=1)
+        _check_paths(self.root.tree_id)
+
+    def test_get_ancestors(self):
+        node = self.root.get_descendants().order_by("-level").first()
+        mptt_ancestors = ContentNode.objects.filter(
+            tree_id=node.tree_id, lft__lte=node.lft, rght__gte=node.rght
+        ).order_by("lft")
+        self.assertEqual(
+            list(node.get_ancestors(include_self=True)), list(mptt_ancestors)
+        )
+        self.assertEqual(
+            list(node.get_ancestors(ascending=True)), list(mptt_ancestors)[-2::-1]
+        )
+
+
+class CopyBatchSizerTestCase(TestCase):
+    def test_fixed_batch_size(self):
+        sizer = CopyBatchSizer(batch_size=1000, target_lock_time=0.05)
+        sizer.record(10, 1.0)
+        self.assertEqual(sizer.batch_size, 1000)
+
+    def test_adaptive_batch_size(self):
+        sizer = CopyBatchSizer(target_lock_time=0.05)
+        self.assertEqual(sizer.batch_size, BATCH_SIZE)
+        # 2000 nodes per second for 0.05 seconds is 100 nodes, or 200 lft/rght values
+        sizer.record(200, 0.1)
+        self.assertEqual(sizer.batch_size, 200)
+        # The measured rate is smoothed, giving 3000 nodes per second
+        sizer.record(400, 0.1)
+        self.assertEqual(sizer.batch_size, 300)
+
+    def test_adaptive_batch_size_limits(self):
+        sizer = CopyBatchSizer(target_lock_time=0.05)
+        sizer.record(1, 10.0)
+        self.assertEqual(sizer.batch_size, MIN_BATCH_SIZE)
+        sizer = CopyBatchSizer(target_lock_time=0.05)
+        sizer.record(100000, 0.001)
+        self.assertEqual(sizer.batch_size, MAX_BATCH_SIZE)
+
+
+class NodeAggregatesTestCase(BaseTestCase):
+    def setUp(self):
+        super(NodeAggregatesTestCase, self).setUp()
+
+        self.tree = TreeBuilder()
+        self.root = self.tree.root
+
+    def test_tree_builder_aggregates(self):
+        _check_aggregates(self.root)
+
+    def test_create_node_aggregates(self):
+        topic = self.root.get_children().filter(kind_id=content_kinds.TOPIC).first()
+        ContentNode.objects.create(
+            title="New video", parent=topic, kind_id=content_kinds.VIDEO, complete=False
+        )
+        _check_aggregates(self.root)
+
+    def test_update_node_aggregates(self):
+        node = self.root.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+        node.complete = not node.complete
+        node.role_visibility = roles.COACH
+        node.save()
+        _check_aggregates(self.root)
+
+    def test_move_node_aggregates(self):
+        topics = self.root.get_children().filter(kind_id=content_kinds.TOPIC)
+        source = topics.first()
+        target = topics.last()
+        for node in source.get_children():
+            node.move_to(target, "first-child")
+        _check_aggregates(self.root)
+
+    def test_move_node_to_tree_aggregates(self):
+        other_tree = TreeBuilder()
+        topic = self.root.get_children().filter(kind_id=content_kinds.TOPIC).first()
+        topic.move_to(other_tree.root)
+        _check_aggregates(self.root)
+        _check_aggregates(other_tree.root)
+
+    def test_delete_node_aggregates(self):
+        self.root.get_children().filter(kind_id=content_kinds.TOPIC).first().delete()
+        _check_aggregates(self.root)
+
+    def test_deep_copy_node_aggregates(self):
+        topic = self.root.get_children().filter(kind_id=content_kinds.TOPIC).first()
+        topic.copy_to(self.root.get_children().last(), position="right")
+        _check_aggregates(self.root)
+
+    def test_shallow_copy_node_aggregates(self):
+        other_tree = TreeBuilder()
+        other_tree.root.copy_to(self.root, batch_size=1)
+        _check_aggregates(self.root)
+
+    def test_rebuild_aggregates(self):
+        ContentNodeAggregate.objects.filter(contentnode__tree_id=self.root.tree_id).delete()
+        ContentNode.objects.filter(tree_id=self.root.tree_id).update(complete=False)
+        ContentNode.objects.rebuild_aggregates(self.root.tree_id)
+        _check_aggregates(self.root)
+
+
 class SyncNodesOperationTestCase(BaseTestCase):
     """
     Checks that sync nodes updates properies.
@@ -811,3 +1341,133 @@ class NodeCreationTestCase(BaseTestCase):
                 ContentTag,
                 tag_name=random.sample(string.printable, random.randint(51, 80)),
             )
+
+
+class SearchVectorTestCase(BaseTestCase):
+    def setUp(self):
+        super(SearchVectorTestCase, self).setUp()
+        self.node = ContentNode.objects.create(
+            title="Counting with apples",
+            description="Learn to count",
+            author="Jane Doe",
+            kind_id=content_kinds.VIDEO,
+            parent=self.channel.main_tree,
+        )
+
+    def _search(self, keywords, **filters):
+        return ContentNodeFilter(
+            data=dict(keywords=keywords, **filters),
+            queryset=ContentNode.objects.filter(tree_id=self.channel.main_tree.tree_id),
+        ).qs
+
+    def test_search_title(self):
+        self.assertIn(self.node, self._search("apples"))
+        self.assertNotIn(self.node, self._search("oranges"))
+
+    def test_search_stemmed(self):
+        self.node.language_id = "en"
+        self.node.save()
+        self.assertIn(self.node, self._search("apple counts", languages="en"))
+
+    def test_search_title_change(self):
+        self.node.title = "Counting with oranges"
+        self.node.save()
+        self.assertIn(self.node, self._search("oranges"))
+        self.assertNotIn(self.node, self._search("apples"))
+
+    def test_search_tags(self):
+        tag = ContentTag.objects.create(tag_name="fruit")
+        self.node.tags.add(tag)
+        self.assertIn(self.node, self._search("fruit"))
+
+        self.node.tags.remove(tag)
+        self.assertNotIn(self.node, self._search("fruit"))
+
+    def test_search_tag_renamed(self):
+        tag = ContentTag.objects.create(tag_name="fruit")
+        self.node.tags.add(tag)
+        tag.tag_name = "produce"
+        tag.save()
+        self.assertIn(self.node, self._search("produce"))
+        self.assertNotIn(self.node, self._search("fruit"))
+
+    def test_search_author(self):
+        self.assertIn(self.node, self._search("doe"))
+
+    def test_search_node_id(self):
+        self.assertIn(self.node, self._search(self.node.node_id))
+
+    def test_search_ranked(self):
+        other_node = ContentNode.objects.create(
+            title="Counting",
+            description="Counting with apples and oranges",
+            kind_id=content_kinds.VIDEO,
+            parent=self.channel.main_tree,
+        )
+        results = list(self._search("apples").order_by("-rank"))
+        # Matches in the title rank above matches in the description
+        self.assertLess(results.index(self.node), results.index(other_node))
+
+    def test_set_search_vectors(self):
+        ContentNode.objects.filter(pk=self.node.pk).update(search_vector=None)
+        self.assertNotIn(self.node, self._search("apples"))
+        call_command("set_search_vectors", batch_size=1)
+        self.assertIn(self.node, self._search("apples"))
+
+
+class CanonicalContentNodeTestCase(BaseTestCase):
+    def setUp(self):
+        super(CanonicalContentNodeTestCase, self).setUp()
+        self.node = ContentNode.objects.create(
+            title="Counting with apples",
+            kind_id=content_kinds.VIDEO,
+            parent=self.channel.main_tree,
+        )
+        self.channel.public = True
+        self.channel.save()
+
+    def _canonical(self, node):
+        return CanonicalContentNode.objects.filter(content_id=node.content_id).first()
+
+    def test_made_public(self):
+        canonical = self._canonical(self.node)
+        self.assertEqual(canonical.node_id, self.node.id)
+        self.assertEqual(canonical.location_ids, [self.node.id])
+        self.assertEqual(canonical.tree_ids, [self.node.tree_id])
+
+    def test_made_private(self):
+        self.channel.public = False
+        self.channel.save()
+        self.assertIsNone(self._canonical(self.node))
+
+    def test_deleted(self):
+        self.channel.deleted = True
+        self.channel.save()
+        self.assertIsNone(self._canonical(self.node))
+
+    def test_prefers_original(self):
+        other_channel = testdata.channel()
+        copy = self.node.copy_to(target=other_channel.main_tree)
+        other_channel.public = True
+        other_channel.save()
+
+        canonical = self._canonical(self.node)
+        self.assertEqual(canonical.node_id, self.node.id)
+        self.assertEqual(sorted(canonical.location_ids), sorted([self.node.id, copy.id]))
+
+        self.channel.public = False
+        self.channel.save()
+        canonical = self._canonical(self.node)
+        self.assertEqual(canonical.node_id, copy.id)
+        self.assertEqual(canonical.location_ids, [copy.id])
+
+    def test_refresh(self):
+        new_node = ContentNode.objects.create(
+            title="Counting with oranges",
+            kind_id=content_kinds.VIDEO,
+            parent=self.channel.main_tree,
+        )
+        self.assertIsNone(self._canonical(new_node))
+
+        CanonicalContentNode.refresh([self.channel.main_tree.tree_id])
+        self.assertEqual(self._canonical(new_node).node_id, new_node.id)
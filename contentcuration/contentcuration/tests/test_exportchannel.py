@@ -231,3 +231,4 @@ class ChannelExportPublishedData(StudioTestCase):
         self.assertTrue(channel.published_data)
         self.assertIsNotNone(channel.published_data.get(0))
         self.assertEqual(channel.published_data[0]['version_notes'], version_notes)
+        self.assertEqual(channel.published_data[0]['details']['resource_count'], 0)
@@ -7,11 +7,13 @@ from le_utils.constants import content_kinds
 
 from contentcuration.models import AssessmentItem
 from contentcuration.models import Channel
+from contentcuration.models import ChannelTree
 from contentcuration.models import ContentNode
 from contentcuration.models import File
 from contentcuration.models import generate_object_storage_name
 from contentcuration.models import Invitation
 from contentcuration.models import object_storage_name
+from contentcuration.models import PermissionSnapshot
 from contentcuration.tests import testdata
 from contentcuration.tests.base import StudioTestCase
 
@@ -233,6 +235,82 @@ class ChannelTestCase(PermissionQuerysetTestCase):
         self.assertQuerysetDoesNotContain(queryset, pk=channel.id)
 
 
+class ChannelTreeTestCase(StudioTestCase):
+    def test_create_channel(self):
+        channel = testdata.channel()
+        self.assertEqual(
+            ContentNode._annotate_channel_id(ContentNode.objects.filter(pk=channel.main_tree_id)).get().channel_id,
+            channel.id,
+        )
+        channel_tree = ChannelTree.objects.get(channel=channel, tree_name="trash_tree")
+        self.assertEqual(channel_tree.tree_id, channel.trash_tree.tree_id)
+        self.assertEqual(channel_tree.root_id, channel.trash_tree_id)
+
+    def test_swap_channel_trees(self):
+        channel = testdata.channel()
+        old_main_tree = channel.main_tree
+        channel.staging_tree = testdata.tree()
+        channel.save()
+
+        channel.previous_tree = channel.main_tree
+        channel.main_tree = channel.staging_tree
+        channel.staging_tree = None
+        channel.save()
+
+        self.assertEqual(
+            ContentNode._annotate_channel_id(ContentNode.objects.filter(pk=channel.main_tree_id)).get().channel_id,
+            channel.id,
+        )
+        self.assertIsNone(
+            ContentNode._annotate_channel_id(ContentNode.objects.filter(pk=old_main_tree.id)).get().channel_id,
+        )
+        self.assertEqual(ChannelTree.objects.get(channel=channel, tree_name="previous_tree").root_id, old_main_tree.id)
+        self.assertFalse(ChannelTree.objects.filter(channel=channel, tree_name="staging_tree").exists())
+
+
+class PermissionSnapshotTestCase(StudioTestCase):
+    def setUp(self):
+        super(PermissionSnapshotTestCase, self).setUp()
+        self.channel = testdata.channel()
+        self.user = testdata.user()
+        self.channel.editors.add(self.user)
+
+    def test_for_user(self):
+        snapshot = PermissionSnapshot.for_user(self.user)
+        self.assertEqual(snapshot.editable_channel_ids, [self.channel.id])
+        self.assertIn(self.channel.main_tree.tree_id, snapshot.editable_tree_ids)
+        self.assertEqual(snapshot.view_only_tree_ids, [])
+
+    def test_for_user_cached(self):
+        snapshot = PermissionSnapshot.for_user(user_id=self.user.id)
+
+        # Only the permissions generation of the user is looked up, in the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                PermissionSnapshot.for_user(user_id=self.user.id).editable_tree_ids,
+                snapshot.editable_tree_ids,
+            )
+
+    def test_members_change(self):
+        PermissionSnapshot.for_user(self.user)
+
+        self.channel.editors.remove(self.user)
+        self.channel.viewers.add(self.user)
+
+        snapshot = PermissionSnapshot.for_user(self.user)
+        self.assertEqual(snapshot.editable_tree_ids, [])
+        self.assertEqual(snapshot.view_only_channel_ids, [self.channel.id])
+
+    def test_swap_channel_trees(self):
+        PermissionSnapshot.for_user(self.user)
+
+        self.channel.staging_tree = testdata.tree()
+        self.channel.save()
+
+        snapshot = PermissionSnapshot.for_user(self.user)
+        self.assertIn(self.channel.staging_tree.tree_id, snapshot.editable_tree_ids)
+
+
 class ContentNodeTestCase(PermissionQuerysetTestCase):
     @property
     def base_queryset(self):
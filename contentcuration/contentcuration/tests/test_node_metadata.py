@@ -0,0 +1,150 @@
+from __future__ import absolute_import
+
+import time
+
+import pytest
+from django.core.cache import cache
+from le_utils.constants import content_kinds
+from le_utils.constants import format_presets
+
+from .base import BaseTestCase
+from contentcuration.models import ContentNode
+from contentcuration.models import File
+from contentcuration.node_metadata.annotations import ResourceCount
+from contentcuration.node_metadata.annotations import ResourceSize
+from contentcuration.node_metadata.query import Metadata
+from contentcuration.utils.db_tools import TreeBuilder
+
+
+class MetadataCacheTestCase(BaseTestCase):
+    def setUp(self):
+        super(MetadataCacheTestCase, self).setUp()
+        self.root = TreeBuilder().root
+        self.topic = self.root.get_children().filter(kind_id=content_kinds.TOPIC).first()
+        self.resource = self.topic.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+
+    def _resource_count(self, node):
+        return Metadata(node, resource_count=ResourceCount()).get(node.pk)["resource_count"]
+
+    def _resource_size(self, node):
+        return Metadata(node, resource_size=ResourceSize()).get(node.pk)["resource_size"] or 0
+
+    def test_get(self):
+        self.assertEqual(
+            self._resource_count(self.topic),
+            self.topic.get_descendants()
+            .exclude(kind_id=content_kinds.TOPIC)
+            .values("content_id")
+            .distinct()
+            .count(),
+        )
+
+    def test_get_cached(self):
+        resource_count = self._resource_count(self.topic)
+
+        # Only the tree of the node is looked up
+        with self.assertNumQueries(1):
+            self.assertEqual(self._resource_count(self.topic), resource_count)
+
+    def test_annotations_cached_separately(self):
+        self._resource_count(self.topic)
+
+        metadata = Metadata(
+            self.topic, resource_count=ResourceCount(), resource_size=ResourceSize()
+        ).get(self.topic.pk)
+
+        self.assertIn("resource_size", metadata)
+
+    def test_node_change(self):
+        resource_count = self._resource_count(self.topic)
+
+        ContentNode.objects.create(
+            title="New resource", kind_id=content_kinds.VIDEO, parent=self.topic
+        )
+
+        self.assertEqual(self._resource_count(self.topic), resource_count + 1)
+
+    def test_file_change(self):
+        resource_size = self._resource_size(self.topic)
+
+        File.objects.create(
+            contentnode=self.resource,
+            checksum="a" * 32,
+            file_size=1000,
+            preset_id=format_presets.VIDEO_HIGH_RES,
+        )
+
+        self.assertEqual(self._resource_size(self.topic), resource_size + 1000)
+
+    def test_other_tree_change(self):
+        resource_count = self._resource_count(self.topic)
+        other_root = TreeBuilder().root
+
+        ContentNode.objects.create(
+            title="New resource", kind_id=content_kinds.VIDEO, parent=other_root
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self._resource_count(self.topic), resource_count)
+
+
+class MetadataGetManyTestCase(BaseTestCase):
+    def setUp(self):
+        super(MetadataGetManyTestCase, self).setUp()
+        self.root = TreeBuilder().root
+        self.children = list(self.root.get_children())
+        self.metadata = Metadata(resource_count=ResourceCount())
+
+    def test_get_many(self):
+        node_pks = [child.pk for child in self.children[:2]]
+
+        metadata = self.metadata.get_many(node_pks)
+
+        self.assertEqual(set(metadata.keys()), set(node_pks))
+        for node_pk in node_pks:
+            self.assertEqual(metadata[node_pk], self.metadata.get(node_pk))
+
+    def test_for_children(self):
+        metadata = self.metadata.for_children(self.root.pk)
+
+        self.assertEqual(set(metadata.keys()), set(child.pk for child in self.children))
+        for child in self.children:
+            self.assertEqual(metadata[child.pk], self.metadata.get(child.pk))
+
+    def test_for_children_cached(self):
+        self.metadata.for_children(self.root.pk)
+
+        # Only the children and their trees are looked up
+        with self.assertNumQueries(1):
+            self.metadata.for_children(self.root.pk)
+
+    @pytest.mark.skipif(True, reason="Benchmarking test")
+    def test_for_children_benchmark(self):
+        """
+        Benchmarks fetching the metadata of every child of a topic, node by node
+        and all together, with and without the metadata being cached
+        """
+        for num_children in [10, 100, 1000]:
+            root = TreeBuilder(levels=0, num_children=num_children).root
+            child_pks = list(root.get_children().values_list("pk", flat=True))
+
+            cache.clear()
+            start = time.time()
+            for child_pk in child_pks:
+                self.metadata.get(child_pk)
+            print(
+                "{} children took {} seconds to fetch node by node".format(
+                    num_children, time.time() - start
+                )
+            )
+
+            for cached in [False, True]:
+                if not cached:
+                    cache.clear()
+                start = time.time()
+                self.metadata.for_children(root.pk)
+                print(
+                    "{} children took {} seconds to fetch together{}".format(
+                        num_children, time.time() - start, " when cached" if cached else ""
+                    )
+                )
@@ -38,6 +38,20 @@ class NodeViewsUtilityTestCase(BaseAPITestCase):
             # Check that the outdated cache prompts an asynchronous cache update
             task_mock.apply_async.assert_called_once_with((self.channel.main_tree.id,))
 
+    def test_get_channel_details_published(self):
+        details = {"resource_count": 1, "kind_count": []}
+        self.channel.public = True
+        self.channel.published_data = {str(self.channel.version): {"details": details}}
+        self.channel.save()
+
+        with patch("contentcuration.views.nodes.get_node_details_cached") as details_mock:
+            url = reverse('get_channel_details', [self.channel.id])
+            response = self.get(url)
+            # Public channels are served the details stored on publish
+            details_mock.assert_not_called()
+
+        assert json.loads(response.content) == details
+
 
 class GetTotalSizeEndpointTestCase(BaseAPITestCase):
     def test_200_post(self):
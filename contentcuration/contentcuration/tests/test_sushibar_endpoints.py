@@ -8,6 +8,7 @@ import os
 from builtins import str
 from builtins import zip
 from django.core.urlresolvers import reverse_lazy
+from le_utils.constants import content_kinds
 
 from .base import BaseAPITestCase
 from contentcuration import models as cc
@@ -137,6 +138,35 @@ class SushibarEndpointsTestCase(BaseAPITestCase):
         response = self.post(url, {'channel_id': channel_id, 'tree': 'NONEXISTENT'})
         assert response.status_code == 404
 
+    def test_get_tree_data_method_num_queries(self):
+        main_tree = self.channel.main_tree
+        with self.assertNumQueries(1):
+            main_tree.get_tree_data()
+
+    def test_get_tree_data_method_sizes(self):
+        main_tree = self.channel.main_tree
+        tree_data = main_tree.get_tree_data()
+        nodes = list(tree_data['children'])
+        while nodes:
+            node_data = nodes.pop()
+            node = cc.ContentNode.objects.get(pk=node_data['studio_id'])
+            if node.kind_id == content_kinds.EXERCISE:
+                assert node_data['count'] == node.assessment_items.count()
+            elif node.kind_id != content_kinds.TOPIC:
+                assert node_data['file_size'] == (sum(f.file_size for f in node.files.all()) or None)
+            nodes.extend(node_data.get('children', []))
+
+    def test_get_tree_data_endpoint_stream(self):
+        main_tree = self.channel.main_tree
+        url = reverse_lazy('get_tree_data')
+        response = self.post(url, {'channel_id': self.channel.id, 'stream': True})
+        assert response.status_code == 200
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        nodes = [json.loads(line) for line in lines]
+        descendants = main_tree.get_descendants().order_by('lft')
+        assert [n['studio_id'] for n in nodes] == [d.id for d in descendants]
+        assert [n['parent_id'] for n in nodes] == [d.parent_id for d in descendants]
+
     def test_get_tree_data_method_onelevel(self):
         main_tree = self.channel.main_tree
         tree_data = main_tree.get_tree_data(levels=1)
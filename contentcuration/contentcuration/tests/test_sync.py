@@ -1,11 +1,14 @@
 from __future__ import absolute_import
 
+import uuid
+
 from le_utils.constants import content_kinds
 
 from .base import BaseTestCase
 from .testdata import create_temp_file
 from contentcuration.models import AssessmentItem
 from contentcuration.models import Channel
+from contentcuration.models import ContentNode
 from contentcuration.utils.publish import mark_all_nodes_as_published
 from contentcuration.utils.sync import sync_channel
 
@@ -51,6 +54,31 @@ class SyncTestCase(BaseTestCase):
         db_file.save()
         return db_file
 
+    def test_get_original_nodes(self):
+        nodes = self.derivative_channel.main_tree.get_descendants()
+        original_nodes = ContentNode.objects.get_original_nodes(nodes)
+
+        self.assertEqual(set(original_nodes.keys()), set(node.pk for node in nodes))
+        for node in nodes:
+            self.assertEqual(original_nodes[node.pk], node.get_original_node())
+
+    def test_get_original_nodes_content_id_fallback(self):
+        node = self.derivative_channel.main_tree.get_descendants().exclude(
+            kind_id=content_kinds.TOPIC
+        ).first()
+        original = ContentNode.objects.get(
+            tree_id=self.channel.main_tree.tree_id, node_id=node.original_source_node_id
+        )
+        # The source node has since been replaced by a node with the same content
+        original.node_id = uuid.uuid4().hex
+        original.save()
+
+        nodes = ContentNode.objects.filter(pk=node.pk)
+        original_node = ContentNode.objects.get_original_nodes(nodes)[node.pk]
+        self.assertEqual(original_node.content_id, original.content_id)
+        self.assertEqual(original_node.tree_id, original.tree_id)
+        self.assertEqual(original_node, node.get_original_node())
+
     def test_sync_channel_noop(self):
         """
         Test that calling sync channel with no changed nodes does not change the target channel.
@@ -12,12 +12,21 @@ from builtins import range
 from django.core.management import call_command
 from django.core.urlresolvers import reverse_lazy
 from django.test import TransactionTestCase
+from le_utils.constants import content_kinds
+from le_utils.constants import file_formats
+from le_utils.constants import format_presets
 
+from . import testdata
 from .base import BaseAPITestCase
+from .base import BaseTestCase
+from .base import run_on_commit_callbacks
 from .testdata import fileobj_video
 from contentcuration.models import Channel
+from contentcuration.models import ContentNode
 from contentcuration.models import DEFAULT_CONTENT_DEFAULTS
+from contentcuration.models import File
 from contentcuration.models import Invitation
+from contentcuration.models import StorageLedger
 from contentcuration.models import User
 from contentcuration.tests.utils import mixer
 from contentcuration.utils.csv_writer import _format_size
@@ -152,3 +161,110 @@ class UserAccountTestCase(BaseAPITestCase):
         self.channel.save()
         self.user.delete()
         self.assertTrue(Channel.objects.filter(pk=self.channel.pk).exists())
+
+
+class StorageLedgerTestCase(BaseTestCase):
+    def setUp(self):
+        super(StorageLedgerTestCase, self).setUp()
+        self.node = self.channel.main_tree.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+
+    def _create_file(self, node, checksum="a" * 32, file_size=1000):
+        return File.objects.create(
+            contentnode=node,
+            uploaded_by=self.user,
+            checksum=checksum,
+            file_size=file_size,
+            file_format_id=file_formats.MP4,
+            preset_id=format_presets.VIDEO_HIGH_RES,
+        )
+
+    def _check_space_used(self, expected):
+        self.assertEqual(self.user.get_space_used(), expected)
+        # Matches counting every active file
+        self.assertEqual(
+            sum(self.user.get_user_active_files().values_list("file_size", flat=True)),
+            expected,
+        )
+
+    def test_file_create(self):
+        self._create_file(self.node)
+        self._create_file(self.node.get_next_sibling() or self.node)
+        self._create_file(self.node, checksum="b" * 32, file_size=500)
+
+        self._check_space_used(1500)
+        self.assertEqual(self.user.get_space_used_by_kind(), {content_kinds.VIDEO: 1500})
+
+    def test_file_delete(self):
+        first = self._create_file(self.node)
+        second = self._create_file(self.node)
+
+        first.delete()
+        run_on_commit_callbacks()
+        self._check_space_used(1000)
+
+        second.delete()
+        run_on_commit_callbacks()
+        self._check_space_used(0)
+
+    def test_node_deleted(self):
+        self._create_file(self.node)
+        self._create_file(self.node, checksum="b" * 32, file_size=500)
+
+        self.node.delete()
+        run_on_commit_callbacks()
+        self._check_space_used(0)
+
+    def test_file_added_to_node(self):
+        file = self._create_file(None)
+        self._check_space_used(0)
+
+        file.contentnode = self.node
+        file.save()
+        self._check_space_used(1000)
+
+    def test_file_copied(self):
+        self._create_file(self.node)
+        other_channel = testdata.channel()
+        other_channel.editors.add(self.user)
+
+        self.node.copy_to(other_channel.main_tree)
+
+        self._check_space_used(1000)
+        self.assertEqual(self.user.get_active_storage().get().refcount, 2)
+
+    def test_node_moved_out_of_channel(self):
+        self._create_file(self.node)
+        root = ContentNode.objects.create(title="Root", kind_id=content_kinds.TOPIC)
+
+        self.node.move_to(root, "last-child")
+
+        self._check_space_used(0)
+
+    def test_channel_deleted(self):
+        self._create_file(self.node)
+
+        self.channel.deleted = True
+        self.channel.save()
+
+        self._check_space_used(0)
+
+    def test_editors_changed(self):
+        self._create_file(self.node)
+
+        self.channel.editors.remove(self.user)
+        self._check_space_used(0)
+
+        self.channel.editors.add(self.user)
+        self._check_space_used(1000)
+
+        self.user.editable_channels.clear()
+        self._check_space_used(0)
+
+    def test_reconcile(self):
+        self._create_file(self.node)
+        StorageLedger.objects.all().delete()
+        self.assertEqual(self.user.get_space_used(), 0)
+
+        call_command("reconcile_storage_ledger", user_ids=[self.user.id])
+
+        self._check_space_used(1000)
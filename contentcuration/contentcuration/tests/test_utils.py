@@ -9,12 +9,14 @@ from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.core.management import call_command
+from django.test import override_settings
 from django.test import TestCase
 from le_utils.constants import content_kinds
 from le_utils.constants import file_formats
 from le_utils.constants import format_presets
 from le_utils.constants import languages
 from le_utils.constants import licenses
+from mock import patch
 
 from .base import StudioTestCase
 from contentcuration.models import ContentKind
@@ -25,6 +27,7 @@ from contentcuration.models import generate_object_storage_name
 from contentcuration.models import Language
 from contentcuration.models import License
 from contentcuration.utils.files import get_file_diff
+from contentcuration.utils.metrics import push_metrics
 
 
 class TestTheTestsTestCase(StudioTestCase):
@@ -148,3 +151,24 @@ class LoadConstantsManagementCommandTestCase(TestCase):
         for model in self.models:
             qset = model.objects.all()
             assert len(list(qset)) > 3, 'Only {} constants of type {} created.'.format(len(list(qset)), str(model))
+
+
+class PushMetricsTestCase(TestCase):
+    @override_settings(PROMETHEUS_PUSHGATEWAY=None)
+    @patch("contentcuration.utils.metrics.push_to_gateway")
+    def test_no_pushgateway(self, push_to_gateway):
+        push_metrics()
+        push_to_gateway.assert_not_called()
+
+    @override_settings(PROMETHEUS_PUSHGATEWAY="pushgateway:9091")
+    @patch("contentcuration.utils.metrics.push_to_gateway")
+    def test_pushgateway(self, push_to_gateway):
+        push_metrics()
+        push_to_gateway.assert_called_once()
+        self.assertEqual(push_to_gateway.call_args[0][0], "pushgateway:9091")
+
+    @override_settings(PROMETHEUS_PUSHGATEWAY="pushgateway:9091")
+    @patch("contentcuration.utils.metrics.push_to_gateway", side_effect=IOError)
+    def test_pushgateway_unavailable(self, push_to_gateway):
+        # Failing to push should not raise
+        push_metrics()
@@ -9,6 +9,7 @@ from le_utils.constants import exercises
 from contentcuration import models
 from contentcuration.tests import testdata
 from contentcuration.tests.base import StudioAPITestCase
+from contentcuration.utils.cache import get_tree_revision
 from contentcuration.viewsets.sync.constants import ASSESSMENTITEM
 from contentcuration.viewsets.sync.utils import generate_create_event
 from contentcuration.viewsets.sync.utils import generate_delete_event
@@ -68,6 +69,26 @@ class SyncTestCase(StudioAPITestCase):
         except models.AssessmentItem.DoesNotExist:
             self.fail("AssessmentItem was not created")
 
+    def test_create_assessmentitem_tree_revision(self):
+        tree_id = self.channel.main_tree.tree_id
+        revision = get_tree_revision(tree_id)
+
+        self.client.force_authenticate(user=self.user)
+        assessmentitem = self.assessmentitem_metadata
+        response = self.client.post(
+            self.sync_url,
+            [
+                generate_create_event(
+                    [assessmentitem["contentnode"], assessmentitem["assessment_id"]],
+                    ASSESSMENTITEM,
+                    assessmentitem,
+                )
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(get_tree_revision(tree_id), revision)
+
     def test_create_assessmentitem_with_file_question(self):
         self.client.force_authenticate(user=self.user)
         assessmentitem = self.assessmentitem_metadata
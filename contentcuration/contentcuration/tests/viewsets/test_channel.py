@@ -7,6 +7,7 @@ from django.core.urlresolvers import reverse
 from contentcuration import models
 from contentcuration.tests import testdata
 from contentcuration.tests.base import StudioAPITestCase
+from contentcuration.viewsets.channel import AdminChannelFilter
 from contentcuration.viewsets.sync.constants import CHANNEL
 from contentcuration.viewsets.sync.utils import generate_create_event
 from contentcuration.viewsets.sync.utils import generate_delete_event
@@ -351,6 +352,25 @@ class CRUDTestCase(StudioAPITestCase):
         )
         self.assertEqual(response.status_code, 200, response.content)
 
+    def test_fetch_channel_not_modified(self):
+        user = testdata.user()
+        channel = models.Channel.objects.create(**self.channel_metadata)
+        channel.editors.add(user)
+        self.client.force_authenticate(user=user)
+        url = reverse("channel-detail", kwargs={"pk": channel.id})
+        response = self.client.get(url, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        etag = response["ETag"]
+
+        response = self.client.get(url, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304, response.content)
+
+        channel.name = "This is not the old name"
+        channel.save()
+        response = self.client.get(url, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["name"], channel.name)
+
     def test_create_channel(self):
         user = testdata.user()
         self.client.force_authenticate(user=user)
@@ -392,3 +412,33 @@ class CRUDTestCase(StudioAPITestCase):
             self.fail("Channel was not deleted")
         except models.Channel.DoesNotExist:
             pass
+
+
+class AdminChannelFilterTestCase(StudioAPITestCase):
+    def setUp(self):
+        super(AdminChannelFilterTestCase, self).setUp()
+        self.channel = models.Channel.objects.create(name="Mathematics for Everyone")
+        self.editor = testdata.user(email="editor@le.com")
+        self.editor.first_name = "Ada"
+        self.editor.last_name = "Lovelace"
+        self.editor.save()
+        self.channel.editors.add(self.editor)
+        # A second matching editor should not repeat the channel
+        self.channel.editors.add(testdata.user(email="ada@lovelace.com"))
+
+    def _filter(self, keywords):
+        return AdminChannelFilter(
+            data={"keywords": keywords}, queryset=models.Channel.objects.all()
+        ).qs
+
+    def test_filter_keywords_name(self):
+        self.assertEqual(list(self._filter("MATHEMATICS")), [self.channel])
+        self.assertEqual(list(self._filter("Physics")), [])
+
+    def test_filter_keywords_editor_name(self):
+        self.assertEqual(list(self._filter("ada lovelace")), [self.channel])
+
+    def test_filter_keywords_editor_email(self):
+        self.assertEqual(
+            list(self._filter("editor@le.com ada@lovelace.com")), [self.channel]
+        )
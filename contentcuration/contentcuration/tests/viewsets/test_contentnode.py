@@ -12,6 +12,8 @@ from django_concurrent_tests.errors import WrappedError
 from django_concurrent_tests.helpers import call_concurrently
 from django_concurrent_tests.helpers import make_concurrent_calls
 from le_utils.constants import content_kinds
+from le_utils.constants import file_formats
+from le_utils.constants import format_presets
 from le_utils.constants import roles
 
 from contentcuration import models
@@ -21,9 +23,12 @@ from contentcuration.tests.base import StudioAPITestCase
 from contentcuration.utils.db_tools import TreeBuilder
 from contentcuration.viewsets.sync.constants import CONTENTNODE
 from contentcuration.viewsets.sync.constants import CONTENTNODE_PREREQUISITE
+from contentcuration.viewsets.sync.constants import FILE
+from contentcuration.viewsets.sync.constants import TASK_ID
 from contentcuration.viewsets.sync.utils import generate_copy_event
 from contentcuration.viewsets.sync.utils import generate_create_event
 from contentcuration.viewsets.sync.utils import generate_delete_event
+from contentcuration.viewsets.sync.utils import generate_move_event
 from contentcuration.viewsets.sync.utils import generate_update_event
 
 
@@ -692,6 +697,36 @@ class SyncTestCase(StudioAPITestCase):
             models.ContentNode.objects.get(id=contentnode2.id).title, new_title
         )
 
+    def test_update_contentnodes_aggregates(self):
+        user = testdata.user()
+        channel = testdata.channel()
+        channel.editors.add(user)
+        topic = models.ContentNode.objects.create(
+            title="Topic", kind_id=content_kinds.TOPIC, parent=channel.main_tree
+        )
+        contentnodes = [create_and_get_contentnode(topic.id) for _ in range(3)]
+        error_counts = dict(
+            models.ContentNodeAggregate.objects.filter(
+                contentnode__in=[channel.main_tree_id, topic.id]
+            ).values_list("contentnode_id", "error_count")
+        )
+
+        self.client.force_authenticate(user=user)
+        response = self.client.post(
+            self.sync_url,
+            [
+                generate_update_event(node.id, CONTENTNODE, {"complete": False})
+                for node in contentnodes
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        for node_id in (channel.main_tree_id, topic.id):
+            self.assertEqual(
+                models.ContentNodeAggregate.objects.get(contentnode=node_id).error_count,
+                error_counts[node_id] + len(contentnodes),
+            )
+
     def test_cannot_update_some_contentnodes(self):
         user = testdata.user()
 
@@ -846,6 +881,46 @@ class SyncTestCase(StudioAPITestCase):
 
         self.assertEqual(new_node.parent_id, channel.main_tree_id)
 
+    def test_copy_contentnodes(self):
+        channel = testdata.channel()
+        user = testdata.user()
+        channel.editors.add(user)
+        contentnode1 = models.ContentNode.objects.create(**self.contentnode_db_metadata)
+        contentnode2 = models.ContentNode.objects.create(**self.contentnode_db_metadata)
+        new_node_id1 = uuid.uuid4().hex
+        new_node_id2 = uuid.uuid4().hex
+        self.client.force_authenticate(user=user)
+        response = self.client.post(
+            self.sync_url,
+            [
+                generate_copy_event(
+                    new_node_id1, CONTENTNODE, contentnode1.id, channel.main_tree_id,
+                ),
+                generate_copy_event(
+                    new_node_id2, CONTENTNODE, contentnode2.id, channel.main_tree_id,
+                ),
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+        task_ids = set(
+            change["mods"][TASK_ID]
+            for change in response.data["changes"]
+            if TASK_ID in change.get("mods", {})
+        )
+        self.assertEqual(len(task_ids), 1)
+        self.assertEqual(
+            models.Task.objects.get(task_id=task_ids.pop()).task_type,
+            "duplicate-nodes-batch",
+        )
+
+        new_node1 = models.ContentNode.objects.get(id=new_node_id1)
+        new_node2 = models.ContentNode.objects.get(id=new_node_id2)
+        self.assertEqual(new_node1.parent_id, channel.main_tree_id)
+        self.assertEqual(new_node2.parent_id, channel.main_tree_id)
+        self.assertLess(new_node1.lft, new_node2.lft)
+
     def test_cannot_copy_contentnode__source_permission(self):
         user = testdata.user()
         channel = testdata.channel()
@@ -900,6 +975,63 @@ class SyncTestCase(StudioAPITestCase):
         except models.ContentNode.DoesNotExist:
             pass
 
+    def test_move_contentnodes(self):
+        user = testdata.user()
+        channel = testdata.channel()
+        channel.editors.add(user)
+        topic = models.ContentNode.objects.create(
+            title="Topic", kind_id=content_kinds.TOPIC, parent=channel.main_tree
+        )
+        contentnode1 = create_and_get_contentnode(channel.main_tree_id)
+        contentnode2 = create_and_get_contentnode(channel.main_tree_id)
+
+        self.client.force_authenticate(user=user)
+        response = self.client.post(
+            self.sync_url,
+            [
+                generate_move_event(contentnode1.id, CONTENTNODE, topic.id, "last-child"),
+                generate_move_event(contentnode2.id, CONTENTNODE, contentnode1.id, "left"),
+            ],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(
+            list(topic.get_children().values_list("id", flat=True)),
+            [contentnode2.id, contentnode1.id],
+        )
+
+    def test_cannot_move_some_contentnodes(self):
+        user = testdata.user()
+        channel1 = testdata.channel()
+        channel1.editors.add(user)
+        contentnode1 = create_and_get_contentnode(channel1.main_tree_id)
+        contentnode2 = create_and_get_contentnode(channel1.main_tree_id)
+
+        channel2 = testdata.channel()
+
+        self.client.force_authenticate(user=user)
+        with self.settings(TEST_ENV=False):
+            response = self.client.post(
+                self.sync_url,
+                [
+                    generate_move_event(
+                        contentnode1.id, CONTENTNODE, channel2.main_tree_id, "last-child"
+                    ),
+                    generate_move_event(
+                        contentnode2.id, CONTENTNODE, channel1.main_tree_id, "first-child"
+                    ),
+                ],
+                format="json",
+            )
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual(
+            models.ContentNode.objects.get(id=contentnode1.id).parent_id,
+            channel1.main_tree_id,
+        )
+        self.assertEqual(
+            channel1.main_tree.get_children().first().id, contentnode2.id,
+        )
+
     def test_create_contentnode_moveable(self):
         """
         Regression test to ensure that nodes created here are able to be moved to
@@ -1185,6 +1317,59 @@ class CRUDTestCase(StudioAPITestCase):
         self.assertEqual(response.status_code, 200, response.content)
         self.assertEqual(response.data["id"], contentnode.id)
 
+    def test_fetch_contentnode_not_modified(self):
+        user = testdata.user()
+        self.client.force_authenticate(user=user)
+        contentnode = models.ContentNode.objects.create(**self.contentnode_db_metadata)
+        url = reverse("contentnode-detail", kwargs={"pk": contentnode.id})
+        response = self.client.get(url, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        etag = response["ETag"]
+
+        response = self.client.get(url, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304, response.content)
+
+    def test_fetch_contentnode_modified_descendant(self):
+        user = testdata.user()
+        self.client.force_authenticate(user=user)
+        contentnode = models.ContentNode.objects.create(
+            **dict(self.contentnode_db_metadata, kind_id=content_kinds.TOPIC)
+        )
+        url = reverse("contentnode-detail", kwargs={"pk": contentnode.id})
+        etag = self.client.get(url, format="json")["ETag"]
+
+        models.ContentNode.objects.create(
+            **dict(self.contentnode_db_metadata, parent_id=contentnode.id)
+        )
+        response = self.client.get(url, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data["resource_count"], 1)
+
+    def test_fetch_contentnode_modified_file(self):
+        user = testdata.user()
+        channel = testdata.channel()
+        channel.editors.add(user)
+        self.client.force_authenticate(user=user)
+        contentnode = channel.main_tree.get_descendants().exclude(kind_id=content_kinds.TOPIC).first()
+        url = reverse("contentnode-detail", kwargs={"pk": contentnode.id})
+        etag = self.client.get(url, format="json")["ETag"]
+
+        file = models.File.objects.create(
+            checksum=uuid.uuid4().hex,
+            preset_id=format_presets.VIDEO_THUMBNAIL,
+            file_format_id=file_formats.PNG,
+            uploaded_by=user,
+        )
+        response = self.client.post(
+            reverse("sync"),
+            [generate_update_event(file.id, FILE, {"contentnode": contentnode.id})],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+        response = self.client.get(url, format="json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200, response.content)
+
     def test_fetch_requisites(self):
         user = testdata.user()
         self.client.force_authenticate(user=user)
@@ -10,6 +10,8 @@ from le_utils.constants import format_presets
 from contentcuration import models
 from contentcuration.tests import testdata
 from contentcuration.tests.base import StudioAPITestCase
+from contentcuration.utils.cache import get_channel_generation
+from contentcuration.utils.cache import get_tree_revision
 from contentcuration.viewsets.sync.constants import FILE
 from contentcuration.viewsets.sync.utils import generate_create_event
 from contentcuration.viewsets.sync.utils import generate_delete_event
@@ -109,6 +111,26 @@ class SyncTestCase(StudioAPITestCase):
             models.File.objects.get(id=file.id).preset_id, new_preset,
         )
 
+    def test_update_file_attach_to_node(self):
+        metadata = self.file_db_metadata
+        node_id = metadata.pop("contentnode_id")
+        file = models.File.objects.create(file_size=1000, **metadata)
+        tree_id = self.channel.main_tree.tree_id
+        revision = get_tree_revision(tree_id)
+        generation = get_channel_generation(self.channel.id)
+        self.assertEqual(self.user.get_space_used(), 0)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(
+            self.sync_url,
+            [generate_update_event(file.id, FILE, {"contentnode": node_id},)],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.user.get_space_used(), 1000)
+        self.assertNotEqual(get_tree_revision(tree_id), revision)
+        self.assertNotEqual(get_channel_generation(self.channel.id), generation)
+
     def test_update_file_no_channel(self):
         file_metadata = self.file_db_metadata
         contentnode_id = file_metadata.pop("contentnode_id")
@@ -1,13 +1,26 @@
 from __future__ import absolute_import
 
+import functools
+import operator
+import time
+
+import pytest
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Q
+from le_utils.constants import content_kinds
+from le_utils.constants import file_formats
+from le_utils.constants import format_presets
 
+from contentcuration import models
 from contentcuration.tests import testdata
 from contentcuration.tests.base import StudioAPITestCase
+from contentcuration.utils.cache import get_channel_generation
 from contentcuration.viewsets.sync.constants import EDITOR_M2M
 from contentcuration.viewsets.sync.constants import VIEWER_M2M
 from contentcuration.viewsets.sync.utils import generate_create_event
 from contentcuration.viewsets.sync.utils import generate_delete_event
+from contentcuration.viewsets.user import AdminUserFilter
 
 
 class SyncTestCase(StudioAPITestCase):
@@ -55,6 +68,101 @@ class SyncTestCase(StudioAPITestCase):
         self.assertFalse(self.channel.editors.filter(id=editor.id).exists())
         self.assertFalse(self.channel.viewers.filter(id=viewer.id).exists())
 
+    def test_members_change_channel_generation(self):
+        editor = testdata.user(email="editor@e.com")
+        viewer = testdata.user(email="viewer@v.com")
+        generation = get_channel_generation(self.channel.id)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            self.sync_url,
+            [generate_create_event([editor.id, self.channel.id], EDITOR_M2M, {})],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(get_channel_generation(self.channel.id), generation)
+
+        generation = get_channel_generation(self.channel.id)
+        response = self.client.post(
+            self.sync_url,
+            [generate_create_event([viewer.id, self.channel.id], VIEWER_M2M, {})],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(get_channel_generation(self.channel.id), generation)
+
+        generation = get_channel_generation(self.channel.id)
+        response = self.client.post(
+            self.sync_url,
+            [generate_delete_event([editor.id, self.channel.id], EDITOR_M2M)],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertNotEqual(get_channel_generation(self.channel.id), generation)
+
+    def test_members_change_permissions(self):
+        editor = testdata.user(email="editor@e.com")
+        node = self.channel.main_tree.get_children().first()
+        node_url = reverse("contentnode-detail", kwargs={"pk": node.id})
+
+        # The editor is denied access before being added, and their permissions are cached
+        self.client.force_authenticate(user=editor)
+        self.assertEqual(self.client.get(node_url, format="json").status_code, 404)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(
+            self.sync_url,
+            [generate_create_event([editor.id, self.channel.id], EDITOR_M2M, {})],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+        self.client.force_authenticate(user=editor)
+        self.assertEqual(self.client.get(node_url, format="json").status_code, 200)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(
+            self.sync_url,
+            [generate_delete_event([editor.id, self.channel.id], EDITOR_M2M)],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+        # The revoked editor loses access straight away
+        self.client.force_authenticate(user=editor)
+        self.assertEqual(self.client.get(node_url, format="json").status_code, 404)
+
+    def test_editors_storage_used(self):
+        editor = testdata.user(email="editor@e.com")
+        models.File.objects.create(
+            contentnode=self.channel.main_tree.get_descendants()
+            .exclude(kind_id=content_kinds.TOPIC)
+            .first(),
+            uploaded_by=editor,
+            checksum="a" * 32,
+            file_size=1000,
+            file_format_id=file_formats.MP4,
+            preset_id=format_presets.VIDEO_HIGH_RES,
+        )
+        self.assertEqual(editor.get_space_used(), 0)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            self.sync_url,
+            [generate_create_event([editor.id, self.channel.id], EDITOR_M2M, {})],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(editor.get_space_used(), 1000)
+
+        response = self.client.post(
+            self.sync_url,
+            [generate_delete_event([editor.id, self.channel.id], EDITOR_M2M)],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(editor.get_space_used(), 0)
+
 
 class CRUDTestCase(StudioAPITestCase):
     def setUp(self):
@@ -91,3 +199,86 @@ class CRUDTestCase(StudioAPITestCase):
             reverse("user-detail", kwargs={"pk": self.user.id})
         )
         self.assertEqual(response.status_code, 405, response.content)
+
+
+class AdminUserFilterTestCase(StudioAPITestCase):
+    def setUp(self):
+        super(AdminUserFilterTestCase, self).setUp()
+        self.user = testdata.user(email="ada@lovelace.com")
+        self.user.first_name = "Ada"
+        self.user.last_name = "Lovelace"
+        self.user.save()
+        self.channel = models.Channel.objects.create(name="Analytical Engines")
+        self.channel.editors.add(self.user)
+
+    def _filter(self, keywords):
+        return AdminUserFilter(
+            data={"keywords": keywords}, queryset=models.User.objects.all()
+        ).qs
+
+    def test_filter_keywords_name(self):
+        self.assertEqual(list(self._filter("lovelace")), [self.user])
+        self.assertEqual(list(self._filter("babbage")), [])
+
+    def test_filter_keywords_channel(self):
+        other_channel = models.Channel.objects.create(name="Engines")
+        other_channel.editors.add(self.user)
+        # The user is not repeated for each matching channel
+        self.assertEqual(list(self._filter("Engines")), [self.user])
+        self.assertEqual(list(self._filter(self.channel.id)), [self.user])
+
+    @pytest.mark.skipif(True, reason="Benchmarking test")
+    def test_filter_keywords_benchmark(self):
+        """
+        Benchmarks keyword filtering of users and channels, and author filtering of nodes,
+        against tables of a realistic size, with and without the trigram indexes being used
+        """
+        num_rows = 100000
+        models.User.objects.bulk_create(
+            models.User(
+                email="user{}@example.com".format(i),
+                first_name="First{}".format(i),
+                last_name="Last{}".format(i),
+            )
+            for i in range(num_rows)
+        )
+        models.Channel.objects.bulk_create(
+            models.Channel(name="Channel {}".format(i)) for i in range(num_rows // 10)
+        )
+        root = models.ContentNode.objects.create(title="Root", kind_id=content_kinds.TOPIC)
+        models.ContentNode.objects.bulk_create(
+            models.ContentNode(
+                title="Node {}".format(i),
+                author="Author {}".format(i),
+                aggregator="Aggregator {}".format(i),
+                provider="Provider {}".format(i),
+                kind_id=content_kinds.VIDEO,
+                parent=root,
+                tree_id=root.tree_id,
+                lft=2 * i + 2,
+                rght=2 * i + 3,
+                level=1,
+            )
+            for i in range(num_rows)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        queries = [
+            ("users", models.User.objects.all(), ["first_name", "last_name", "email"], "st4242"),
+            ("channels", models.Channel.objects.all(), ["name"], "nnel 4242"),
+            ("nodes", models.ContentNode.objects.all(), ["author", "aggregator", "provider"], "thor 4242"),
+        ]
+        for name, queryset, fields, value in queries:
+            for lookup in ["icontains", "ilike"]:
+                query = functools.reduce(
+                    operator.or_,
+                    (Q(**{"{}__{}".format(field, lookup): value}) for field in fields),
+                )
+                start = time.time()
+                count = queryset.filter(query).count()
+                print(
+                    "Filtering {} {} {} took {} seconds, matching {}".format(
+                        num_rows, name, lookup, time.time() - start, count
+                    )
+                )
@@ -4,10 +4,20 @@ import random
 import time
 
 from django.core.cache import cache
+from django.db import transaction
 
 
 DEFERRED_FLAG = "__DEFERRED"
 
+TREE_REVISION_KEY = "tree_revision_{}"
+
+CHANNEL_GENERATION_KEY = "channel_generation_{}"
+USER_PERMISSIONS_GENERATION_KEY = "user_permissions_generation_{}"
+
+# Values cached under a channel's generation never go stale, so they
+# only expire to clear out the values of old generations
+CHANNEL_CACHE_TIMEOUT = 24 * 60 * 60
+
 
 def cache_stampede(expire, beta=1):
     """Cache decorator with cache stampede protection.
@@ -101,3 +111,83 @@ def delete_public_channel_cache_keys():
     """
     delete_cache_keys("*get_public_channel_list*")
     delete_cache_keys("*get_user_public_channels*")
+
+
+def _get_counter(key):
+    counter = cache.get(key)
+    if counter is None:
+        # Start from the current time, so that the values of a counter
+        # that has been evicted from the cache are not reused
+        cache.add(key, int(time.time() * 1000000), timeout=None)
+        counter = cache.get(key)
+    return counter
+
+
+def _bump_counters(keys):
+    """
+    Increments the counters now, and again once the current transaction commits,
+    as values cached by other transactions in the meantime will not have seen the change.
+    """
+    keys = set(keys)
+
+    def bump():
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # There is no counter, so nothing can have been cached under it
+                pass
+
+    if keys:
+        bump()
+        transaction.on_commit(bump)
+
+
+def get_tree_revision(tree_id):
+    """
+    Returns the current revision of a ContentNode tree, which changes whenever the nodes,
+    files or assessment items of the tree are written, so that it can be used in the keys
+    of values cached from the tree.
+    """
+    return _get_counter(TREE_REVISION_KEY.format(tree_id))
+
+
+def bump_tree_revisions(*tree_ids):
+    """
+    Changes the revisions of the trees, so that values cached from the trees before the change
+    are no longer used.
+    """
+    _bump_counters(TREE_REVISION_KEY.format(tree_id) for tree_id in tree_ids if tree_id is not None)
+
+
+def get_channel_generation(channel_id):
+    """
+    Returns the current generation of a channel, which changes whenever the files in its
+    trees are written, its trees are swapped, or its editors or viewers change, so that it
+    can be used in the keys of values cached for the channel.
+    """
+    return _get_counter(CHANNEL_GENERATION_KEY.format(channel_id))
+
+
+def bump_channel_generations(*channel_ids):
+    """
+    Changes the generations of the channels, so that values cached for the channels before
+    the change are no longer used.
+    """
+    _bump_counters(CHANNEL_GENERATION_KEY.format(channel_id) for channel_id in channel_ids if channel_id)
+
+
+def get_user_permissions_generation(user_id):
+    """
+    Returns the current generation of a user's permissions, which changes whenever the
+    channels they can edit or view change, or the trees of those channels are swapped.
+    """
+    return _get_counter(USER_PERMISSIONS_GENERATION_KEY.format(user_id))
+
+
+def bump_user_permissions_generations(*user_ids):
+    """
+    Changes the permissions generations of the users, so that permissions cached
+    for the users before the change are no longer used.
+    """
+    _bump_counters(USER_PERMISSIONS_GENERATION_KEY.format(user_id) for user_id in user_ids if user_id)
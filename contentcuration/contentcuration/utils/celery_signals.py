@@ -4,11 +4,13 @@ import traceback
 from builtins import str
 from celery.signals import after_task_publish
 from celery.signals import task_failure
+from celery.signals import task_postrun
 from celery.signals import task_success
 from celery.utils.log import get_task_logger
 from django.core.exceptions import ObjectDoesNotExist
 
 from contentcuration.models import Task
+from contentcuration.utils.metrics import push_metrics
 
 # because Celery connects signals upon import, we don't want to put signals into other modules that may be
 # imported multiple times. Instead, we follow the advice here and use AppConfig.init to import the module:
@@ -80,3 +82,11 @@ def on_success(sender, result, **kwargs):
         logger.info("Task with ID {} succeeded".format(task_id))
     except ObjectDoesNotExist:
         pass  # If the object doesn't exist, that likely means the task was created outside of create_async_task
+
+
+@task_postrun.connect
+def on_postrun(sender, **kwargs):
+    """
+    Push the lock and copy metrics recorded by the task, as workers are not scraped.
+    """
+    push_metrics()
@@ -6,13 +6,47 @@ from django_cte import With
 from contentcuration.models import Channel
 from contentcuration.models import ContentNode
 from contentcuration.models import File
+from contentcuration.models import TreeResourceSize
 from contentcuration.models import User
 from contentcuration.utils.cache import cache_stampede
+from contentcuration.utils.cache import CHANNEL_CACHE_TIMEOUT
+from contentcuration.utils.cache import get_channel_generation
 
-CACHE_CHANNEL_KEY = "channel_metadata_{}"
+CACHE_CHANNEL_KEY = "channel_metadata_{}_{}"
 
 
-@cache_stampede(expire=3600)
+def get_channel_metadata_key(channel_id):
+    """
+    The metadata is cached under the channel's generation, so it is only recalculated
+    once the files, trees, editors or viewers of the channel have changed
+    """
+    return CACHE_CHANNEL_KEY.format(channel_id, get_channel_generation(channel_id))
+
+
+def get_tree_resource_size(tree_id):
+    """
+    The total size of the distinct files in a tree, read from its TreeResourceSize if it has one,
+    which may lag behind the files until the calculateresources command next runs,
+    and otherwise calculated from the files of the tree
+    """
+    size = TreeResourceSize.objects.filter(tree_id=tree_id).values_list("resource_size", flat=True).first()
+    if size is not None:
+        return size
+    nodes = With(
+        ContentNode.objects.values("id", "tree_id").filter(tree_id=tree_id).order_by(),
+        name="nodes",
+    )
+    size_sum = (
+        nodes.join(File, contentnode_id=nodes.col.id)
+        .values("checksum", "file_size")
+        .with_cte(nodes)
+        .distinct()
+        .aggregate(Sum("file_size"))
+    )
+    return size_sum["file_size__sum"] or 0
+
+
+@cache_stampede(expire=CHANNEL_CACHE_TIMEOUT)
 def calculate_channel_metadata(key, channel_id=None, tree_id=None):
     if key is None:
         return  # this is an error, it should not happen, but just in case
@@ -27,20 +61,9 @@ def calculate_channel_metadata(key, channel_id=None, tree_id=None):
     cache.set(key, {"CALCULATING": True, "METADATA": {}}, timeout=3600)
 
     if tree_id is None:
-        tree_id = Channel.objects.get(id=channel_id).main_tree.id
+        tree_id = Channel.objects.get(id=channel_id).main_tree.tree_id
 
-    nodes = With(
-        ContentNode.objects.values("id", "tree_id").filter(tree_id=tree_id).order_by(),
-        name="nodes",
-    )
-    size_sum = (
-        nodes.join(File, contentnode_id=nodes.col.id)
-        .values("checksum", "file_size")
-        .with_cte(nodes)
-        .distinct()
-        .aggregate(Sum("file_size"))
-    )
-    size = size_sum["file_size__sum"] or 0
+    size = get_tree_resource_size(tree_id)
 
     editors = (
         User.objects.filter(editable_channels__id=channel_id)
@@ -71,5 +94,5 @@ def cache_multiple_channels_metadata(channels):
     for channel in channels:
         channel_id = channel["id"]
         tree_id = channel["main_tree__tree_id"]
-        key = CACHE_CHANNEL_KEY.format(channel_id)
+        key = get_channel_metadata_key(channel_id)
         calculate_channel_metadata(key, channel_id, tree_id)
@@ -13,14 +13,13 @@ import progressbar
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.db.models import OuterRef
-from django.db.models import Q
 from django.db.models import Subquery
 from django.db.models import Sum
 from django.utils.translation import ugettext as _
 from le_utils.constants import content_kinds
 from le_utils.constants import exercises
 
-from contentcuration.models import Channel
+from contentcuration.models import ChannelTree
 from contentcuration.models import generate_storage_url
 
 if sys.version_info.major == 2:
@@ -48,12 +47,18 @@ def write_channel_csv_file(channel, force=False, site=None, show_progress=False)
                 .exclude(kind_id=content_kinds.TOPIC)\
                 .select_related('license', 'language', 'parent')\
                 .prefetch_related('files', 'assessment_items', 'tags')
+            # Look up the titles of all the topics at once, to build the path of every node
+            topic_titles = dict(
+                channel.main_tree.get_descendants(include_self=True)
+                .filter(kind_id=content_kinds.TOPIC)
+                .values_list('id', 'title')
+            )
             if show_progress:
                 bar = progressbar.ProgressBar(max_value=nodes.count())
 
             index = 0
             for node in nodes:
-                _write_content_csv(writer, node, site)
+                _write_content_csv(writer, node, site, topic_titles)
                 if show_progress:
                     index += 1
                     bar.update(index)
@@ -67,8 +72,8 @@ def _csv_file_exists(csv_path, channel):
     return os.path.isfile(csv_path) and _creation_date(csv_path) >= last_modified
 
 
-def _write_content_csv(writer, node, site):
-    path = "/".join(node.get_ancestors().order_by("level").values_list("title", flat=True))
+def _write_content_csv(writer, node, site, topic_titles):
+    path = "/".join(topic_titles[ancestor_id] for ancestor_id in node.path)
     url = "/".join([site, "channels", node.get_channel().pk, "view", node.parent.node_id[:7], node.node_id[:7]])
     language = node.language.readable_name if node.language else "Default to topic language"
     license = node.license.license_name if node.license else "No license"
@@ -167,14 +172,14 @@ def write_user_csv(user, path=None):
         domain = Site.objects.get(pk=1).domain
 
         # Get all user files
-        channel_query = Channel.objects.filter(
-            Q(main_tree__tree_id=OuterRef("contentnode__tree_id")) |
-            Q(trash_tree__tree_id=OuterRef("contentnode__tree_id"))
+        channel_query = ChannelTree.objects.filter(
+            tree_id=OuterRef("contentnode__tree_id"),
+            tree_name__in=["main_tree", "trash_tree"],
         )
 
         user_files = user.files \
             .select_related('language', 'contentnode', 'file_format') \
-            .annotate(channel_name=Subquery(channel_query.values_list("name", flat=True)[:1])) \
+            .annotate(channel_name=Subquery(channel_query.values_list("channel__name", flat=True)[:1])) \
             .values(
                 'channel_name',
                 'original_filename',
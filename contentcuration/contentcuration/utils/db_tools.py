@@ -302,6 +302,7 @@ class TreeBuilder(object):
         nodes = ContentNode.objects.bulk_create(
             ContentNode.objects.build_tree_nodes(self._root_node), batch_size=BATCH_SIZE
         )
+        ContentNode.objects.create_aggregates(nodes)
         AssessmentItem.objects.bulk_create(
             self.assessment_items, batch_size=BATCH_SIZE,
         )
@@ -0,0 +1,71 @@
+"""
+Prometheus metrics for operations that are not covered by the
+request, cache and database metrics from django-prometheus.
+"""
+import logging
+import os
+import socket
+
+from django.conf import settings
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import push_to_gateway
+from prometheus_client import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+
+LOCK_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+MPTT_LOCK_WAIT_SECONDS = Histogram(
+    "studio_mptt_lock_wait_seconds",
+    "Seconds spent waiting to acquire a lock on ContentNode trees for mptt operations",
+    ["operation"],
+    buckets=LOCK_BUCKETS,
+)
+
+MPTT_LOCK_HOLD_SECONDS = Histogram(
+    "studio_mptt_lock_hold_seconds",
+    "Seconds spent holding a lock on ContentNode trees for mptt operations",
+    ["operation"],
+    buckets=LOCK_BUCKETS,
+)
+
+MPTT_LOCK_DEADLOCK_RETRIES = Counter(
+    "studio_mptt_lock_deadlock_retries",
+    "Retries of acquiring a lock on ContentNode trees after a deadlock",
+    ["operation"],
+)
+
+COPY_ROWS_PER_SECOND = Histogram(
+    "studio_copy_rows_per_second",
+    "Nodes copied per second spent inside the target tree lock",
+    buckets=(100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000),
+)
+
+COPY_BATCH_SIZE = Histogram(
+    "studio_copy_batch_size",
+    "Batch sizes, in lft/rght values, chosen for copying subtrees",
+    buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000),
+)
+
+
+def push_metrics():
+    """
+    Pushes the metrics of this process to the Pushgateway at PROMETHEUS_PUSHGATEWAY, if set.
+    Celery workers don't serve /metrics to be scraped, so the metrics recorded in tasks are
+    pushed instead. Each worker process pushes to its own group, as every process has
+    its own counts, which replace whatever the process last pushed.
+    """
+    if not settings.PROMETHEUS_PUSHGATEWAY:
+        return
+    try:
+        push_to_gateway(
+            settings.PROMETHEUS_PUSHGATEWAY,
+            job="studio-celery",
+            registry=REGISTRY,
+            grouping_key={"instance": "{}-{}".format(socket.gethostname(), os.getpid())},
+        )
+    except Exception:
+        # Failing to report metrics should never fail the task
+        logger.warning("Failed to push metrics to the Pushgateway", exc_info=True)
@@ -638,6 +638,8 @@ def mark_all_nodes_as_published(channel):
     logging.debug("Marking all nodes as published.")
 
     channel.main_tree.get_family().update(changed=False, published=True)
+    # No nodes in the tree are changed now, so none are counted as new or updated
+    ccmodels.ContentNodeAggregate.objects.filter(contentnode__tree_id=channel.main_tree.tree_id).update(updated_count=0, new_count=0)
 
     logging.info("Marked all nodes as published.")
 
@@ -683,7 +685,9 @@ def fill_published_fields(channel, version_notes):
             'size': channel.published_size,
             'date_published': channel.last_published.strftime(settings.DATE_TIME_FORMAT),
             'version_notes': version_notes,
-            'included_languages': language_list
+            'included_languages': language_list,
+            # Look inside details of the published version, served instead of recomputing them on request
+            'details': channel.main_tree.get_details(),
         }
     })
     channel.save()
@@ -700,6 +704,9 @@ def publish_channel(user_id, channel_id, version_notes='', force=False, force_ex
         mark_all_nodes_as_published(channel)
         add_tokens_to_channel(channel)
         fill_published_fields(channel, version_notes)
+        if channel.public:
+            # Deduplicate search results from the newly published content
+            ccmodels.CanonicalContentNode.refresh([channel.main_tree.tree_id])
 
         # Attributes not getting set for some reason, so just save it here
         channel.main_tree.publishing = False
@@ -10,8 +10,10 @@ from le_utils.constants import format_presets
 from past.utils import old_div
 
 from contentcuration.models import AssessmentItem
+from contentcuration.models import ContentNode
 from contentcuration.models import ContentTag
 from contentcuration.models import File
+from contentcuration.models import record_related_changes
 
 
 def sync_channel(
@@ -32,6 +34,7 @@ def sync_channel(
     total_percent = 100.0
     percent_per_node = old_div(total_percent, sync_node_count)
     percent_done = 0.0
+    original_nodes = ContentNode.objects.get_original_nodes(nodes_to_sync)
     for node in nodes_to_sync:
         node = sync_node(
             node,
@@ -39,6 +42,7 @@ def sync_channel(
             sync_tags=sync_tags,
             sync_files=sync_files,
             sync_assessment_items=sync_assessment_items,
+            original_node=original_nodes[node.pk],
         )
         if task_object:
             percent_done = min(percent_done + percent_per_node, total_percent)
@@ -55,8 +59,9 @@ def sync_node(
     sync_tags=False,
     sync_files=False,
     sync_assessment_items=False,
+    original_node=None,
 ):
-    original_node = node.get_original_node()
+    original_node = original_node or node.get_original_node()
     if original_node.node_id != node.node_id:  # Only update if node is not original
         logging.info(
             "----- Syncing: {} from {}".format(
@@ -146,6 +151,7 @@ def sync_node_files(node, original):
 
     if files_to_create:
         File.objects.bulk_create(files_to_create)
+        record_related_changes(files=files_to_create)
 
 
 assessment_item_fields = (
@@ -208,6 +214,7 @@ def sync_node_assessment_items(node, original):  # noqa C901
 
     if ai_to_update:
         bulk_update(ai_to_update, update_fields=assessment_item_fields)
+        record_related_changes(assessment_items=ai_to_update)
         node.changed = True
 
     if files_to_delete:
@@ -216,4 +223,5 @@ def sync_node_assessment_items(node, original):  # noqa C901
 
     if files_to_create:
         File.objects.bulk_create(files_to_create)
+        record_related_changes(files=files_to_create)
         node.changed = True
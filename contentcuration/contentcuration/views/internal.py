@@ -14,6 +14,7 @@ from django.http import HttpResponseForbidden
 from django.http import HttpResponseNotFound
 from django.http import HttpResponseServerError
 from django.http import JsonResponse
+from django.http import StreamingHttpResponse
 from le_utils.constants import content_kinds
 from le_utils.constants import roles
 from past.builtins import basestring
@@ -366,8 +367,9 @@ def check_user_is_editor(request):
 def get_tree_data(request):
     """
     Get the tree data for the `tree` tree of channel `channel_id`.
-    WARNING: this endpoint timesouts for large channels.
     Returns { success: true, tree:[ nodes in channel_id ] }
+    If `stream` is true, the nodes are instead streamed as newline delimited JSON
+    in tree order, each with the `parent_id` of its parent in place of a children list.
     """
     serializer = GetTreeDataSerializer(data=request.data)
     if not serializer.is_valid():
@@ -380,6 +382,8 @@ def get_tree_data(request):
         tree_root = getattr(channel, tree_name, None)
         if tree_root is None:
             raise ValueError("Invalid tree name")
+        if serializer.validated_data['stream']:
+            return StreamingHttpResponse(stream_tree_data(tree_root), content_type="application/x-ndjson")
         tree_data = tree_root.get_tree_data()
         children_data = tree_data.get('children', [])
         return Response({"success": True, 'tree': children_data})
@@ -392,6 +396,13 @@ def get_tree_data(request):
         return HttpResponseServerError(content=str(e), reason=str(e))
 
 
+def stream_tree_data(tree_root):
+    for node_data in tree_root.iter_tree_data():
+        # The root itself is left out, as in the `tree` list of the non-streamed response
+        if node_data["studio_id"] != tree_root.id:
+            yield json.dumps(node_data) + "\n"
+
+
 @api_view(['POST'])
 @authentication_classes((TokenAuthentication, SessionAuthentication,))
 @permission_classes((IsAuthenticated,))
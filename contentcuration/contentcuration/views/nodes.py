@@ -55,12 +55,14 @@ def get_channel_details(request, channel_id):
     """
     # Get nodes and channel
     node = get_object_or_404(ContentNode, channel_main=channel_id)
+    channel = node.channel_main.filter(public=True).first()
     try:
-        if not node.channel_main.filter(public=True).exists():
+        if not channel:
             request.user.can_view_node(node)
     except PermissionDenied:
         return HttpResponseNotFound("No topic found for {}".format(channel_id))
-    data = get_node_details_cached(node)
+    # Public channels are browsed at their published version, so serve the details stored on publish
+    data = (channel and get_published_details(channel)) or get_node_details_cached(node)
     return HttpResponse(json.dumps(data))
 
 
@@ -75,6 +77,18 @@ def get_node_details(request, node_id):
     return HttpResponse(json.dumps(data))
 
 
+def get_published_details(channel):
+    """
+    Returns the details stored when the current version of the channel was published,
+    or None if the version was published before details were stored with it.
+    """
+    # Version keys are integers until published_data is reloaded from JSON
+    version_data = channel.published_data.get(str(channel.version)) or channel.published_data.get(
+        channel.version
+    )
+    return version_data and version_data.get("details")
+
+
 def get_node_details_cached(node):
     cached_data = cache.get("details_{}".format(node.node_id))
 
@@ -10,6 +10,7 @@ from rest_framework.serializers import ValidationError
 from contentcuration.models import AssessmentItem
 from contentcuration.models import ContentNode
 from contentcuration.models import File
+from contentcuration.models import record_related_changes
 from contentcuration.viewsets.base import BulkCreateMixin
 from contentcuration.viewsets.base import BulkListSerializer
 from contentcuration.viewsets.base import BulkModelSerializer
@@ -60,14 +61,23 @@ class AssessmentListSerializer(BulkListSerializer):
             all_objects = super(AssessmentListSerializer, self).create(
                 all_validated_data
             )
+            # bulk_create does not send post_save, so record the changes here
+            record_related_changes(assessment_items=all_objects)
             self.child.set_files(all_objects)
             return all_objects
 
     def update(self, queryset, all_validated_data):
         with transaction.atomic():
+            previous_items = list(queryset.only("contentnode"))
             all_objects = super(AssessmentListSerializer, self).update(
                 queryset, all_validated_data
             )
+            # bulk_update does not send post_save, so record the changes to the items
+            # for where they were as well as for where they are now
+            items = AssessmentItem.objects.filter(
+                pk__in=[item.pk for item in previous_items]
+            ).only("contentnode")
+            record_related_changes(assessment_items=previous_items + list(items))
             self.child.set_files(all_objects, all_validated_data)
             return all_objects
 
@@ -175,6 +185,7 @@ class AssessmentItemSerializer(BulkModelSerializer):
                     "Attempted to set files to an assessment item that do not have a file on the server"
                 )
             bulk_update(source_files)
+            record_related_changes(files=source_files)
 
     def create(self, validated_data):
         with transaction.atomic():
@@ -1,8 +1,13 @@
+import hashlib
+import json
 import traceback
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import Q
 from django.http import Http404
+from django.utils.http import parse_etags
+from django.utils.http import quote_etag
 from django_bulk_update.helper import bulk_update
 from django_filters.constants import EMPTY_VALUES
 from django_filters.rest_framework import FilterSet
@@ -16,6 +21,7 @@ from rest_framework.serializers import ValidationError
 from rest_framework.settings import api_settings
 from rest_framework.status import HTTP_201_CREATED
 from rest_framework.status import HTTP_204_NO_CONTENT
+from rest_framework.status import HTTP_304_NOT_MODIFIED
 from rest_framework.utils import html
 from rest_framework.utils import model_meta
 from rest_framework.viewsets import ReadOnlyModelViewSet
@@ -271,6 +277,14 @@ class BulkListSerializer(SimpleReprMixin, ListSerializer):
 
         properties_to_update = properties_to_update.intersection(concrete_fields)
 
+        # bulk_update does not call pre_save on the model fields, so explicitly
+        # update any auto_now fields to keep modification times accurate.
+        auto_now_fields = [
+            f
+            for f in self.child.Meta.model._meta.concrete_fields
+            if getattr(f, "auto_now", False)
+        ]
+
         # this method is handed a queryset that has been pre-filtered
         # to the specific instance ids in question, by `create_from_updates` on the bulk update mixin
         objects_to_update = queryset.only(*properties_to_update)
@@ -297,6 +311,8 @@ class BulkListSerializer(SimpleReprMixin, ListSerializer):
                 # do not try to run further updates on the model, as there is no
                 # object to update.
                 if instance:
+                    for field in auto_now_fields:
+                        field.pre_save(instance, False)
                     updated_objects.append(instance)
                     updated_keys.add(obj_id)
                     # Collect any registered changes from this run of the loop
@@ -307,6 +323,9 @@ class BulkListSerializer(SimpleReprMixin, ListSerializer):
                 set(all_validated_data_by_id.keys())
             )
 
+        if properties_to_update:
+            properties_to_update.update(f.name for f in auto_now_fields)
+
         bulk_update(updated_objects, update_fields=properties_to_update)
 
         return updated_objects
@@ -505,6 +524,48 @@ class ReadOnlyValuesViewset(SimpleReprMixin, ReadOnlyModelViewSet):
     def consolidate(self, items, queryset):
         return items
 
+    def get_validator(self, queryset):
+        """
+        Return a JSON serializable value that changes whenever the serialized
+        data for the queryset would change, or None if this viewset does not
+        support conditional requests.
+        This is called with the filtered queryset before `annotate_queryset`,
+        for every request, so it should be read from cached revision counters
+        rather than aggregated from the data itself.
+        """
+        return None
+
+    def get_etag(self, queryset):
+        validator = self.get_validator(queryset)
+        if validator is None:
+            return None
+        # The user is included as permission annotations can vary the data
+        # returned for the same url.
+        key = json.dumps(
+            [self.request.user.pk, self.request.get_full_path(), validator],
+            cls=DjangoJSONEncoder,
+        )
+        return quote_etag(hashlib.md5(key.encode("utf-8")).hexdigest())
+
+    def _etag_matches(self, etag):
+        if etag is None or not self.request.META.get("HTTP_IF_NONE_MATCH"):
+            return False
+        etags = parse_etags(self.request.META["HTTP_IF_NONE_MATCH"])
+        return etag in etags or "*" in etags
+
+    def _conditional_response(self, etag, data_func):
+        """
+        Only call data_func to run the full query if the client does not
+        already have an up to date copy of the data.
+        """
+        if self._etag_matches(etag):
+            response = Response(status=HTTP_304_NOT_MODIFIED)
+        else:
+            response = data_func()
+        if etag is not None:
+            response["ETag"] = etag
+        return response
+
     def _cast_queryset_to_values(self, queryset):
         queryset = self.annotate_queryset(queryset)
         return queryset.values(*self._values)
@@ -512,8 +573,7 @@ class ReadOnlyValuesViewset(SimpleReprMixin, ReadOnlyModelViewSet):
     def serialize(self, queryset):
         return self.consolidate(list(map(self._map_fields, queryset or [])), queryset)
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.prefetch_queryset(self.get_queryset()))
+    def _list_response(self, queryset):
         queryset = self._cast_queryset_to_values(queryset)
 
         page = self.paginate_queryset(queryset)
@@ -523,6 +583,13 @@ class ReadOnlyValuesViewset(SimpleReprMixin, ReadOnlyModelViewSet):
 
         return Response(self.serialize(queryset))
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.prefetch_queryset(self.get_queryset()))
+
+        return self._conditional_response(
+            self.get_etag(queryset), lambda: self._list_response(queryset)
+        )
+
     def serialize_object(self, **filter_kwargs):
         queryset = self.prefetch_queryset(self.get_queryset())
         try:
@@ -536,7 +603,13 @@ class ReadOnlyValuesViewset(SimpleReprMixin, ReadOnlyModelViewSet):
             )
 
     def retrieve(self, request, *args, **kwargs):
-        return Response(self.serialize_object())
+        queryset = self.prefetch_queryset(self.get_queryset()).filter(
+            **self._get_lookup_filter()
+        )
+
+        return self._conditional_response(
+            self.get_etag(queryset), lambda: Response(self.serialize_object())
+        )
 
 
 class CreateModelMixin(object):
@@ -34,7 +34,8 @@ from contentcuration.models import User
 from contentcuration.tasks import cache_multiple_channels_metadata_task
 from contentcuration.tasks import create_async_task
 from contentcuration.utils.cache import DEFERRED_FLAG
-from contentcuration.utils.channel import CACHE_CHANNEL_KEY
+from contentcuration.utils.cache import get_tree_revision
+from contentcuration.utils.channel import get_channel_metadata_key
 from contentcuration.viewsets.base import BulkListSerializer
 from contentcuration.viewsets.base import BulkModelSerializer
 from contentcuration.viewsets.base import ReadOnlyValuesViewset
@@ -361,6 +362,9 @@ base_channel_values = (
     "demo_server_url",
 )
 
+# Values that are added by annotate_queryset, rather than read from the channel
+annotated_channel_values = ("primary_token", "modified", "count")
+
 channel_field_map = {
     "thumbnail_url": get_thumbnail_url,
     "published": "main_tree__published",
@@ -396,6 +400,23 @@ class ChannelViewSet(ValuesViewset):
             bookmark=Exists(user_queryset.filter(bookmarked_channels=OuterRef("id"))),
         )
 
+    def get_validator(self, queryset):
+        # Everything except the values added in annotate_queryset can be read
+        # straight from the channel rows, and those annotations only change
+        # when the main tree changes, which changes its revision.
+        channels = list(
+            queryset.order_by("id").values(
+                "main_tree__tree_id",
+                *(v for v in self.values if v not in annotated_channel_values)
+            )
+        )
+        trees = [
+            (channel["main_tree__tree_id"], get_tree_revision(channel["main_tree__tree_id"]))
+            for channel in channels
+            if channel["main_tree__tree_id"] is not None
+        ]
+        return {"channels": channels, "trees": trees}
+
     def annotate_queryset(self, queryset):
         queryset = queryset.annotate(primary_token=primary_token_subquery)
         channel_main_tree_nodes = ContentNode.objects.filter(
@@ -537,15 +558,20 @@ class CatalogViewSet(ReadOnlyValuesViewset):
 class AdminChannelFilter(BaseChannelFilter):
     def filter_keywords(self, queryset, name, value):
         regex = r"^(" + "|".join(value.split(" ")) + ")$"
+        # Match the editors separately, so that their trigram indexes can be used
+        # and channels are not repeated for each matching editor
+        editor_ids = User.objects.filter(
+            (Q(first_name__iregex=regex) & Q(last_name__iregex=regex))
+            | Q(email__iregex=regex)
+        ).values("id")
+        editor_channel_ids = Channel.editors.through.objects.filter(
+            user_id__in=editor_ids
+        ).values("channel_id")
         return queryset.annotate(primary_token=primary_token_subquery,).filter(
-            Q(name__icontains=value)
+            Q(name__ilike=value)
             | Q(pk__istartswith=value)
             | Q(primary_token=value.replace("-", ""))
-            | (
-                Q(editors__first_name__iregex=regex)
-                & Q(editors__last_name__iregex=regex)
-            )
-            | Q(editors__email__iregex=regex)
+            | Q(pk__in=editor_channel_ids)
         )
 
 
@@ -579,6 +605,11 @@ class AdminChannelViewSet(ChannelViewSet):
         queryset = super(AdminChannelViewSet, self).annotate_queryset(queryset)
         return queryset
 
+    def get_validator(self, queryset):
+        # consolidate adds asynchronously calculated metadata from the cache,
+        # which the database can't tell us anything about
+        return None
+
     def consolidate(self, items, queryset):
         if items:
             cache_multiple_channels_metadata_task.delay(items)
@@ -600,7 +631,7 @@ class AdminChannelViewSet(ChannelViewSet):
         If there's not a key for the channel in the cache
         it triggers an async task to calculate it
         """
-        key = CACHE_CHANNEL_KEY.format(channel_id)
+        key = get_channel_metadata_key(channel_id)
         cached_info = cache.get(key)
         # cache_channel_metadata_task.delay(key, channel_id, tree_id)
         if cached_info is None:
@@ -619,7 +650,7 @@ class AdminChannelViewSet(ChannelViewSet):
         does not trigger a new task to update it if
         there's nothing in the cache
         """
-        key = CACHE_CHANNEL_KEY.format(channel_id)
+        key = get_channel_metadata_key(channel_id)
         cached_info = cache.get(key)
         metadata = {
             "size": DEFERRED_FLAG,
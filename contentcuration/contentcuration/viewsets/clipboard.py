@@ -1,6 +1,4 @@
-from django.db.models import F
 from django.db.models import OuterRef
-from django.db.models import Subquery
 from django_filters.rest_framework import DjangoFilterBackend
 from le_utils.constants import content_kinds
 from rest_framework.permissions import IsAuthenticated
@@ -8,13 +6,13 @@ from rest_framework.serializers import BooleanField
 from rest_framework.serializers import DictField
 from rest_framework.serializers import ValidationError
 
-from contentcuration.models import Channel
 from contentcuration.models import ContentNode
 from contentcuration.models import User
 from contentcuration.viewsets.base import BulkListSerializer
 from contentcuration.viewsets.base import BulkModelSerializer
 from contentcuration.viewsets.base import RequiredFilterSet
 from contentcuration.viewsets.base import ValuesViewset
+from contentcuration.viewsets.common import descendant_count
 from contentcuration.viewsets.common import JSONFieldDictSerializer
 from contentcuration.viewsets.common import SQCount
 from contentcuration.viewsets.common import UUIDRegexField
@@ -68,13 +66,7 @@ class ClipboardSerializer(BulkModelSerializer):
                     "Trying to create a clipboard node when there is no user"
                 )
         try:
-            channel_query = Channel.objects.filter(
-                main_tree__tree_id=OuterRef("tree_id")
-            )
-            ContentNode.objects.all().annotate(
-                # Annotate channel id
-                channel_id=Subquery(channel_query.values_list("id", flat=True)[:1])
-            ).get(
+            ContentNode._annotate_channel_id(ContentNode.objects.all()).get(
                 node_id=validated_data["source_node_id"],
                 channel_id=validated_data["source_channel_id"],
             )
@@ -137,6 +129,6 @@ class ClipboardViewSet(ValuesViewset):
             rght__lt=OuterRef("rght"),
         ).exclude(kind_id=content_kinds.TOPIC)
         return queryset.annotate(
-            total_count=(F("rght") - F("lft") - 1) / 2,
+            total_count=descendant_count(),
             resource_count=SQCount(descendant_resources, field="content_id"),
         )
@@ -1,11 +1,14 @@
 import re
 
+from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
 from django.contrib.postgres.fields import ArrayField
 from django.core.paginator import Paginator
 from django.db.models import CharField
+from django.db.models import F
 from django.db.models import IntegerField
 from django.db.models import Manager
+from django.db.models import OuterRef
 from django.db.models import Subquery
 from django.db.models.query import QuerySet
 from django.forms.fields import UUIDField
@@ -23,6 +26,7 @@ from rest_framework.serializers import RegexField
 from rest_framework.serializers import ValidationError
 from rest_framework.utils import html
 
+from contentcuration.models import ContentNode
 from contentcuration.models import DEFAULT_CONTENT_DEFAULTS
 from contentcuration.models import License
 
@@ -81,6 +85,24 @@ class SQCount(AggregateSubquery):
     output_field = IntegerField()
 
 
+def descendant_count():
+    """
+    An expression for the number of descendants of each ContentNode in a queryset, which
+    can only be worked out from lft and rght when trees are numbered densely, so descendants
+    are counted instead when there may be gaps between them, see settings.MPTT_SPARSE_GAP.
+    """
+    if not settings.MPTT_SPARSE_GAP:
+        return (F("rght") - F("lft") - 1) / 2
+    return SQCount(
+        ContentNode.objects.filter(
+            tree_id=OuterRef("tree_id"),
+            lft__gt=OuterRef("lft"),
+            rght__lt=OuterRef("rght"),
+        ).order_by(),
+        field="id",
+    )
+
+
 class SQSum(AggregateSubquery):
     # Include ALIAS at the end to support Postgres
     template = "(SELECT SUM(%(field)s) FROM (%(subquery)s) AS %(field)s__sum)"
@@ -1,4 +1,6 @@
 import json
+from collections import defaultdict
+from collections import OrderedDict
 from functools import reduce
 
 from django.conf import settings
@@ -8,6 +10,8 @@ from django.db.models import F
 from django.db.models import OuterRef
 from django.db.models import Q
 from django.db.models import Subquery
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 from django.http import Http404
 from django_filters.rest_framework import CharFilter
 from django_filters.rest_framework import DjangoFilterBackend
@@ -24,19 +28,29 @@ from rest_framework.serializers import IntegerField
 from rest_framework.serializers import ValidationError
 from rest_framework.viewsets import ViewSet
 
+from contentcuration.db.models.expressions import BooleanComparison
+from contentcuration.db.models.functions import Unnest
+from contentcuration.db.models.manager import aggregate_delta
+from contentcuration.db.models.manager import AGGREGATE_SOURCE_FIELDS
+from contentcuration.db.models.manager import sum_aggregates
 from contentcuration.models import AssessmentItem
 from contentcuration.models import Channel
+from contentcuration.models import ChannelTree
 from contentcuration.models import ContentNode
 from contentcuration.models import ContentTag
 from contentcuration.models import File
 from contentcuration.models import generate_storage_url
 from contentcuration.models import PrerequisiteContentRelationship
 from contentcuration.tasks import create_async_task
+from contentcuration.utils.cache import bump_tree_revisions
+from contentcuration.utils.cache import get_tree_revision
+from contentcuration.utils.cache import get_user_permissions_generation
 from contentcuration.viewsets.base import BulkListSerializer
 from contentcuration.viewsets.base import BulkModelSerializer
 from contentcuration.viewsets.base import BulkUpdateMixin
 from contentcuration.viewsets.base import RequiredFilterSet
 from contentcuration.viewsets.base import ValuesViewset
+from contentcuration.viewsets.common import descendant_count
 from contentcuration.viewsets.common import DotPathValueMixin
 from contentcuration.viewsets.common import JSONFieldDictSerializer
 from contentcuration.viewsets.common import NotNullMapArrayAgg
@@ -51,9 +65,6 @@ from contentcuration.viewsets.sync.utils import generate_delete_event
 from contentcuration.viewsets.sync.utils import generate_update_event
 
 
-channel_query = Channel.objects.filter(main_tree__tree_id=OuterRef("tree_id"))
-
-
 _valid_positions = {"first-child", "last-child", "left", "right"}
 
 
@@ -85,12 +96,12 @@ class ContentNodeFilter(RequiredFilterSet):
 
     def filter_ancestors_of(self, queryset, name, value):
         # For simplicity include the target node in the query
-        target_node_query = ContentNode.objects.filter(pk=value)
-        return queryset.filter(
-            tree_id=target_node_query.values_list("tree_id", flat=True)[:1],
-            lft__lte=target_node_query.values_list("lft", flat=True)[:1],
-            rght__gte=target_node_query.values_list("rght", flat=True)[:1],
+        ancestor_ids = (
+            ContentNode.objects.filter(pk=value)
+            .annotate(ancestor_id=Unnest("path"))
+            .values("ancestor_id")
         )
+        return queryset.filter(Q(pk=value) | Q(pk__in=ancestor_ids))
 
     def filter__node_id_channel_id(self, queryset, name, value):
         query = Q()
@@ -164,11 +175,38 @@ class ContentNodeListSerializer(BulkListSerializer):
                     tags_by_id[obj["id"]] = tags
         return tags_by_id
 
+    def _aggregate_source_values(self, node_ids):
+        return {
+            values["id"]: values
+            for values in ContentNode.objects.filter(pk__in=node_ids).values(
+                "id", "tree_id", "path", *AGGREGATE_SOURCE_FIELDS
+            )
+        }
+
     def update(self, queryset, all_validated_data):
         tags = self.gather_tags(all_validated_data)
+        node_ids = [self.child.id_value_lookup(obj) for obj in all_validated_data]
+        previous_values = self._aggregate_source_values(node_ids)
         all_objects = super(ContentNodeListSerializer, self).update(
             queryset, all_validated_data
         )
+        current_values = self._aggregate_source_values(node_ids)
+        # Bulk updates do not call save, so change the revisions of the trees
+        # and update the descendant counts of ancestors here
+        bump_tree_revisions(*set(values["tree_id"] for values in current_values.values()))
+        ancestor_deltas = defaultdict(list)
+        for node_id, values in current_values.items():
+            if node_id not in previous_values:
+                continue
+            delta = aggregate_delta(previous_values[node_id], values)
+            for ancestor_id in values["path"] or []:
+                ancestor_deltas[ancestor_id].append(delta)
+        ContentNode.objects.add_aggregate_deltas(
+            {
+                ancestor_id: sum_aggregates(*deltas)
+                for ancestor_id, deltas in ancestor_deltas.items()
+            }
+        )
         if tags:
             set_tags(tags)
         return all_objects
@@ -496,9 +534,7 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
     }
 
     def _annotate_channel_id(self, queryset):
-        return queryset.annotate(
-            channel_id=Subquery(channel_query.values_list("id", flat=True)[:1])
-        )
+        return ContentNode._annotate_channel_id(queryset)
 
     def get_queryset(self):
         queryset = super(ContentNodeViewSet, self).get_queryset()
@@ -508,6 +544,19 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
         queryset = super(ContentNodeViewSet, self).get_edit_queryset()
         return self._annotate_channel_id(queryset)
 
+    def get_validator(self, queryset):
+        # Descendant counts and flags mean that the data for a node can change
+        # whenever anything in its tree changes, so validate against the
+        # revision of every tree that the requested nodes belong to, and
+        # the user's permissions, which determine which nodes are requested.
+        tree_ids = sorted(
+            queryset.order_by().values_list("tree_id", flat=True).distinct()
+        )
+        return {
+            "trees": [(tree_id, get_tree_revision(tree_id)) for tree_id in tree_ids],
+            "permissions": get_user_permissions_generation(self.request.user.pk),
+        }
+
     @detail_route(methods=["get"])
     def requisites(self, request, pk=None):
         if not pk:
@@ -540,7 +589,7 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
         )
 
     def annotate_queryset(self, queryset):
-        queryset = queryset.annotate(total_count=(F("rght") - F("lft") - 1) / 2)
+        queryset = queryset.annotate(total_count=descendant_count())
 
         descendant_resources = (
             ContentNode.objects.filter(
@@ -578,6 +627,11 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
             node_id=OuterRef("original_source_node_id")
         ).filter(node_id=F("original_source_node_id"))
 
+        # Look up the root of channel trees by tree_id, only falling back to
+        # finding the root node for trees that do not belong to a channel
+        channel_tree_root_id = ChannelTree.objects.filter(
+            tree_id=OuterRef("tree_id")
+        ).values_list("root_id", flat=True)[:1]
         root_id = ContentNode.objects.filter(
             tree_id=OuterRef("tree_id"), parent__isnull=True
         ).values_list("id", flat=True)[:1]
@@ -588,18 +642,32 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
             .distinct()
         )
 
+        # Use the stored descendant counts, only counting the descendants
+        # directly for nodes that do not have any counts stored yet
         queryset = queryset.annotate(
-            resource_count=SQCount(descendant_resources, field="id"),
-            coach_count=SQCount(
-                descendant_resources.filter(role_visibility=roles.COACH), field="id",
+            resource_count=Coalesce(
+                F("aggregates__resource_count"),
+                SQCount(descendant_resources, field="id"),
+            ),
+            coach_count=Coalesce(
+                F("aggregates__coach_count"),
+                SQCount(
+                    descendant_resources.filter(role_visibility=roles.COACH),
+                    field="id",
+                ),
             ),
             assessment_item_count=SQCount(assessment_items, field="assessment_id"),
-            error_count=SQCount(descendant_errors, field="id"),
-            has_updated_descendants=Exists(
-                changed_descendants.filter(published=True).values("id")
+            error_count=Coalesce(
+                F("aggregates__error_count"),
+                SQCount(descendant_errors, field="id"),
+            ),
+            has_updated_descendants=Coalesce(
+                BooleanComparison(F("aggregates__updated_count"), ">", Value(0)),
+                Exists(changed_descendants.filter(published=True).values("id")),
             ),
-            has_new_descendants=Exists(
-                changed_descendants.filter(published=False).values("id")
+            has_new_descendants=Coalesce(
+                BooleanComparison(F("aggregates__new_count"), ">", Value(0)),
+                Exists(changed_descendants.filter(published=False).values("id")),
             ),
             thumbnail_checksum=Subquery(thumbnails.values("checksum")[:1]),
             thumbnail_extension=Subquery(
@@ -611,21 +679,28 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
             has_children=Exists(
                 ContentNode.objects.filter(parent=OuterRef("id")).values("pk")
             ),
-            root_id=Subquery(root_id),
+            root_id=Coalesce(Subquery(channel_tree_root_id), Subquery(root_id)),
         )
         queryset = queryset.annotate(content_tags=NotNullMapArrayAgg("tags__tag_name"))
 
         return queryset
 
-    def validate_targeting_args(self, target, position):
+    def validate_targeting_args(self, target, position, nodes=None):
+        """
+        Returns the target node and position, where nodes is an optional
+        lookup of already fetched editable nodes by id to get the target from.
+        """
         position = position or "last-child"
         if target is None:
             raise ValidationError("A target must be specified")
         try:
-            target = self.get_edit_queryset().get(pk=target)
-        except ContentNode.DoesNotExist:
+            if nodes is not None:
+                target = nodes[target]
+            else:
+                target = self.get_edit_queryset().get(pk=target)
+        except (ContentNode.DoesNotExist, KeyError):
             raise ValidationError("Target: {} does not exist".format(target))
-        except ValueError:
+        except (ValueError, TypeError):
             raise ValidationError("Invalid target specified: {}".format(target))
         if position not in _valid_positions:
             raise ValidationError(
@@ -635,57 +710,96 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
             )
         return target, position
 
-    def move_from_changes(self, changes):
+    def _validate_moves(self, changes):
+        # Fetch all the nodes and targets at once, so that a node that is also
+        # the target of another move is the same instance for both moves.
+        ids = set()
+        for move in changes:
+            ids.add(move["key"])
+            if isinstance(move.get("target"), str):
+                ids.add(move["target"])
+        nodes = {node.id: node for node in self.get_edit_queryset().filter(pk__in=ids)}
+
         errors = []
-        changes_to_return = []
+        valid_changes = []
+        valid_moves = []
         for move in changes:
             # Move change will have key, must also have target property
             # optionally can include the desired position.
-            move_error, move_change = self.move(
-                move["key"], target=move.get("target"), position=move.get("position")
-            )
-            if move_error:
-                move.update({"errors": [move_error]})
+            try:
+                if move["key"] not in nodes:
+                    raise ValidationError("Specified node does not exist")
+                target, position = self.validate_targeting_args(
+                    move.get("target"), move.get("position"), nodes=nodes
+                )
+                valid_changes.append(move)
+                valid_moves.append((nodes[move["key"]], target, position))
+            except ValidationError as e:
+                move.update({"errors": [str(e)]})
                 errors.append(move)
-            if move_change:
-                changes_to_return.append(move_change)
-        return errors, changes_to_return
+        return errors, valid_changes, valid_moves
 
-    def move(self, pk, target=None, position=None):
-        try:
-            contentnode = self.get_edit_queryset().get(pk=pk)
-        except ContentNode.DoesNotExist:
-            error = ValidationError("Specified node does not exist")
-            return str(error), None
+    def move_from_changes(self, changes):
+        errors, valid_changes, valid_moves = self._validate_moves(changes)
 
-        try:
-            target, position = self.validate_targeting_args(target, position)
-            try:
-                contentnode.move_to(target, position)
-            except ValueError:
-                raise ValidationError(
+        # Apply all the valid moves in a single lock of the affected trees
+        move_errors = ContentNode.objects.move_nodes(valid_moves)
+        for move, (_, _, position), move_error in zip(valid_changes, valid_moves, move_errors):
+            if isinstance(move_error, ValueError):
+                move_error = ValidationError(
                     "Invalid position argument specified: {}".format(position)
                 )
-
-            return (
-                None,
-                None,
-            )
-        except ValidationError as e:
-            return str(e), None
+            if move_error:
+                move.update({"errors": [str(move_error)]})
+                errors.append(move)
+        return errors, []
 
     def copy_from_changes(self, changes):
         errors = []
         changes_to_return = []
+        copies_by_channel = OrderedDict()
         for copy in changes:
             # Copy change will have key, must also have other attributes, defined in `copy`
             # Just pass as keyword arguments here to let copy do the validation
-            copy_errors, copy_changes = self.copy(copy["key"], **copy)
+            copy_errors, copy_changes, task_args = self.copy(copy["key"], **copy)
             if copy_errors:
                 copy.update({"errors": copy_errors})
                 errors.append(copy)
             if copy_changes:
                 changes_to_return.extend(copy_changes)
+            if task_args:
+                copies_by_channel.setdefault(task_args["channel_id"], []).append(
+                    task_args
+                )
+
+        # Run all the copies into a channel in a single task, so that they share
+        # progress tracking and do not contend with each other for tree locks
+        for channel_id, copies in copies_by_channel.items():
+            if len(copies) == 1:
+                task, task_info = create_async_task(
+                    "duplicate-nodes", self.request.user, **copies[0]
+                )
+            else:
+                task, task_info = create_async_task(
+                    "duplicate-nodes-batch",
+                    self.request.user,
+                    user_id=self.request.user.id,
+                    channel_id=channel_id,
+                    copies=[
+                        {
+                            key: value
+                            for key, value in task_args.items()
+                            if key not in ("user_id", "channel_id")
+                        }
+                        for task_args in copies
+                    ],
+                )
+            changes_to_return.extend(
+                generate_update_event(
+                    task_args["pk"], CONTENTNODE, {TASK_ID: task_info.task_id}
+                )
+                for task_args in copies
+            )
         return errors, changes_to_return
 
     def copy(
@@ -698,23 +812,27 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
         excluded_descendants=None,
         **kwargs
     ):
+        """
+        Validates a copy change, returning a tuple of any error, any changes to return
+        and the arguments for the task that will perform the copy.
+        """
         try:
             target, position = self.validate_targeting_args(target, position)
         except ValidationError as e:
-            return str(e), None
+            return str(e), None, None
 
         try:
             source = self.get_queryset().get(pk=from_key)
         except ContentNode.DoesNotExist:
             error = ValidationError("Copy source node does not exist")
-            return str(error), [generate_delete_event(pk, CONTENTNODE)]
+            return str(error), [generate_delete_event(pk, CONTENTNODE)], None
 
         # Affected channel for the copy is the target's channel
         channel_id = target.channel_id
 
         if ContentNode.objects.filter(pk=pk).exists():
             error = ValidationError("Copy pk already exists")
-            return str(error), None
+            return str(error), None, None
 
         task_args = {
             "user_id": self.request.user.id,
@@ -727,11 +845,4 @@ class ContentNodeViewSet(BulkUpdateMixin, ValuesViewset):
             "position": position,
         }
 
-        task, task_info = create_async_task(
-            "duplicate-nodes", self.request.user, **task_args
-        )
-
-        return (
-            None,
-            [generate_update_event(pk, CONTENTNODE, {TASK_ID: task_info.task_id})],
-        )
+        return None, None, task_args
@@ -12,6 +12,7 @@ from contentcuration.models import ContentNode
 from contentcuration.models import File
 from contentcuration.models import generate_object_storage_name
 from contentcuration.models import generate_storage_url
+from contentcuration.models import record_related_changes
 from contentcuration.utils.storage_common import get_presigned_upload_url
 from contentcuration.viewsets.base import BulkDeleteMixin
 from contentcuration.viewsets.base import BulkListSerializer
@@ -40,6 +41,18 @@ class FileFilter(RequiredFilterSet):
         )
 
 
+class FileListSerializer(BulkListSerializer):
+    def update(self, queryset, all_validated_data):
+        # bulk_update does not send post_save, so record the changes to the files
+        # for where they were as well as for where they are now
+        fields = ("contentnode", "assessment_item", "uploaded_by", "checksum")
+        previous_files = list(queryset.only(*fields))
+        all_objects = super(FileListSerializer, self).update(queryset, all_validated_data)
+        files = File.objects.filter(pk__in=[f.pk for f in previous_files]).only(*fields)
+        record_related_changes(files=previous_files + list(files))
+        return all_objects
+
+
 class FileSerializer(BulkModelSerializer):
     contentnode = UserFilteredPrimaryKeyRelatedField(
         queryset=ContentNode.objects.all(), required=False
@@ -57,7 +70,7 @@ class FileSerializer(BulkModelSerializer):
             "assessment_item",
             "preset",
         )
-        list_serializer_class = BulkListSerializer
+        list_serializer_class = FileListSerializer
 
 
 def retrieve_storage_url(item):
@@ -15,6 +15,10 @@ from contentcuration.viewsets.base import ReadOnlyValuesViewset
 from contentcuration.viewsets.base import RequiredFilterSet
 
 
+# Task statuses that are recorded in the database once a task has finished
+FINISHED_STATES = ("SUCCESS", "FAILURE")
+
+
 class TaskFilter(RequiredFilterSet):
     channel = UUIDFilter(method="filter_channel")
 
@@ -78,6 +82,14 @@ class TaskViewSet(ReadOnlyValuesViewset, DestroyModelMixin):
     def get_edit_queryset(self):
         return Task.objects.filter(user=self.request.user)
 
+    def get_validator(self, queryset):
+        tasks = list(queryset.order_by("task_id").values_list("task_id", "status"))
+        # Progress of running tasks is read from Celery in consolidate, so only
+        # tasks that have finished have data that the database can vouch for.
+        if any(status not in FINISHED_STATES for _, status in tasks):
+            return None
+        return tasks
+
     def consolidate(self, items, queryset):
         if not settings.CELERY_TASK_ALWAYS_EAGER:
             for item in items:
@@ -26,8 +26,11 @@ from rest_framework.response import Response
 from rest_framework.serializers import ValidationError
 
 from contentcuration.models import Channel
+from contentcuration.models import StorageLedger
 from contentcuration.models import User
 from contentcuration.tasks import cache_multiple_users_metadata_task
+from contentcuration.utils.cache import bump_channel_generations
+from contentcuration.utils.cache import bump_user_permissions_generations
 from contentcuration.utils.cache import DEFERRED_FLAG
 from contentcuration.utils.user import CACHE_USER_KEY
 from contentcuration.viewsets.base import BulkListSerializer
@@ -209,6 +212,12 @@ class ChannelUserViewSet(ReadOnlyValuesViewset):
                     Channel.editors.through.objects.filter(q).delete()
                 elif table == VIEWER_M2M:
                     Channel.viewers.through.objects.filter(q).delete()
+            # Writing to the through tables directly does not send m2m_changed,
+            # so do what its receivers would have done here
+            if table == EDITOR_M2M:
+                StorageLedger.objects.reconcile(set(d["user_id"] for d in data))
+            bump_channel_generations(*set(d["channel_id"] for d in data))
+            bump_user_permissions_generations(*set(d["user_id"] for d in data))
 
     def _check_permissions(self, changes):
         # Filter the passed in channels
@@ -275,12 +284,19 @@ class AdminUserFilter(FilterSet):
 
     def filter_keywords(self, queryset, name, value):
         regex = r"^(" + "|".join(value.split(" ")) + ")$"
+        # Match the channels separately, so that their trigram indexes can be used
+        # and users are not repeated for each matching channel
+        channel_ids = Channel.objects.filter(
+            Q(name__iregex=regex) | Q(id__iregex=regex)
+        ).values("id")
+        editor_ids = Channel.editors.through.objects.filter(
+            channel_id__in=channel_ids
+        ).values("user_id")
         return queryset.filter(
-            Q(first_name__icontains=value)
-            | Q(last_name__icontains=value)
-            | Q(email__icontains=value)
-            | Q(editable_channels__name__iregex=regex)
-            | Q(editable_channels__id__iregex=regex)
+            Q(first_name__ilike=value)
+            | Q(last_name__ilike=value)
+            | Q(email__ilike=value)
+            | Q(pk__in=editor_ids)
         )
 
     def filter_is_active(self, queryset, name, value):
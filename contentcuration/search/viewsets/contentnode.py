@@ -1,17 +1,21 @@
 import hashlib
 import re
 
+from django.contrib.postgres.search import SearchQuery
+from django.contrib.postgres.search import SearchRank
 from django.core.cache import cache
 from django.core.paginator import InvalidPage
 from django.db.models import Case
 from django.db.models import CharField
 from django.db.models import F
+from django.db.models import Func
 from django.db.models import IntegerField
 from django.db.models import OuterRef
 from django.db.models import Q
 from django.db.models import Subquery
 from django.db.models import Value
 from django.db.models import When
+from django.utils.translation import get_language
 from django_filters.rest_framework import BooleanFilter
 from django_filters.rest_framework import CharFilter
 from le_utils.constants import content_kinds
@@ -111,30 +115,41 @@ class ContentNodeFilter(RequiredFilterSet):
     assessments = BooleanFilter(method="filter_assessments")
     created_after = CharFilter(method="filter_created_after")
 
+    def get_search_config(self):
+        """
+        Returns the text search configuration to parse keywords with, for the language
+        being filtered on if there is only one, or otherwise the language of the user.
+        """
+        languages = (self.data.get("languages") or "").split(",")
+        language = languages[0] if len(languages) == 1 and languages[0] else get_language()
+        return Func(Value(language), function="contentcuration_search_config")
+
     def filter_keywords(self, queryset, name, value):
-        filter_query = Q(title__icontains=value) | Q(description__icontains=value)
-        tags_node_ids = ContentNode.tags.through.objects.filter(
-            contenttag__tag_name__icontains=value
-        ).values_list("contentnode_id", flat=True)[:250]
+        # Match the keywords both as they are, and stemmed for the language being searched in,
+        # as each node's search vector is parsed with the configuration for its own language
+        search_query = SearchQuery(value, config="simple") | SearchQuery(
+            value, config=self.get_search_config()
+        )
+        filter_query = Q(search_vector=search_query)
         # Check if we have a Kolibri node id or ids and add them to the search if so.
         # Add to, rather than replace, the filters so that we never misinterpret a search term as a UUID.
-        # node_ids = uuid_re.findall(value) + list(tags_node_ids)
         node_ids = uuid_re.findall(value)
         for node_id in node_ids:
             # check for the major ID types
             filter_query |= Q(node_id=node_id)
             filter_query |= Q(content_id=node_id)
             filter_query |= Q(id=node_id)
-        for node_id in tags_node_ids:
-            filter_query |= Q(id=node_id)
 
-        return queryset.filter(filter_query)
+        # Annotate the rank so that results can be ordered by relevance
+        return queryset.filter(filter_query).annotate(
+            rank=SearchRank(F("search_vector"), search_query)
+        )
 
     def filter_author(self, queryset, name, value):
         return queryset.filter(
-            Q(author__icontains=value)
-            | Q(aggregator__icontains=value)
-            | Q(provider__icontains=value)
+            Q(author__ilike=value)
+            | Q(aggregator__ilike=value)
+            | Q(provider__ilike=value)
         )
 
     def filter_languages(self, queryset, name, value):
@@ -194,7 +209,11 @@ class SearchContentNodeViewSet(ContentNodeViewSet):
         ids = [result["id"] for result in page_results]
         queryset = self._annotate_channel_id(ContentNode.objects.filter(id__in=ids))
         queryset = self.complete_annotations(queryset)
-        return list(queryset.values())
+        results = {result["id"]: result for result in queryset.values()}
+        for result in results.values():
+            result.pop("search_vector", None)
+        # Keep the order of the page, which is by relevance when searching by keywords
+        return [results[pk] for pk in ids if pk in results]
 
     def get_accessible_nodes_queryset(self):
         # jayoshih: May the force be with you, optimizations team...
@@ -230,11 +249,32 @@ class SearchContentNodeViewSet(ContentNodeViewSet):
     def get_queryset(self):
         return self.get_accessible_nodes_queryset()
 
+    def use_canonical_nodes(self):
+        """
+        Whether the accessible nodes are exactly the content of the public channels,
+        whose canonical nodes and locations are kept in CanonicalContentNode
+        """
+        if self.request.query_params.get("channel_list", "public") != "public":
+            return False
+        if self.request.query_params.get("channels"):
+            return False
+        exclude_channel = self.request.query_params.get("exclude_channel")
+        return not (
+            exclude_channel
+            and Channel.objects.filter(pk=exclude_channel, public=True).exists()
+        )
+
     def annotate_queryset(self, queryset):
         """
         1. Do a distinct by 'content_id,' using the original node if possible
         2. Annotate lists of content node and channel pks
         """
+        if self.use_canonical_nodes():
+            queryset = queryset.filter(canonical_content__isnull=False).order_by()
+            if "rank" in queryset.query.annotations:
+                queryset = queryset.order_by("-rank", "id")
+            return queryset
+
         # Get accessible content nodes that match the content id
         content_id_query = self.get_accessible_nodes_queryset().filter(
             content_id=OuterRef("content_id")
@@ -255,6 +295,8 @@ class SearchContentNodeViewSet(ContentNodeViewSet):
         queryset = queryset.filter(
             pk__in=Subquery(deduped_content_query.values_list("id", flat=True)[:1])
         ).order_by()
+        if "rank" in queryset.query.annotations:
+            queryset = queryset.order_by("-rank", "id")
         return queryset
 
     def complete_annotations(self, queryset):
@@ -272,11 +314,15 @@ class SearchContentNodeViewSet(ContentNodeViewSet):
             .values("id", "role_visibility", "changed")
             .order_by()
         )
-        content_id_query = self.get_accessible_nodes_queryset().filter(
-            content_id=OuterRef("content_id")
-        )
+        if self.use_canonical_nodes():
+            location_ids = F("canonical_content__location_ids")
+        else:
+            content_id_query = self.get_accessible_nodes_queryset().filter(
+                content_id=OuterRef("content_id")
+            )
+            location_ids = SQArrayAgg(content_id_query, field="id")
         queryset = queryset.annotate(
-            location_ids=SQArrayAgg(content_id_query, field="id"),
+            location_ids=location_ids,
             resource_count=SQCount(descendant_resources, field="id"),
             thumbnail_checksum=Subquery(thumbnails.values("checksum")[:1]),
             thumbnail_extension=Subquery(